@@ -38,12 +38,17 @@ def choose_save_folder():
             print(f"Invalid path or cannot create folder: {e}. Try again.")
 
 # ---------- Name parsing ----------
-NAME_PATTERNS = [
-    r"Patient\s+([A-Z][a-zA-Z'`-]+(?:\s+[A-Z][a-zA-Z'`-]+)+)\s*,\s*MRN\b",
-    r"Patient\s*:\s*([A-Z][a-zA-Z'`-]+(?:\s+[A-Z][a-zA-Z'`-]+)+)\b",
-    r"Patient\s+([A-Z][a-zA-Z'`-]+(?:\s+[A-Z][a-zA-Z'`-]+)+)\b",
-    r"\bName\s*:\s*([A-Z][a-zA-Z'`-]+(?:\s+[A-Z][a-zA-Z'`-]+)+)\b",
-]
+# Names are bounded (2-5 words of up to 40 chars, short gaps) so a failed match
+# backtracks over a constant window instead of the rest of the note; the name
+# is expected in the header, so only the first NAME_SCAN_CHARS are searched.
+_NAME = r"([A-Z][a-zA-Z'`-]{1,40}(?:\s{1,4}[A-Z][a-zA-Z'`-]{1,40}){1,4})"
+NAME_PATTERNS = [re.compile(p) for p in (
+    r"Patient\s{1,4}" + _NAME + r"\s{0,4},\s{0,4}MRN\b",
+    r"Patient\s{0,4}:\s{0,4}" + _NAME + r"\b",
+    r"Patient\s{1,4}" + _NAME + r"\b",
+    r"\bName\s{0,4}:\s{0,4}" + _NAME + r"\b",
+)]
+NAME_SCAN_CHARS = 20000
 INVALID_FS_CHARS = r'<>:"/\|?*'
 
 def sanitize_filename_component(s: str) -> str:
@@ -54,8 +59,9 @@ def sanitize_filename_component(s: str) -> str:
     return s or "UNKNOWN"
 
 def try_extract_patient_name(text: str) -> str:
+    head = text[:NAME_SCAN_CHARS]
     for pat in NAME_PATTERNS:
-        m = re.search(pat, text)
+        m = pat.search(head)
         if m:
             return sanitize_filename_component(m.group(1))
     return "UNKNOWN"
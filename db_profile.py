@@ -0,0 +1,250 @@
+"""
+DB call instrumentation: per-statement latency, rows returned and call counts,
+plus sampled EXPLAIN (ANALYZE, BUFFERS) for slow statements.
+
+Off by default. With TITAN_DB_PROFILE unset and no observers registered the
+cursor factory hands back the plain cursor class, so there is no per-call
+overhead. Observers (add_observer; metrics.start_from_env() registers one when
+a metrics exporter is configured) receive every timed call whether or not the
+profile report is enabled.
+
+ENV:
+  TITAN_DB_PROFILE=1            enable timing
+  TITAN_DB_EXPLAIN_MS=250       EXPLAIN (ANALYZE, BUFFERS) read-only SELECTs slower than this (0/unset = never)
+  TITAN_DB_EXPLAIN_MAX=3        plans kept per statement
+  TITAN_DB_PROFILE_REPORT=path  summary written at exit (default: Output/db_profile.txt)
+
+USAGE:
+  cur = conn.cursor(cursor_factory=profiled_cursor(RealDictCursor))
+  run_query = profiled(run_query)
+"""
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional
+import atexit
+import os
+import re
+import threading
+import time
+
+ENABLED = os.environ.get("TITAN_DB_PROFILE", "") not in ("", "0")
+EXPLAIN_MS = float(os.environ.get("TITAN_DB_EXPLAIN_MS") or 0)
+EXPLAIN_MAX = int(os.environ.get("TITAN_DB_EXPLAIN_MAX") or 3)
+REPORT_PATH = os.environ.get("TITAN_DB_PROFILE_REPORT") or os.path.join(os.getcwd(), "Output", "db_profile.txt")
+
+_lock = threading.Lock()
+_stats: Dict[str, "_Stat"] = {}
+# fn(sql_key, elapsed_ms, rows, error)
+_observers: List[Callable[[str, float, int, bool], None]] = []
+
+
+def add_observer(fn: Callable[[str, float, int, bool], None]) -> None:
+    if fn not in _observers:
+        _observers.append(fn)
+
+
+def _active() -> bool:
+    return ENABLED or bool(_observers)
+
+
+def _notify(key: str, elapsed_ms: float, rows: int, error: bool) -> None:
+    for fn in _observers:
+        try:
+            fn(key, elapsed_ms, rows, error)
+        except Exception:  # an observer must never break the caller
+            pass
+
+
+class _Stat:
+    __slots__ = ("calls", "total_ms", "max_ms", "rows", "plans")
+
+    def __init__(self):
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.plans: List[str] = []
+
+
+def _text(sql: Any) -> str:
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    return re.sub(r"\s+", " ", str(sql)).strip()
+
+
+def _key(sql: Any) -> str:
+    return _text(sql)[:500]
+
+
+# EXPLAIN ANALYZE executes the statement: a data-modifying CTE would run twice
+# and a locking read would re-take its row locks
+_WRITES = re.compile(r"(?i)\b(?:insert|update|delete|merge)\b|\bfor\s+(?:no\s+key\s+|key\s+)?(?:update|share)\b")
+
+
+def record(sql: Any, elapsed_ms: float, rows: int, error: bool = False) -> None:
+    key = _key(sql)
+    _notify(key, elapsed_ms, rows, error)
+    if not ENABLED or error:
+        return
+    with _lock:
+        st = _stats.get(key)
+        if st is None:
+            st = _stats[key] = _Stat()
+        st.calls += 1
+        st.total_ms += elapsed_ms
+        st.rows += max(rows, 0)
+        if elapsed_ms > st.max_ms:
+            st.max_ms = elapsed_ms
+
+
+def _wants_plan(query: Any) -> bool:
+    if not EXPLAIN_MS:
+        return False
+    text = _text(query)
+    head = text[:10].lower()
+    if not (head.startswith("select") or head.startswith("with")) or _WRITES.search(text):
+        return False  # only plain reads are re-run
+    key = text[:500]
+    with _lock:
+        st = _stats.get(key)
+        return st is not None and len(st.plans) < EXPLAIN_MAX
+
+
+def _explain(conn, query: Any, vars: Any, elapsed_ms: float) -> None:
+    import psycopg2.extensions
+    key = _key(query)
+    # a failed EXPLAIN must not leave the caller's transaction aborted
+    savepoint = not conn.autocommit
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+            if savepoint:
+                cur.execute("SAVEPOINT titan_db_profile")
+            try:
+                cur.execute(b"EXPLAIN (ANALYZE, BUFFERS) " + _as_bytes(conn, query), vars)
+                plan = "\n".join(r[0] for r in cur.fetchall())
+            except Exception:
+                if savepoint:
+                    cur.execute("ROLLBACK TO SAVEPOINT titan_db_profile")
+                raise
+            if savepoint:
+                cur.execute("RELEASE SAVEPOINT titan_db_profile")
+    except Exception as e:  # never let profiling break the caller
+        plan = f"(explain failed: {e})"
+    with _lock:
+        _stats[key].plans.append(f"-- {elapsed_ms:.1f} ms\n{plan}")
+
+
+def _as_bytes(conn, q: Any) -> bytes:
+    if isinstance(q, bytes):
+        return q
+    if hasattr(q, "as_string"):  # psycopg2.sql.Composable
+        q = q.as_string(conn)
+    return str(q).encode("utf-8")
+
+
+class ProfilingCursorMixin:
+    """Times execute/executemany on any psycopg2 cursor class."""
+
+    def execute(self, query, vars=None):
+        t0 = time.perf_counter()
+        try:
+            out = super().execute(query, vars)
+        except Exception:
+            record(query, (time.perf_counter() - t0) * 1000.0, -1, error=True)
+            raise
+        elapsed = (time.perf_counter() - t0) * 1000.0
+        record(query, elapsed, self.rowcount)
+        if ENABLED and elapsed >= EXPLAIN_MS and _wants_plan(query):
+            _explain(self.connection, query, vars, elapsed)
+        return out
+
+    def executemany(self, query, vars_list):
+        t0 = time.perf_counter()
+        try:
+            out = super().executemany(query, vars_list)
+        except Exception:
+            record(query, (time.perf_counter() - t0) * 1000.0, -1, error=True)
+            raise
+        record(query, (time.perf_counter() - t0) * 1000.0, self.rowcount)
+        return out
+
+
+_cursor_classes: Dict[type, type] = {}
+
+
+def profiled_cursor(base: Optional[type] = None) -> type:
+    """Cursor factory for conn.cursor(cursor_factory=...); `base` unchanged when profiling is off."""
+    if base is None:
+        import psycopg2.extensions
+        base = psycopg2.extensions.cursor
+    if not _active():
+        return base
+    cls = _cursor_classes.get(base)
+    if cls is None:
+        cls = _cursor_classes[base] = type("Profiling" + base.__name__, (ProfilingCursorMixin, base), {})
+    return cls
+
+
+def profiled(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap a run_query(sql, ...)-style function; rows = len(result).
+
+    Wrapped at import time, before observers may be registered, so the
+    on/off check happens per call.
+    """
+    def wrapper(sql, *args, **kwargs):
+        if not _active():
+            return fn(sql, *args, **kwargs)
+        t0 = time.perf_counter()
+        try:
+            out = fn(sql, *args, **kwargs)
+        except Exception:
+            record(sql, (time.perf_counter() - t0) * 1000.0, -1, error=True)
+            raise
+        try:
+            rows = len(out)
+        except TypeError:
+            rows = -1
+        record(sql, (time.perf_counter() - t0) * 1000.0, rows)
+        return out
+
+    wrapper.__wrapped__ = fn
+    return wrapper
+
+
+def snapshot() -> List[Dict[str, Any]]:
+    with _lock:
+        return [
+            {"sql": k, "calls": s.calls, "total_ms": round(s.total_ms, 3),
+             "mean_ms": round(s.total_ms / s.calls, 3) if s.calls else 0.0,
+             "max_ms": round(s.max_ms, 3), "rows": s.rows, "plans": list(s.plans)}
+            for k, s in _stats.items()
+        ]
+
+
+def report_text() -> str:
+    rows = sorted(snapshot(), key=lambda r: -r["total_ms"])
+    out = [f"{'calls':>7} {'total ms':>11} {'mean ms':>9} {'max ms':>9} {'rows':>9}  statement", "-" * 100]
+    for r in rows:
+        out.append(f"{r['calls']:>7} {r['total_ms']:>11.1f} {r['mean_ms']:>9.2f} {r['max_ms']:>9.1f} {r['rows']:>9}  {r['sql'][:160]}")
+    for r in rows:
+        for plan in r["plans"]:
+            out += ["", "=" * 100, r["sql"], plan]
+    return "\n".join(out) + "\n"
+
+
+def write_report(path: Optional[str] = None) -> Optional[str]:
+    if not _stats:
+        return None
+    path = path or REPORT_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(report_text())
+    return path
+
+
+def reset() -> None:
+    with _lock:
+        _stats.clear()
+
+
+if ENABLED:
+    atexit.register(write_report)
@@ -8,17 +8,145 @@ from titan_core.icd import search_icd, get_guideline
 from titan_core.labs import process_drop_folder
 
 from agents.soap_validator import validate_soap_payload
-from agents.soap_enrich import enrich_soap_note
-from agents.lab_summary import fetch_lab_summary
-from agents.icd_coder import query_icd_codes  # until this module is refactored too
+from agents.soap_enrich import enrich_soap_note, build_enriched, collect, deadline_for, submit
+from agents.lab_summary import fetch_lab_summary, fetch_lab_summaries
+from agents.lab_summary import cache_stats as lab_cache_stats
+from agents.icd_coder import query_icd_codes, query_icd_codes_batch  # until this module is refactored too
+from agents.icd_coder import cache_stats as icd_cache_stats
+from agents.guideline_retriever import fetch_guidelines
+from metrics import counter, gauge, histogram
+from logger import current_request_id, request_context, timed
+import logging
+import time
 
-def auto_route(payload):
+logger = logging.getLogger("Dispatcher")
+
+ROUTE_REQUESTS = counter("titan_route_requests_total", "auto_route payloads by route", ["route"])
+ROUTE_ERRORS = counter("titan_route_errors_total", "auto_route payloads that failed or were rejected", ["route"])
+ROUTE_SECONDS = histogram("titan_route_seconds", "auto_route latency by route", ["route"])
+ROUTE_INFLIGHT = gauge("titan_route_inflight", "auto_route calls in progress by route", ["route"])
+BATCH_SIZE = histogram("titan_route_batch_size", "Payloads per auto_route_batch call", [],
+                       buckets=(1, 10, 50, 100, 500, 1000, 5000, 10000))
+CACHE_STAT = gauge("titan_route_cache", "Route result cache counters (see ttl_cache.TTLCache.stats)", ["cache", "stat"])
+
+NO_ROUTE = {"error": "No valid routing logic matched"}
+INVALID_SOAP = {"error": "Invalid SOAP structure"}
+
+def _classify(payload):
     if "subjective" in payload and "chief_complaint" in payload:
+        return "soap"
+    elif "patient_id" in payload and "query" in payload:
+        return "icd"
+    elif "patient_id" in payload and "query" not in payload:
+        return "lab"
+    return None
+
+def auto_route(payload):
+    route = _classify(payload)
+    label = route or "none"
+    ROUTE_REQUESTS.inc(route=label)
+    t0 = time.perf_counter()
+    try:
+        with request_context(payload.get("request_id") or current_request_id()), \
+                timed(logger, f"route {label}", level=logging.DEBUG), \
+                ROUTE_INFLIGHT.track_inprogress(route=label):
+            result = _route(payload, route)
+    except Exception:
+        ROUTE_ERRORS.inc(route=label)
+        raise
+    finally:
+        ROUTE_SECONDS.observe(time.perf_counter() - t0, route=label)
+    if result is None or (isinstance(result, dict) and "error" in result):
+        ROUTE_ERRORS.inc(route=label)
+    return result
+
+def _route(payload, route):
+    if route == "soap":
         if not validate_soap_payload(payload):
-            return {"error": "Invalid SOAP structure"}
+            return dict(INVALID_SOAP)
         return enrich_soap_note(payload)
-    elif "patient_id" in payload and "query" in payload:
+    elif route == "icd":
         return query_icd_codes({"query": payload["query"]})
-    elif "patient_id" in payload and "query" not in payload:
+    elif route == "lab":
         return fetch_lab_summary({"patient_id": payload["patient_id"]})
-    return {"error": "No valid routing logic matched"}
+    return dict(NO_ROUTE)
+
+def auto_route_batch(payloads):
+    """
+    Route many payloads at once; results come back in input order, each one
+    what auto_route would have returned for that payload.
+
+    Lab summaries for every patient (lab and SOAP payloads) are fetched in one
+    batched query, ICD queries (ICD payloads and SOAP chief complaints) go
+    through query_icd_codes_batch once per distinct query, and guidelines are fetched once per distinct
+    complaint. These lookups run concurrently on the SOAP enrichment pool.
+    Each SOAP payload keeps its enrich_soap_note deadline, counted from the
+    start of the batch: a lookup still running then leaves that note partial,
+    with the source listed under "TimedOut". Lab and ICD payloads wait for
+    their lookup, as auto_route does.
+    """
+    payloads = list(payloads)
+    with request_context(current_request_id()), timed(logger, "route batch", payloads=len(payloads)):
+        return _route_batch(payloads)
+
+def _route_batch(payloads):
+    results = [None] * len(payloads)
+    routes = [_classify(p) for p in payloads]
+    labels = [r or "none" for r in routes]
+    BATCH_SIZE.observe(len(payloads))
+    t0 = time.perf_counter()
+    for i, route in enumerate(routes):
+        if route is None:
+            results[i] = dict(NO_ROUTE)
+        elif route == "soap" and not validate_soap_payload(payloads[i]):
+            results[i] = dict(INVALID_SOAP)
+            routes[i] = None
+
+    lab_ids = [p["patient_id"] for p, r in zip(payloads, routes) if r in ("lab", "soap")]
+    queries = [p["query"] if r == "icd" else p.get("chief_complaint", "")
+               for p, r in zip(payloads, routes) if r in ("icd", "soap")]
+    complaints = [p.get("chief_complaint", "") for p, r in zip(payloads, routes) if r == "soap"]
+
+    labs_f = submit(fetch_lab_summaries, lab_ids) if lab_ids else None
+    icds_f = submit(query_icd_codes_batch, queries) if queries else None
+    guidelines_f = {c: submit(fetch_guidelines, {"query": c}) for c in dict.fromkeys(complaints)}
+
+    # earliest deadline first, so each wait only covers what is left of that payload's budget
+    soap = sorted((i for i, r in enumerate(routes) if r == "soap"), key=lambda i: deadline_for(payloads[i]))
+    for i in soap:
+        p = payloads[i]
+        complaint = p.get("chief_complaint", "")
+        got, timed_out = collect({"labs": labs_f, "icds": icds_f, "guidelines": guidelines_f[complaint]},
+                                 t0 + deadline_for(p) - time.perf_counter(), cancel=False)
+        results[i] = build_enriched(
+            p,
+            labs=(got["labs"] or {}).get(p["patient_id"]),
+            icds=(got["icds"] or {}).get(complaint),
+            guidelines=got["guidelines"],
+            timed_out=timed_out,
+        )
+
+    labs = labs_f.result() if labs_f and "lab" in routes else {}
+    icds = icds_f.result() if icds_f and "icd" in routes else {}
+    for i, (p, route) in enumerate(zip(payloads, routes)):
+        if route == "lab":
+            results[i] = labs.get(p["patient_id"])
+        elif route == "icd":
+            results[i] = icds.get(p["query"])
+    elapsed = time.perf_counter() - t0
+    for label, result in zip(labels, results):
+        ROUTE_REQUESTS.inc(route=label)
+        if result is None or (isinstance(result, dict) and "error" in result):
+            ROUTE_ERRORS.inc(route=label)
+    ROUTE_SECONDS.observe(elapsed, route="batch")
+    logger.info(f"routed {len(payloads)} payloads: {len(lab_ids)} lab lookups, "
+                f"{len(set(queries))} ICD queries, {len(guidelines_f)} guideline queries")
+    return results
+
+def cache_stats():
+    """Hit rate / eviction counters of the per-route result caches."""
+    return {"lab_summary": lab_cache_stats(), "icd_lookup": icd_cache_stats()}
+
+for _name, _stats in (("lab_summary", lab_cache_stats), ("icd_lookup", icd_cache_stats)):
+    for _stat in ("size", "hits", "misses", "coalesced", "evictions", "hit_rate"):
+        CACHE_STAT.set_function(lambda f=_stats, k=_stat: f()[k], cache=_name, stat=_stat)
@@ -0,0 +1,179 @@
+"""
+DM2 coding over a whole cohort at once (vectorized twin of decide_dm2_codes).
+
+A cohort is columnar: a dict of equal-length arrays/lists keyed by DM2Input
+field name. Missing values are None or NaN; missing columns count as all-missing.
+Each code is computed as one boolean mask over the cohort, then masks are
+scattered back into per-patient code lists in the scalar function's order.
+
+USAGE:
+  from dm2_batch import decide_dm2_codes_batch
+  codes = decide_dm2_codes_batch({"on_insulin": [...], "a1c_percent": [...], ...})
+
+  python dm2_batch.py --verify 20000     # randomized equivalence check vs decide_dm2_codes
+"""
+from __future__ import annotations
+from dataclasses import asdict, fields
+from typing import Any, Dict, List, Mapping, Sequence, Tuple
+import argparse
+import random
+import sys
+
+import numpy as np
+
+from dm_2_coding_decision_flow_titan_lite import DM2Input, decide_dm2_codes
+
+NUMERIC = ("a1c_percent", "uacr_mg_per_g", "egfr", "ldl_mg_dl", "sbp", "dbp", "bmi")
+FLAGS = ("on_insulin", "diabetic_retinopathy", "macular_edema", "neuropathy_unspecified",
+         "neuropathy_poly", "pvd", "gangrene", "foot_ulcer", "arthropathy", "other_skin_comp",
+         "statin_intolerant", "depression", "anxiety")
+
+
+def _cohort_size(cohort: Mapping[str, Any]) -> int:
+    sizes = {len(v) for v in cohort.values()}
+    if len(sizes) > 1:
+        raise ValueError(f"cohort columns differ in length: {sorted(sizes)}")
+    return sizes.pop() if sizes else 0
+
+
+def _num(cohort: Mapping[str, Any], name: str, n: int) -> np.ndarray:
+    col = cohort.get(name)
+    if col is None:
+        return np.full(n, np.nan)
+    return np.asarray(col, dtype=float)  # None -> nan
+
+
+def _flag(cohort: Mapping[str, Any], name: str, n: int) -> np.ndarray:
+    # truthy and present; NaN/None count as not set
+    v = _num(cohort, name, n)
+    return ~np.isnan(v) & (v != 0)
+
+
+def _cv(cohort: Mapping[str, Any], n: int) -> np.ndarray:
+    col = cohort.get("cv_status")
+    if col is None:
+        return np.full(n, "", dtype=str)
+    arr = np.asarray(col, dtype=object)
+    missing = (arr == None) | (arr != arr)  # noqa: E711 -- elementwise None / NaN test
+    return np.char.lower(np.where(missing, "", arr).astype(str))
+
+
+def code_masks(cohort: Mapping[str, Any]) -> Tuple[List[str], np.ndarray]:
+    """(codes, mask) where mask[i, j] is True if patient i gets codes[j]; column order = emit order."""
+    n = _cohort_size(cohort)
+    num = {k: _num(cohort, k, n) for k in NUMERIC}
+    f = {k: _flag(cohort, k, n) for k in FLAGS}
+    cv = _cv(cohort, n)
+
+    a1c, uacr, egfr, bmi = num["a1c_percent"], num["uacr_mg_per_g"], num["egfr"], num["bmi"]
+    sbp, dbp = num["sbp"], num["dbp"]
+    base_65 = f["on_insulin"] | (a1c >= 7.0)
+    bp_present = ~np.isnan(sbp) & ~np.isnan(dbp)
+    dep, anx = f["depression"], f["anxiety"]
+
+    cols: List[Tuple[str, np.ndarray]] = [
+        ("E11.65", base_65),
+        ("E11.9", ~base_65),
+        ("E11.29", (uacr >= 30) & (uacr < 300)),
+        ("E11.21", uacr >= 300),
+        ("E11.22", egfr < 60),
+        ("E11.311", f["diabetic_retinopathy"] & f["macular_edema"]),
+        ("E11.319", f["diabetic_retinopathy"] & ~f["macular_edema"]),
+        ("E11.42", f["neuropathy_poly"]),
+        ("E11.40", ~f["neuropathy_poly"] & f["neuropathy_unspecified"]),
+        ("E11.52", f["pvd"] & f["gangrene"]),
+        ("E11.51", f["pvd"] & ~f["gangrene"]),
+        ("E11.621", f["foot_ulcer"]),
+        ("E11.610", f["arthropathy"]),
+        ("E11.628", f["other_skin_comp"]),
+        ("E11.59", (cv == "very high") | (cv == "high")),
+        ("I25.10", cv == "cad"),
+        ("Z87.891", cv == "priorevent"),
+        ("Z88.1", f["statin_intolerant"]),
+        ("I10", bp_present),
+        ("Z79.899", bp_present & ((sbp >= 130) | (dbp >= 80))),
+        ("E66.01", bmi >= 35),
+        ("E66.9", (bmi >= 30) & (bmi < 35)),
+        ("Z68.25", (bmi >= 25) & (bmi < 30)),
+        ("F41.8", dep & anx),
+        ("F32.9", dep & ~anx),
+        ("F41.9", anx & ~dep),
+    ]
+    codes = [c for c, _ in cols]
+    mask = np.column_stack([m for _, m in cols]) if n else np.zeros((0, len(cols)), dtype=bool)
+    return codes, mask
+
+
+def decide_dm2_codes_batch(cohort: Mapping[str, Any]) -> List[List[str]]:
+    """Per-patient ICD-10 code lists, identical to decide_dm2_codes(...).icd_codes."""
+    codes, mask = code_masks(cohort)
+    code_arr = np.asarray(codes, dtype=object)
+    rows, cols = np.nonzero(mask)                   # row-major: grouped by patient, in emit order
+    bounds = np.cumsum(mask.sum(axis=1))[:-1]
+    return [part.tolist() for part in np.split(code_arr[cols], bounds)] if len(mask) else []
+
+
+def cohort_from_inputs(inputs: Sequence[DM2Input]) -> Dict[str, List[Any]]:
+    """Columnar cohort from a list of DM2Input (handy for tests and small jobs)."""
+    names = [fl.name for fl in fields(DM2Input)]
+    cols: Dict[str, List[Any]] = {k: [] for k in names}
+    for x in inputs:
+        for k, v in asdict(x).items():
+            cols[k].append(v)
+    return cols
+
+
+# ----------------------------
+# Randomized equivalence check
+# ----------------------------
+
+def random_dm2_input(rng: random.Random) -> DM2Input:
+    def maybe(v):
+        return None if rng.random() < 0.25 else v
+
+    def flag():
+        return maybe(rng.random() < 0.5)
+
+    return DM2Input(
+        on_insulin=rng.random() < 0.3,
+        a1c_percent=maybe(rng.choice([7.0, 6.99, round(rng.uniform(4, 14), 1)])),
+        uacr_mg_per_g=maybe(rng.choice([30, 29.9, 300, 299.9, round(rng.uniform(0, 900), 1)])),
+        egfr=maybe(rng.choice([60, 59.9, round(rng.uniform(5, 130), 1)])),
+        diabetic_retinopathy=flag(), macular_edema=flag(),
+        neuropathy_unspecified=flag(), neuropathy_poly=flag(),
+        pvd=flag(), gangrene=flag(),
+        foot_ulcer=flag(), arthropathy=flag(), other_skin_comp=flag(),
+        cv_status=maybe(rng.choice(["Very High", "High", "CAD", "PriorEvent", "high", "low", ""])),
+        ldl_mg_dl=maybe(round(rng.uniform(30, 220), 1)),
+        statin_intolerant=flag(),
+        sbp=maybe(rng.choice([130, 129, rng.randint(90, 200)])),
+        dbp=maybe(rng.choice([80, 79, rng.randint(50, 120)])),
+        bmi=maybe(rng.choice([25, 30, 35, 40, 24.9, 29.9, 34.9, 39.9, round(rng.uniform(16, 55), 1)])),
+        depression=flag(), anxiety=flag(),
+    )
+
+
+def verify(n: int, seed: int = 0) -> int:
+    """Compare batch vs scalar on n random inputs; returns number of mismatches."""
+    rng = random.Random(seed)
+    inputs = [random_dm2_input(rng) for _ in range(n)]
+    got = decide_dm2_codes_batch(cohort_from_inputs(inputs))
+    bad = 0
+    for x, codes in zip(inputs, got):
+        want = decide_dm2_codes(x).icd_codes
+        if codes != want:
+            bad += 1
+            if bad <= 5:
+                print(f"MISMATCH {x}\n  scalar={want}\n  batch ={codes}")
+    return bad
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--verify", type=int, metavar="N", help="randomized equivalence check over N inputs")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    if args.verify:
+        mismatches = verify(args.verify, args.seed)
+        print(f"{args.verify - mismatches}/{args.verify} match")
+        sys.exit(1 if mismatches else 0)
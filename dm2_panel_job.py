@@ -0,0 +1,246 @@
+"""
+Panel-wide DM2 coding job.
+
+Pulls the inputs decide_dm2_codes needs for every patient in a handful of
+set-based queries (latest labs/vitals from titan.labs, insulin from
+titan.medications, eye exam findings from titan.v_latest_procedure), maps them
+to DM2Input in bulk, runs the decision flow across worker processes and
+upserts the results into titan.dm2_codes in pages.
+
+Lab values come from the typed value_num/unit_canon/test_canon columns (see
+lab_units.py): per patient and canonical test, the most recent result with a
+numeric value in the canonical unit, so HbA1c and A1C rows compete on date and
+a newer non-numeric result ("pending") does not hide the last number.
+BP and BMI are read from titan.labs rows with test_canon SBP/DBP/BMI.
+
+USAGE:
+  python dm2_panel_job.py                  # diabetic panel (A1c on file or on insulin)
+  python dm2_panel_job.py --all --workers 8
+  python dm2_panel_job.py --dry-run --csv Output/dm2_codes.csv
+
+Emitted codes are checked against the ICD-10 catalog (icd_trie.py) when it is
+available; codes missing from it are reported, and --strict fails the run.
+"""
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import argparse
+import collections
+import csv
+import json
+import os
+import sys
+import time
+
+import psycopg2
+from psycopg2.extras import RealDictCursor, execute_values
+
+from db_profile import profiled_cursor
+from dm_2_coding_decision_flow_titan_lite import DM2Input, decide_dm2_codes
+from icd_trie import DEFAULT_CSV, load_trie
+from lab_units import UNIT_CONVERSIONS
+
+# DM2Input field -> titan.labs.test_canon
+LAB_FIELDS = {
+    "a1c_percent": "A1C",
+    "uacr_mg_per_g": "UACR",
+    "egfr": "EGFR",
+    "ldl_mg_dl": "LDL",
+    "sbp": "SBP",
+    "dbp": "DBP",
+    "bmi": "BMI",
+}
+
+INSULIN_PATTERN = r"insulin|glargine|lispro|aspart|detemir|degludec|glulisine|\mnph\M"
+
+DDL = r"""
+CREATE TABLE IF NOT EXISTS titan.dm2_codes(
+  user_id UUID PRIMARY KEY REFERENCES titan.users(user_id) ON DELETE CASCADE,
+  icd_codes TEXT[] NOT NULL,
+  rationales TEXT[] NOT NULL,
+  advisories TEXT[] NOT NULL,
+  inputs JSONB,
+  coded_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+
+def _labs_sql() -> Tuple[str, List[Any]]:
+    """Latest numeric result per (patient, canonical test), pivoted to one row per patient."""
+    tests = list(dict.fromkeys(LAB_FIELDS.values()))
+    cols, params = [], [tests, [UNIT_CONVERSIONS[t][0] for t in tests]]
+    for field, code in LAB_FIELDS.items():
+        cols.append(f"max(value_num) FILTER (WHERE test_canon = %s) AS {field}")
+        params.append(code)
+    sql = (
+        "WITH keys(test_canon, unit_canon) AS (SELECT * FROM unnest(%s::text[], %s::text[])),\n"
+        "ranked AS (\n"
+        "  SELECT l.user_id, l.test_canon, l.value_num,\n"
+        "         row_number() OVER (PARTITION BY l.user_id, l.test_canon\n"
+        "                            ORDER BY l.result_date DESC, l.recorded_at DESC) AS rn\n"
+        "    FROM titan.labs l\n"
+        "    JOIN keys k ON k.test_canon = l.test_canon AND k.unit_canon = l.unit_canon\n"
+        "   WHERE l.value_num IS NOT NULL\n"
+        ")\n"
+        "SELECT user_id, " + ",\n       ".join(cols) +
+        "\nFROM ranked\nWHERE rn = 1\nGROUP BY user_id"
+    )
+    return sql, params
+
+
+INSULIN_SQL = """
+SELECT DISTINCT user_id FROM titan.medications
+WHERE status = 'current' AND name ~* %s
+"""
+
+EYE_SQL = r"""
+SELECT user_id,
+       (result_text ~* 'retinopathy'
+        AND result_text !~* '(no|without|negative for)\s+(diabetic\s+)?retinopathy') AS diabetic_retinopathy,
+       (result_text ~* 'macular\s+edema'
+        AND result_text !~* '(no|without|negative for)\s+macular\s+edema') AS macular_edema
+FROM titan.v_latest_procedure
+WHERE proc_type IN ('eye_exam', 'retinal_exam', 'dilated_eye_exam') AND result_text IS NOT NULL
+"""
+
+ALL_USERS_SQL = "SELECT user_id FROM titan.users"
+
+UPSERT_SQL = """
+INSERT INTO titan.dm2_codes (user_id, icd_codes, rationales, advisories, inputs)
+VALUES %s
+ON CONFLICT (user_id) DO UPDATE
+   SET icd_codes = EXCLUDED.icd_codes,
+       rationales = EXCLUDED.rationales,
+       advisories = EXCLUDED.advisories,
+       inputs = EXCLUDED.inputs,
+       coded_at = now()
+"""
+
+
+def fetch_inputs(conn, include_all: bool = False) -> Dict[str, DM2Input]:
+    """user_id -> DM2Input for the panel, from three or four set-based queries."""
+    with conn.cursor(cursor_factory=profiled_cursor(RealDictCursor)) as cur:
+        sql, params = _labs_sql()
+        cur.execute(sql, params)
+        labs = {str(r["user_id"]): r for r in cur.fetchall()}
+
+        cur.execute(INSULIN_SQL, (INSULIN_PATTERN,))
+        insulin = {str(r["user_id"]) for r in cur.fetchall()}
+
+        cur.execute(EYE_SQL)
+        eye = {str(r["user_id"]): r for r in cur.fetchall()}
+
+        if include_all:
+            cur.execute(ALL_USERS_SQL)
+            panel = [str(r["user_id"]) for r in cur.fetchall()]
+        else:
+            panel = sorted({uid for uid, r in labs.items() if r["a1c_percent"] is not None} | insulin)
+
+    out: Dict[str, DM2Input] = {}
+    for uid in panel:
+        lab = labs.get(uid) or {}
+        e = eye.get(uid) or {}
+        vals = {f: (float(lab[f]) if lab.get(f) is not None else None) for f in LAB_FIELDS}
+        for f in ("sbp", "dbp"):
+            if vals[f] is not None:
+                vals[f] = int(round(vals[f]))
+        out[uid] = DM2Input(
+            on_insulin=uid in insulin,
+            diabetic_retinopathy=e.get("diabetic_retinopathy"),
+            macular_edema=e.get("macular_edema"),
+            **vals,
+        )
+    return out
+
+
+def _decide_chunk(chunk: Sequence[Tuple[str, DM2Input]]) -> List[Tuple[str, List[str], List[str], List[str]]]:
+    out = []
+    for uid, x in chunk:
+        d = decide_dm2_codes(x)
+        out.append((uid, d.icd_codes, d.rationales, d.advisories))
+    return out
+
+
+def decide_all(inputs: Dict[str, DM2Input], workers: int = 1, chunk_size: int = 2000):
+    items = list(inputs.items())
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    if workers <= 1 or len(chunks) <= 1:
+        return [row for c in chunks for row in _decide_chunk(c)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return [row for part in pool.map(_decide_chunk, chunks) for row in part]
+
+
+def unknown_codes(results, catalog_path: Optional[str] = None) -> Optional[Dict[str, int]]:
+    """code -> patients it was emitted for, for codes absent from the catalog (None without a catalog)."""
+    path = catalog_path or DEFAULT_CSV
+    if not os.path.exists(path):
+        return None
+    trie = load_trie(path)
+    emitted = collections.Counter(c for _, codes, _, _ in results for c in codes)
+    return {c: n for c, n in emitted.items() if not trie.contains(c)}
+
+
+def write_results(conn, results, inputs: Dict[str, DM2Input], page_size: int = 1000) -> int:
+    rows = [
+        (uid, codes, why, adv, json.dumps(asdict(inputs[uid])))
+        for uid, codes, why, adv in results
+    ]
+    with conn.cursor(cursor_factory=profiled_cursor()) as cur:
+        cur.execute(DDL)
+        execute_values(cur, UPSERT_SQL, rows, template="(%s::uuid, %s, %s, %s, %s::jsonb)", page_size=page_size)
+    conn.commit()
+    return len(rows)
+
+
+def _write_csv(path: str, results) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["user_id", "icd_codes", "advisories"])
+        for uid, codes, _, adv in results:
+            w.writerow([uid, ";".join(codes), " | ".join(adv)])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Code the DM2 panel from clinical views in bulk")
+    ap.add_argument("--all", action="store_true", help="every titan.users row, not just the diabetic panel")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--dry-run", action="store_true", help="do not write titan.dm2_codes")
+    ap.add_argument("--csv", help="also write a CSV summary here")
+    ap.add_argument("--icd-catalog", default=None, help=f"ICD-10 catalog CSV (default: {DEFAULT_CSV})")
+    ap.add_argument("--strict", action="store_true", help="exit 1 if any emitted code is not in the catalog")
+    ns = ap.parse_args(argv)
+
+    dsn = os.environ["DATABASE_URL"]
+    t0 = time.perf_counter()
+    with psycopg2.connect(dsn) as conn:
+        inputs = fetch_inputs(conn, ns.all)
+        t1 = time.perf_counter()
+        results = decide_all(inputs, ns.workers)
+        t2 = time.perf_counter()
+        unknown = unknown_codes(results, ns.icd_catalog)
+        if unknown and ns.strict:
+            for code, n in sorted(unknown.items()):
+                print(f"ERROR: {code} (emitted for {n} patients) is not in the ICD-10 catalog")
+            return 1
+        written = 0 if ns.dry_run else write_results(conn, results, inputs)
+    t3 = time.perf_counter()
+
+    if ns.csv:
+        _write_csv(ns.csv, results)
+
+    tally = collections.Counter(c for _, codes, _, _ in results for c in codes)
+    print(f"OK: {len(results)} patients coded (fetch {t1 - t0:.1f}s, decide {t2 - t1:.1f}s, write {t3 - t2:.1f}s)"
+          + ("" if ns.dry_run else f", {written} rows upserted"))
+    for code, n in tally.most_common(15):
+        print(f"  {code:<8} {n}")
+    if unknown is None:
+        print("WARN: ICD-10 catalog not found; emitted codes were not validated")
+    for code, n in sorted((unknown or {}).items()):
+        print(f"WARN: {code} (emitted for {n} patients) is not in the ICD-10 catalog")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
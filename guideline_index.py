@@ -0,0 +1,100 @@
+"""
+In-memory guideline index for crosscheck_guidelines.
+
+The guideline map is loaded once per process and reloaded only when it
+changes: the file's mtime for guideline_map.json, the store revision for a
+SQLite guideline store (*.db, see guideline_store.py). Each recommendation's
+keyword (its first word, lower-cased) is precomputed, so a cross-check lowers
+the note once and does one substring test per recommendation.
+
+Map location: TITAN_GUIDELINE_MAP, else the guideline store if it exists,
+else guideline_map.json next to this file.
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import os
+import threading
+
+from guideline_store import DEFAULT_STORE, GuidelineStore
+
+JSON_PATH = str(Path(__file__).parent / "guideline_map.json")
+STORE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+def note_text(note: str) -> str:
+    """The note lower-cased, computed once per cross-check."""
+    return (note or "").lower()
+
+
+def default_path() -> str:
+    env = os.environ.get("TITAN_GUIDELINE_MAP")
+    if env:
+        return env
+    return DEFAULT_STORE if os.path.exists(DEFAULT_STORE) else JSON_PATH
+
+
+def _keyword(rec: str) -> Optional[str]:
+    words = rec.lower().split()
+    return words[0] if words else None
+
+
+class GuidelineIndex:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or default_path()
+        self._store = GuidelineStore(self.path) if self.path.endswith(STORE_SUFFIXES) else None
+        self._version: Optional[int] = None
+        # icd -> [(source, recommendation, keyword)]
+        self._entries: Dict[str, List[Tuple[str, str, str]]] = {}
+        self._lock = threading.Lock()
+
+    def refresh(self) -> None:
+        """Reload if the map changed (one stat() or one revision read when it has not)."""
+        version = self._store.revision() if self._store else os.stat(self.path).st_mtime_ns
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            if self._store:
+                version, data = self._store.snapshot()
+            else:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            self._entries = self._build(data)
+            self._version = version
+
+    @staticmethod
+    def _build(data: Dict[str, dict]) -> Dict[str, List[Tuple[str, str, str]]]:
+        entries: Dict[str, List[Tuple[str, str, str]]] = {}
+        for icd, g in data.items():
+            source = g.get("source", "")
+            recs = []
+            for rec in g.get("recommendations", []):
+                kw = _keyword(rec)
+                if kw:
+                    recs.append((source, rec, kw))
+            entries[icd] = recs
+        return entries
+
+    def missing(self, note_lower: str, icd_tags: Iterable[str]) -> List[str]:
+        """'source: recommendation' for each recommendation whose keyword does not occur in the note."""
+        entries = self._entries
+        out: List[str] = []
+        for icd in icd_tags:
+            for source, rec, kw in entries.get(icd, ()):
+                if kw not in note_lower:
+                    out.append(f"{source}: {rec}")
+        return out
+
+
+_indexes: Dict[str, GuidelineIndex] = {}
+
+
+def get_index(path: Optional[str] = None) -> GuidelineIndex:
+    key = path or default_path()
+    idx = _indexes.get(key)
+    if idx is None:
+        idx = _indexes.setdefault(key, GuidelineIndex(key))
+    idx.refresh()
+    return idx
@@ -0,0 +1,28 @@
+import os, sys
+_root = os.path.dirname(os.path.dirname(__file__))
+if _root not in sys.path:
+    sys.path.insert(0, _root)
+
+import logging
+from utils.validator import validate_payload
+from guideline_search import get_search_index
+
+logger = logging.getLogger("Guidelines")
+
+# Offline BM25 index over TITAN_GUIDELINE_DIR (guideline_search.py); no network service
+MAX_RESULTS = int(os.environ.get("TITAN_GUIDELINE_RESULTS", "3"))
+
+def fetch_guidelines(payload):
+    """Guidelines for a chief complaint or ICD code: [{"title", "url"}, ...], best first."""
+    if not validate_payload(payload, "guideline_lookup"):
+        logger.warning("⚠️ Invalid guideline payload")
+        return None
+    query = payload.get("query", "")
+    if not query:
+        return []
+    try:
+        hits = get_search_index().search(query, MAX_RESULTS)
+    except Exception as e:
+        logger.error(f"guideline index unavailable: {e}")
+        return []
+    return [{"title": h["title"], "url": h["url"]} for h in hits]
@@ -0,0 +1,280 @@
+"""
+Offline BM25 search over a folder of guideline documents.
+
+Documents are .md/.txt/.html files (and .json lists of {"title", "url",
+"text"}). A file may start with "key: value" lines (title, url, icd) before
+the first blank line; otherwise the title is the first heading/line and the
+url is the file's own URI. ICD-10 codes in the text are indexed as written
+("e11.65") and by category ("e11"), so "E11.65" finds E11 guidance too.
+Title terms count three times.
+
+The index (terms, postings, term frequencies, document lengths) is saved
+as one .npz next to the folder and memory-resident after the first load.
+A query is a dict lookup per term plus a vectorized BM25 over the postings,
+well under a millisecond for a few thousand documents. The index is rebuilt
+when any file in the folder changes (checked at most every
+TITAN_GUIDELINE_RECHECK_S seconds).
+
+USAGE:
+  from guideline_search import get_search_index
+  get_search_index().search("chest pain", k=3)     # [{"title", "url", "score"}, ...]
+
+  python guideline_search.py build                       # (re)index TITAN_GUIDELINE_DIR
+  python guideline_search.py search "type 2 diabetes" -k 5
+  python guideline_search.py search E11.65 --dir ~/guidelines
+
+ENV:
+  TITAN_GUIDELINE_DIR=guidelines/        documents to index (next to this file by default)
+  TITAN_GUIDELINE_INDEX=<dir>.bm25.npz   where the index is saved
+  TITAN_GUIDELINE_RECHECK_S=5            seconds between folder freshness checks
+"""
+from __future__ import annotations
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import hashlib
+import html
+import json
+import math
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_DIR = os.environ.get("TITAN_GUIDELINE_DIR") or str(Path(__file__).parent / "guidelines")
+RECHECK_S = float(os.environ.get("TITAN_GUIDELINE_RECHECK_S", "5"))
+SUFFIXES = (".md", ".txt", ".html", ".htm", ".json")
+
+K1 = 1.2
+B = 0.75
+TITLE_WEIGHT = 3
+
+_TOKEN = re.compile(r"[a-z][0-9]{2}\.[0-9a-z]{1,4}|[a-z0-9]+")
+_ICD = re.compile(r"[a-z][0-9]{2}\.")
+_TAG = re.compile(r"<[^<>]{0,2000}>")
+_META = re.compile(r"^(title|url|icd)\s*:\s*(.+)$", re.I)
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in into is it its of on or that the their this to was were "
+    "which with without not no should may can will patients patient".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    out = []
+    for tok in _TOKEN.findall((text or "").lower()):
+        if tok in STOPWORDS:
+            continue
+        out.append(tok)
+        if _ICD.match(tok):
+            out.append(tok[:3])  # category
+    return out
+
+
+def default_index_path(doc_dir: str) -> str:
+    return os.environ.get("TITAN_GUIDELINE_INDEX") or str(Path(doc_dir)).rstrip("/\\") + ".bm25.npz"
+
+
+# ---------- documents ----------
+def _read_doc(path: Path) -> List[Dict[str, str]]:
+    raw = path.read_text(encoding="utf-8", errors="replace")
+    if path.suffix == ".json":
+        items = json.loads(raw)
+        items = items if isinstance(items, list) else [items]
+        return [{"title": str(d.get("title") or path.stem), "url": str(d.get("url") or path.resolve().as_uri()),
+                 "text": str(d.get("text") or ""), "icd": " ".join(d.get("icd") or [])}
+                for d in items if isinstance(d, dict)]
+    if path.suffix in (".html", ".htm"):
+        m = re.search(r"(?is)<title>(.{0,500}?)</title>", raw)
+        title = html.unescape(m.group(1)).strip() if m else ""
+        raw = html.unescape(_TAG.sub(" ", raw))
+    else:
+        title = ""
+    meta: Dict[str, str] = {}
+    lines = raw.splitlines()
+    i = 0
+    while i < len(lines) and (m := _META.match(lines[i].strip())):
+        meta[m.group(1).lower()] = m.group(2).strip()
+        i += 1
+    body = "\n".join(lines[i:])
+    if not title:
+        title = meta.get("title") or next(
+            (ln.strip().lstrip("#").strip() for ln in lines[i:] if ln.strip()), path.stem)
+    return [{"title": meta.get("title", title), "url": meta.get("url") or path.resolve().as_uri(),
+             "text": body, "icd": meta.get("icd", "")}]
+
+
+def _files(doc_dir: str) -> List[Path]:
+    root = Path(doc_dir)
+    if not root.is_dir():
+        return []
+    return sorted(p for p in root.rglob("*") if p.is_file() and p.suffix.lower() in SUFFIXES)
+
+
+def signature(doc_dir: str) -> str:
+    """Changes whenever a document is added, removed or modified."""
+    h = hashlib.blake2b(digest_size=16)
+    for p in _files(doc_dir):
+        st = p.stat()
+        h.update(f"{p.relative_to(doc_dir)}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8", "surrogatepass"))
+    return h.hexdigest()
+
+
+# ---------- index ----------
+class BM25Index:
+    def __init__(self, terms: List[str], ptr: np.ndarray, post_doc: np.ndarray, post_tf: np.ndarray,
+                 doc_len: np.ndarray, docs: List[Dict[str, str]], sig: str = ""):
+        self.terms = terms
+        self._term_ids = {t: i for i, t in enumerate(terms)}
+        self.ptr, self.post_doc, self.post_tf, self.doc_len = ptr, post_doc, post_tf, doc_len
+        self.docs = docs
+        self.signature = sig
+        self.avgdl = float(doc_len.mean()) if len(doc_len) else 0.0
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    @classmethod
+    def build(cls, doc_dir: str) -> "BM25Index":
+        docs, per_doc = [], []
+        sig = signature(doc_dir)
+        for path in _files(doc_dir):
+            try:
+                entries = _read_doc(path)
+            except (OSError, ValueError):
+                continue
+            for d in entries:
+                tf = Counter(tokenize(d["text"]) + tokenize(d["icd"]))
+                for t in tokenize(d["title"]):
+                    tf[t] += TITLE_WEIGHT
+                docs.append({"title": d["title"], "url": d["url"]})
+                per_doc.append(tf)
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for doc_id, tf in enumerate(per_doc):
+            for t, n in tf.items():
+                postings.setdefault(t, []).append((doc_id, n))
+        terms = sorted(postings)
+        ptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        ptr[1:] = np.cumsum([len(postings[t]) for t in terms])
+        flat = [p for t in terms for p in postings[t]]
+        post_doc = np.array([d for d, _ in flat], dtype=np.int32)
+        post_tf = np.array([n for _, n in flat], dtype=np.float32)
+        doc_len = np.array([sum(tf.values()) for tf in per_doc], dtype=np.float32)
+        return cls(terms, ptr, post_doc, post_tf, doc_len, docs, sig)
+
+    def save(self, path: str) -> None:
+        """Atomic: readers see the old or the new index file, never a partial one."""
+        d = os.path.dirname(os.path.abspath(path))
+        os.makedirs(d, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=d, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, terms=np.array(self.terms, dtype=str), ptr=self.ptr, post_doc=self.post_doc,
+                         post_tf=self.post_tf, doc_len=self.doc_len,
+                         docs=np.array(json.dumps(self.docs)), signature=np.array(self.signature))
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path, allow_pickle=False) as z:
+            return cls(z["terms"].tolist(), z["ptr"], z["post_doc"], z["post_tf"], z["doc_len"],
+                       json.loads(str(z["docs"])), str(z["signature"]))
+
+    def search(self, query: str, k: int = 3) -> List[Dict[str, Any]]:
+        n_docs = len(self.docs)
+        if not n_docs:
+            return []
+        scores = np.zeros(n_docs, dtype=np.float32)
+        for t in dict.fromkeys(tokenize(query)):
+            i = self._term_ids.get(t)
+            if i is None:
+                continue
+            lo, hi = self.ptr[i], self.ptr[i + 1]
+            docs, tf = self.post_doc[lo:hi], self.post_tf[lo:hi]
+            df = hi - lo
+            idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            norm = K1 * (1.0 - B + B * self.doc_len[docs] / self.avgdl)
+            scores[docs] += idf * tf * (K1 + 1.0) / (tf + norm)
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return []
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.lexsort((hits, -scores[hits]))]
+        return [dict(self.docs[i], score=round(float(scores[i]), 4)) for i in hits]
+
+
+_loaded: Dict[str, Tuple[float, BM25Index]] = {}
+_lock = threading.Lock()
+
+
+def get_search_index(doc_dir: Optional[str] = None, index_path: Optional[str] = None) -> BM25Index:
+    """Index for doc_dir: in memory, else from disk, else built (and saved); rebuilt when the folder changes."""
+    doc_dir = str(Path(doc_dir or DEFAULT_DIR).resolve())
+    now = time.monotonic()
+    hit = _loaded.get(doc_dir)
+    if hit and now - hit[0] < RECHECK_S:
+        return hit[1]
+    with _lock:
+        hit = _loaded.get(doc_dir)
+        if hit and now - hit[0] < RECHECK_S:
+            return hit[1]
+        sig = signature(doc_dir)
+        if hit and hit[1].signature == sig:
+            _loaded[doc_dir] = (now, hit[1])
+            return hit[1]
+        path = index_path or default_index_path(doc_dir)
+        index = None
+        if os.path.exists(path):
+            try:
+                index = BM25Index.load(path)
+            except (OSError, ValueError, KeyError):
+                index = None
+        if index is None or index.signature != sig:
+            index = BM25Index.build(doc_dir)
+            if len(index):
+                index.save(path)
+        _loaded[doc_dir] = (now, index)
+        return index
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Offline BM25 guideline search")
+    ap.add_argument("command", choices=["build", "search"])
+    ap.add_argument("query", nargs="?", default="")
+    ap.add_argument("--dir", default=None, help=f"guideline documents (default: {DEFAULT_DIR})")
+    ap.add_argument("--index", default=None, help="index file (default: <dir>.bm25.npz)")
+    ap.add_argument("-k", type=int, default=5)
+    ns = ap.parse_args(argv)
+
+    doc_dir = ns.dir or DEFAULT_DIR
+    if ns.command == "build":
+        t0 = time.perf_counter()
+        index = BM25Index.build(doc_dir)
+        path = ns.index or default_index_path(doc_dir)
+        index.save(path)
+        print(f"OK: {len(index)} documents, {len(index.terms)} terms -> {path} "
+              f"({time.perf_counter() - t0:.2f}s)")
+        return 0
+    if not ns.query:
+        ap.error("search needs a query")
+    index = get_search_index(doc_dir, ns.index)
+    t0 = time.perf_counter()
+    hits = index.search(ns.query, ns.k)
+    ms = (time.perf_counter() - t0) * 1000
+    for h in hits:
+        print(f"{h['score']:>8.3f}  {h['title']}  <{h['url']}>")
+    print(f"{len(hits)} hits in {ms:.2f} ms ({len(index)} documents)")
+    return 0 if hits else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""
+Transactional guideline store (SQLite) replacing full-file guideline_map.json rewrites.
+
+- upsert_many(): many ICD -> recommendation entries in one transaction
+- replace_all(): atomic swap of the whole map (readers see old or new, never a mix)
+- get()/get_many()/as_map(): reads; WAL mode keeps readers off the writer's lock
+- revision(): bumped on every write, so caches (guideline_index) can check
+  freshness with one indexed read
+
+Location: TITAN_GUIDELINE_STORE, else guideline_map.db next to this file.
+A new store is seeded from guideline_map.json (next to this file) in the
+same transaction that first writes to it, so creating the store never hides
+the entries still kept in the JSON map.
+
+USAGE:
+  python guideline_store.py import guideline_map.json     # one-time migration
+  python guideline_store.py export guideline_map.json
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+DEFAULT_STORE = os.environ.get("TITAN_GUIDELINE_STORE") or str(Path(__file__).parent / "guideline_map.db")
+SEED_JSON = str(Path(__file__).parent / "guideline_map.json")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS guidelines(
+  icd TEXT PRIMARY KEY,
+  source TEXT NOT NULL,
+  recommendations TEXT NOT NULL,   -- JSON array of strings
+  updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta(
+  key TEXT PRIMARY KEY,
+  value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta(key, value) VALUES ('revision', 0);
+"""
+
+UPSERT = """
+INSERT INTO guidelines(icd, source, recommendations, updated_at) VALUES (?, ?, ?, ?)
+ON CONFLICT(icd) DO UPDATE SET
+  source = excluded.source,
+  recommendations = excluded.recommendations,
+  updated_at = excluded.updated_at
+"""
+
+Entry = Tuple[str, str, Sequence[str]]
+
+
+def _rows(mapping: Dict[str, dict]) -> List[tuple]:
+    now = time.time()
+    return [(icd, g.get("source", ""), json.dumps(list(g.get("recommendations", []))), now)
+            for icd, g in mapping.items()]
+
+
+class GuidelineStore:
+    def __init__(self, path: Optional[str] = None, seed_json: Optional[str] = SEED_JSON):
+        self.path = path or DEFAULT_STORE
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+        if seed_json and os.path.exists(seed_json):
+            self._seed(seed_json)
+
+    def _seed(self, path: str) -> None:
+        """Import the JSON map into a store that has never been written (revision 0)."""
+        if self.revision():
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            mapping = json.load(f)
+        rows = _rows(mapping)
+        with self._write() as c:
+            # re-checked under the write lock: another process may have created the store meanwhile
+            if c.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0]:
+                return
+            c.executemany(UPSERT, rows)
+            self._bump(c)
+
+    # one connection per thread; sqlite3 connections must not be shared across threads
+    def _conn(self) -> sqlite3.Connection:
+        c = getattr(self._local, "conn", None)
+        if c is None:
+            c = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = c
+        return c
+
+    class _Tx:
+        def __init__(self, conn: sqlite3.Connection):
+            self.conn = conn
+
+        def __enter__(self) -> sqlite3.Connection:
+            self.conn.execute("BEGIN IMMEDIATE")
+            return self.conn
+
+        def __exit__(self, exc_type, exc, tb) -> None:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+    def _write(self) -> "_Tx":
+        return self._Tx(self._conn())
+
+    @staticmethod
+    def _bump(c: sqlite3.Connection) -> None:
+        c.execute("UPDATE meta SET value = value + 1 WHERE key = 'revision'")
+
+    # ---------- writes ----------
+    def upsert_many(self, entries: Iterable[Entry]) -> int:
+        now = time.time()
+        rows = [(icd, source, json.dumps(list(recs)), now) for icd, source, recs in entries]
+        if not rows:
+            return 0
+        with self._write() as c:
+            c.executemany(UPSERT, rows)
+            self._bump(c)
+        return len(rows)
+
+    def replace_all(self, mapping: Dict[str, dict]) -> int:
+        rows = _rows(mapping)
+        with self._write() as c:
+            c.execute("DELETE FROM guidelines")
+            c.executemany(UPSERT, rows)
+            self._bump(c)
+        return len(rows)
+
+    def delete(self, icds: Iterable[str]) -> int:
+        with self._write() as c:
+            n = c.executemany("DELETE FROM guidelines WHERE icd = ?", [(i,) for i in icds]).rowcount
+            self._bump(c)
+        return n
+
+    def compact(self) -> None:
+        self._conn().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self._conn().execute("VACUUM")
+
+    # ---------- reads ----------
+    def revision(self) -> int:
+        return self._conn().execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0]
+
+    def get(self, icd: str) -> Optional[dict]:
+        r = self._conn().execute(
+            "SELECT source, recommendations FROM guidelines WHERE icd = ?", (icd,)).fetchone()
+        return {"source": r[0], "recommendations": json.loads(r[1])} if r else None
+
+    def get_many(self, icds: Iterable[str]) -> Dict[str, dict]:
+        icds = list(dict.fromkeys(icds))
+        if not icds:
+            return {}
+        marks = ",".join("?" * len(icds))
+        rows = self._conn().execute(
+            f"SELECT icd, source, recommendations FROM guidelines WHERE icd IN ({marks})", icds).fetchall()
+        return {icd: {"source": s, "recommendations": json.loads(r)} for icd, s, r in rows}
+
+    def as_map(self) -> Dict[str, dict]:
+        return self.snapshot()[1]
+
+    def snapshot(self) -> Tuple[int, Dict[str, dict]]:
+        """(revision, whole map) read from one consistent snapshot."""
+        c = self._conn()
+        c.execute("BEGIN")
+        try:
+            rev = c.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0]
+            rows = c.execute("SELECT icd, source, recommendations FROM guidelines").fetchall()
+        finally:
+            c.execute("COMMIT")
+        return rev, {icd: {"source": s, "recommendations": json.loads(r)} for icd, s, r in rows}
+
+    # ---------- JSON interop ----------
+    def import_json(self, path: str) -> int:
+        with open(path, "r", encoding="utf-8") as f:
+            return self.replace_all(json.load(f))
+
+    def export_json(self, path: str) -> int:
+        data = self.as_map()
+        write_json_atomic(path, data)
+        return len(data)
+
+
+def write_json_atomic(path: str, data: dict) -> None:
+    """Write JSON via temp file + os.replace so readers never see a partial file."""
+    d = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=".guideline_", suffix=".json", dir=d)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Guideline store maintenance")
+    ap.add_argument("command", choices=["import", "export", "compact"])
+    ap.add_argument("json_path", nargs="?")
+    ap.add_argument("--db", default=None, help=f"store path (default: {DEFAULT_STORE})")
+    ns = ap.parse_args(argv)
+    store = GuidelineStore(ns.db)
+    if ns.command == "compact":
+        store.compact()
+        print(f"OK: compacted {store.path}")
+        return 0
+    if not ns.json_path:
+        ap.error("json_path is required for import/export")
+    if ns.command == "import":
+        print(f"OK: imported {store.import_json(ns.json_path)} entries into {store.path}")
+    else:
+        print(f"OK: exported {store.export_json(ns.json_path)} entries to {ns.json_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
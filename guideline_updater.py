@@ -1,9 +1,19 @@
 # guideline_updater.py
+from guideline_store import DEFAULT_STORE, GuidelineStore, write_json_atomic
 import json
 
-def add_guideline(icd, source, recommendations, path="guideline_map.json"):
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    data[icd] = {"source": source, "recommendations": recommendations}
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
\ No newline at end of file
+def add_guideline(icd, source, recommendations, path=DEFAULT_STORE):
+    return add_guidelines([(icd, source, recommendations)], path)
+
+def add_guidelines(entries, path=DEFAULT_STORE):
+    """Upsert many (icd, source, recommendations) entries in one transaction."""
+    entries = list(entries)
+    if str(path).endswith(".json"):
+        # legacy flat-file map: still a full rewrite, but atomic (temp file + rename)
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for icd, source, recommendations in entries:
+            data[icd] = {"source": source, "recommendations": list(recommendations)}
+        write_json_atomic(path, data)
+        return len(entries)
+    return GuidelineStore(path).upsert_many(entries)
\ No newline at end of file
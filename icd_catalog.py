@@ -0,0 +1,344 @@
+"""
+Precompiled, memory-mapped ICD-10 catalog.
+
+`python icd_catalog.py build` compiles icd/icd10_full.csv into
+icd/icd10_full.ticd: a string table of codes and descriptions, u32 offset
+arrays, and a sorted vocabulary of description terms ([a-z-]+ runs) with
+row-id postings. Opening it is an mmap (read-only, shared through the page
+cache by every worker) plus a header read; nothing is parsed up front.
+
+search() reproduces lite_pipeline.assign_codes exactly: a note token t
+(letters and hyphens only) is a substring of a description iff it is a
+substring of one of that description's [a-z-]+ runs, so scanning the
+vocabulary blob for t and unioning the postings of the terms that contain
+it gives the same rows as `t in desc` over the whole CSV.
+
+search_many() answers many queries in one pass: each distinct token is looked
+up in the vocabulary once and its postings are shared by every query using it.
+
+The catalog records the CSV's size and mtime; open_catalog() returns None
+when it is missing or stale and callers fall back to the CSV.
+
+USAGE:
+  python icd_catalog.py build [icd/icd10_full.csv] [--out icd/icd10_full.ticd]
+  python icd_catalog.py search "type 2 diabetes with hyperglycemia" --top 5
+  python icd_catalog.py verify --notes 200       # catalog vs CSV scan on random notes
+"""
+from __future__ import annotations
+from bisect import bisect_right
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import argparse
+import csv
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+
+import numpy as np
+
+MAGIC = b"TICD"
+VERSION = 1
+DEFAULT_CSV = os.environ.get("TITAN_ICD_CSV") or str(Path(__file__).parent / "icd" / "icd10_full.csv")
+
+# magic, version, n_rows, n_terms, csv size, csv mtime_ns, then 8 sections as (offset, length)
+_HEADER = struct.Struct("<4sIIIqq")
+_SECTION = struct.Struct("<QQ")
+_SECTIONS = ("code_off", "code_blob", "desc_off", "desc_blob", "term_off", "term_blob", "post_off", "post_ids")
+
+_TERM = re.compile(r"[a-z-]+")
+_CANDIDATE = re.compile(r"[A-Za-z][A-Za-z\-]{4,}")
+
+
+def candidate_tokens(text: str, limit: int = 20) -> List[str]:
+    """assign_codes' search tokens: words of 5+ letters/hyphens, most frequent first (then alphabetical)."""
+    tokens = [t.lower() for t in _CANDIDATE.findall((text or "").lower())]
+    counts: Dict[str, int] = {}
+    for t in tokens:
+        counts[t] = counts.get(t, 0) + 1
+    return sorted(counts, key=lambda t: (-counts[t], t))[:limit]
+
+
+def catalog_path(csv_path: str) -> str:
+    return str(Path(csv_path).with_suffix(".ticd"))
+
+
+def read_csv_rows(csv_path: str) -> Iterator[Tuple[str, str]]:
+    """(code, description) as assign_codes reads them; rows without a code are skipped."""
+    with open(csv_path, "r", encoding="utf-8", errors="ignore") as f:
+        for row in csv.reader(f):
+            if not row:
+                continue
+            code = row[0].strip()
+            if code:
+                yield code, row[1].strip() if len(row) > 1 else ""
+
+
+# ----------------------------
+# Build
+# ----------------------------
+
+def _offsets(parts: Sequence[bytes], sep: bytes = b"") -> Tuple[bytes, bytes]:
+    offs, pos = [], 0
+    for p in parts:
+        offs.append(pos)
+        pos += len(p) + len(sep)
+    offs.append(pos)
+    return struct.pack(f"<{len(offs)}I", *offs), sep.join(parts)
+
+
+def build(csv_path: Optional[str] = None, out_path: Optional[str] = None) -> Dict[str, Any]:
+    csv_path = csv_path or DEFAULT_CSV
+    out_path = out_path or catalog_path(csv_path)
+    st = os.stat(csv_path)
+
+    codes: List[bytes] = []
+    descs: List[bytes] = []
+    postings: Dict[str, List[int]] = {}
+    for rid, (code, desc) in enumerate(read_csv_rows(csv_path)):
+        codes.append(code.encode("utf-8"))
+        descs.append(desc.encode("utf-8"))
+        for term in set(_TERM.findall(desc.lower())):
+            postings.setdefault(term, []).append(rid)
+
+    terms = sorted(postings)
+    post_counts, ids = [], []
+    for t in terms:
+        post_counts.append(len(ids))
+        ids.extend(postings[t])
+    post_counts.append(len(ids))
+
+    code_off, code_blob = _offsets(codes)
+    desc_off, desc_blob = _offsets(descs)
+    # terms are "\n"-separated so a substring match can never span two terms
+    term_off, term_blob = _offsets([t.encode("ascii") for t in terms], b"\n")
+    sections = [code_off, code_blob, desc_off, desc_blob, term_off, term_blob,
+                struct.pack(f"<{len(post_counts)}I", *post_counts), struct.pack(f"<{len(ids)}I", *ids)]
+
+    pos = _HEADER.size + _SECTION.size * len(sections)
+    table, body = [], []
+    for data in sections:
+        pad = -pos % 8  # keep u32 arrays aligned for memoryview.cast
+        body.append(b"\0" * pad)
+        pos += pad
+        table.append(_SECTION.pack(pos, len(data)))
+        body.append(data)
+        pos += len(data)
+
+    tmp = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(codes), len(terms), st.st_size, st.st_mtime_ns))
+        f.write(b"".join(table))
+        f.write(b"".join(body))
+    os.replace(tmp, out_path)
+    return {"path": out_path, "rows": len(codes), "terms": len(terms), "postings": len(ids), "bytes": pos}
+
+
+# ----------------------------
+# Read
+# ----------------------------
+
+class ICDCatalog:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.n_rows, self.n_terms, self.src_size, self.src_mtime_ns = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: not a v{VERSION} ICD catalog")
+        if sys.byteorder != "little":
+            raise ValueError("ICD catalog requires a little-endian host")
+        view = memoryview(self._mm)
+        self._views = [view]
+        sec, spans = {}, {}
+        for i, name in enumerate(_SECTIONS):
+            off, length = _SECTION.unpack_from(self._mm, _HEADER.size + i * _SECTION.size)
+            sec[name] = view[off:off + length]
+            self._views.append(sec[name])
+            spans[name] = (off, off + length)
+        self._code_off = sec["code_off"].cast("I")
+        self._code_blob = sec["code_blob"]
+        self._desc_off = sec["desc_off"].cast("I")
+        self._desc_blob = sec["desc_blob"]
+        self._term_off = sec["term_off"].cast("I")
+        # the term blob is searched with mmap.find() in place, never copied
+        self._term_base, self._term_end = spans["term_blob"]
+        self._post_off = sec["post_off"].cast("I")
+        # postings are read through numpy without copying out of the mapping
+        self._post_ids = np.frombuffer(self._mm, dtype="<u4", count=len(sec["post_ids"]) // 4,
+                                       offset=spans["post_ids"][0])
+        self._views += [self._code_off, self._desc_off, self._term_off, self._post_off]
+
+    def is_fresh(self, csv_path: str) -> bool:
+        try:
+            st = os.stat(csv_path)
+        except OSError:
+            return True  # catalog shipped without its source
+        return st.st_size == self.src_size and st.st_mtime_ns == self.src_mtime_ns
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    def code(self, rid: int) -> str:
+        return bytes(self._code_blob[self._code_off[rid]:self._code_off[rid + 1]]).decode("utf-8")
+
+    def description(self, rid: int) -> str:
+        return bytes(self._desc_blob[self._desc_off[rid]:self._desc_off[rid + 1]]).decode("utf-8")
+
+    def rows(self) -> Iterator[Tuple[str, str]]:
+        for rid in range(self.n_rows):
+            yield self.code(rid), self.description(rid)
+
+    def _postings(self, term_id: int) -> np.ndarray:
+        return self._post_ids[self._post_off[term_id]:self._post_off[term_id + 1]]
+
+    def terms_containing(self, token: str) -> List[int]:
+        """Ids of vocabulary terms that contain token ([a-z-] only) as a substring."""
+        needle = token.encode("ascii", "ignore")
+        if not needle or len(needle) != len(token):
+            return []
+        mm, base, end, offs = self._mm, self._term_base, self._term_end, self._term_off
+        out = []
+        pos = mm.find(needle, base, end)
+        while pos != -1:
+            tid = bisect_right(offs, pos - base) - 1
+            out.append(tid)
+            nxt = base + offs[tid + 1]
+            pos = mm.find(needle, nxt, end) if nxt < end else -1
+        return out
+
+    def rows_containing(self, token: str) -> np.ndarray:
+        """Sorted row ids whose lower-cased description contains token."""
+        tids = self.terms_containing(token)
+        if not tids:
+            return np.empty(0, dtype=np.uint32)
+        if len(tids) == 1:
+            return self._postings(tids[0])
+        return np.unique(np.concatenate([self._postings(t) for t in tids]))
+
+    def search(self, tokens: Iterable[str], top_n: int = 5) -> List[Dict[str, Any]]:
+        """Same result as assign_codes' CSV scan for the given candidate tokens."""
+        return self.search_many([tokens], top_n)[0]
+
+    def search_many(self, token_lists: Iterable[Iterable[str]], top_n: int = 5) -> List[List[Dict[str, Any]]]:
+        """search() for each token list, looking every distinct token up only once."""
+        lists = [list(tokens) for tokens in token_lists]
+        postings: Dict[str, np.ndarray] = {}
+        for tokens in lists:
+            for t in tokens:
+                if t not in postings:
+                    postings[t] = self.rows_containing(t)
+        out = []
+        for tokens in lists:
+            scores = np.zeros(self.n_rows, dtype=np.int32)
+            for t in tokens:
+                rows = postings[t]
+                if rows.size:
+                    scores[rows] += 1
+            out.append(self._top(scores, top_n))
+        return out
+
+    def _top(self, scores: np.ndarray, top_n: int) -> List[Dict[str, Any]]:
+        # best score first, then code, then file order; only the score levels
+        # that reach into the top_n need their codes decoded and sorted
+        picked: List[Tuple[int, str, int]] = []
+        for level in sorted(set(np.unique(scores[scores > 0]).tolist()), reverse=True):
+            if len(picked) >= top_n:
+                break
+            rids = np.nonzero(scores == level)[0].tolist()
+            picked += sorted(((level, self.code(r), r) for r in rids), key=lambda x: (x[1], x[2]))
+        return [{"code": code, "description": self.description(rid).lower(), "score": level}
+                for level, code, rid in picked[:top_n]]
+
+    def close(self) -> None:
+        self._post_ids = None  # drop numpy's export of the mapping before closing it
+        for mv in reversed(self._views):
+            mv.release()
+        self._mm.close()
+
+
+_open: Dict[str, ICDCatalog] = {}
+
+
+def open_catalog(csv_path: Optional[str] = None) -> Optional[ICDCatalog]:
+    """Mapped catalog for csv_path, or None if it has not been built or the CSV changed since."""
+    csv_path = str(csv_path or DEFAULT_CSV)
+    path = catalog_path(csv_path)
+    cat = _open.get(path)
+    if cat is not None and cat.is_fresh(csv_path):
+        return cat
+    if not os.path.exists(path):
+        return None
+    try:
+        cat = ICDCatalog(path)
+    except (OSError, ValueError):
+        return None
+    if not cat.is_fresh(csv_path):
+        return None
+    _open[path] = cat
+    return cat
+
+
+# ----------------------------
+# CLI
+# ----------------------------
+
+def _verify(csv_path: str, n: int, seed: int) -> int:
+    import random
+    from lite_pipeline import assign_codes
+    cat = open_catalog(csv_path)
+    if cat is None:
+        print("catalog missing or stale; run build first")
+        return 1
+    rng = random.Random(seed)
+    words = [w for _, d in read_csv_rows(csv_path) for w in re.findall(r"[A-Za-z][A-Za-z\-]{4,}", d)][:50000]
+    words += ["diabet", "hyper", "-type", "mellitus-x", "zzzzz"]
+    bad = 0
+    for _ in range(n):
+        note = " ".join(rng.choice(words) for _ in range(rng.randint(3, 60)))
+        want = assign_codes(note, Path(csv_path), use_catalog=False)
+        got = assign_codes(note, Path(csv_path))
+        if want != got:
+            bad += 1
+            if bad <= 5:
+                print(f"MISMATCH for {note[:80]!r}\n  csv    ={want}\n  catalog={got}")
+    print(f"{n - bad}/{n} match")
+    return 1 if bad else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Build / query the memory-mapped ICD-10 catalog")
+    sub = ap.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build")
+    b.add_argument("csv", nargs="?", default=DEFAULT_CSV)
+    b.add_argument("--out", default=None)
+    s = sub.add_parser("search")
+    s.add_argument("text")
+    s.add_argument("--csv", default=DEFAULT_CSV)
+    s.add_argument("--top", type=int, default=5)
+    v = sub.add_parser("verify")
+    v.add_argument("--csv", default=DEFAULT_CSV)
+    v.add_argument("--notes", type=int, default=200)
+    v.add_argument("--seed", type=int, default=0)
+    ns = ap.parse_args(argv)
+
+    if ns.command == "build":
+        t0 = time.perf_counter()
+        info = build(ns.csv, ns.out)
+        print(f"OK: {info['rows']} codes, {info['terms']} terms, {info['postings']} postings "
+              f"-> {info['path']} ({info['bytes'] / 1e6:.1f} MB, {time.perf_counter() - t0:.1f}s)")
+        return 0
+    if ns.command == "verify":
+        return _verify(ns.csv, ns.notes, ns.seed)
+    from lite_pipeline import assign_codes
+    t0 = time.perf_counter()
+    for m in assign_codes(ns.text, Path(ns.csv), top_n=ns.top):
+        print(f"{m['code']:<10} {m['score']:>3}  {m['description']}")
+    print(f"({(time.perf_counter() - t0) * 1000:.1f} ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,9 +7,22 @@ import logging
 from utils.validator import validate_payload
 from utils.retry import retry_with_backoff
 from titan_core.icd import search_icd
+from icd_catalog import candidate_tokens, open_catalog
+from ttl_cache import TTLCache
 
 logger = logging.getLogger("ICD")
 
+TOP_N = int(os.environ.get("TITAN_ICD_TOP_N", "5"))
+# "search_icd" (default): every query goes to titan_core.icd.search_icd.
+# "catalog": description-term queries go to the precompiled local catalog
+# (icd_catalog.py build, top TOP_N); code-like or short queries, and every
+# query while no catalog is built, still go to search_icd.
+BACKEND = os.environ.get("TITAN_ICD_BACKEND", "search_icd")
+
+# ICD search results barely change, so they live longer than lab summaries
+_cache = TTLCache(ttl=float(os.environ.get("TITAN_ICD_CACHE_TTL", "3600")),
+                  maxsize=int(os.environ.get("TITAN_ICD_CACHE_MAX", "5000")))
+
 def query_icd_codes(payload):
     if not validate_payload(payload, "icd_lookup"):
         logger.warning("⚠️ Invalid ICD payload")
@@ -17,4 +30,51 @@ def query_icd_codes(payload):
     query = payload.get("query", "")
     if not query:
         return []
+    # concurrent identical queries share one search
+    return _cache.get_or_load(query, lambda: _search(query))
+
+def _catalog():
+    return open_catalog() if BACKEND == "catalog" else None
+
+def _search(query):
+    catalog = _catalog()
+    tokens = candidate_tokens(query)
+    if catalog is not None and tokens:
+        return catalog.search(tokens, TOP_N)
     return retry_with_backoff(lambda: search_icd(query))
+
+def query_icd_codes_batch(queries):
+    """ICD results for many queries: {query: results}, same as query_icd_codes per query.
+
+    Queries are deduplicated and go to the same backend as query_icd_codes:
+    with the catalog backend, cache misses it can answer are searched together
+    in one catalog pass (each distinct term looked up once); the rest go to
+    search_icd once per distinct query.
+    """
+    out, missing = {}, []
+    for query in dict.fromkeys(queries):
+        if not query or not validate_payload({"query": query}, "icd_lookup"):
+            out[query] = query_icd_codes({"query": query})
+            continue
+        cached = _cache.get(query)
+        if cached is not None:
+            out[query] = cached
+        else:
+            missing.append(query)
+    catalog = _catalog() if missing else None
+    if catalog is not None:
+        searchable = [(q, candidate_tokens(q)) for q in missing]
+        searchable = [(q, tokens) for q, tokens in searchable if tokens]
+        for (query, _), results in zip(searchable, catalog.search_many([t for _, t in searchable], TOP_N)):
+            _cache.set(query, results)
+            out[query] = results
+    for query in missing:
+        if query not in out:
+            out[query] = query_icd_codes({"query": query})
+    return out
+
+def invalidate_icd_cache():
+    _cache.clear()
+
+def cache_stats():
+    return _cache.stats()
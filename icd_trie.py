@@ -0,0 +1,230 @@
+"""
+ICD-10 code trie over the catalog (icd/icd10_full.csv: code, description).
+
+Codes are keyed without the dot ("E11.621" -> E11621), one trie level per
+character, so the structure mirrors ICD-10 itself: category (3 chars) ->
+subcategory -> ... -> billable leaf.
+
+  lookup / contains / validate   O(code length)
+  children / descendants          proportional to the answer
+  parent / ancestors              O(code length)
+  autocomplete                    proportional to the prefix + results returned
+
+USAGE:
+  trie = load_trie()                      # cached; reloaded if the CSV changes
+  trie.children("E11.6")                  # ['E11.61', 'E11.62', 'E11.63', 'E11.64', 'E11.65', 'E11.69']
+  trie.parent("E11.621")                  # 'E11.62'
+  trie.autocomplete("E11.3", limit=5)     # [('E11.31', '...'), ...]
+  trie.invalid_codes(["E11.65", "Z68.25", "E11.7"])
+
+  python icd_trie.py children E11.6
+  python icd_trie.py parent E11.621
+  python icd_trie.py complete e113 --limit 10
+  python icd_trie.py validate E11.65 Z68.25 E11.7
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import argparse
+import csv
+import os
+import sys
+
+from icd_catalog import open_catalog
+
+DEFAULT_CSV = os.environ.get("TITAN_ICD_CSV") or str(Path(__file__).parent / "icd" / "icd10_full.csv")
+
+
+def normalize(code: str) -> str:
+    """'e11.621 ' -> 'E11621' (trie key)."""
+    return "".join(ch for ch in (code or "").upper() if ch.isalnum())
+
+
+def format_code(key: str) -> str:
+    """'E11621' -> 'E11.621'."""
+    return key if len(key) <= 3 else f"{key[:3]}.{key[3:]}"
+
+
+class _Node:
+    __slots__ = ("children", "description")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.description: Optional[str] = None  # set when a catalog code ends here
+
+
+class ICDTrie:
+    def __init__(self):
+        self.root = _Node()
+        self.size = 0
+
+    # ---------- build ----------
+    def add(self, code: str, description: str = "") -> None:
+        key = normalize(code)
+        if not key:
+            return
+        node = self.root
+        for ch in key:
+            nxt = node.children.get(ch)
+            if nxt is None:
+                nxt = node.children[ch] = _Node()
+            node = nxt
+        if node.description is None:
+            self.size += 1
+        node.description = description or ""
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[str, str]]) -> "ICDTrie":
+        trie = cls()
+        for code, desc in rows:
+            trie.add(code, desc)
+        return trie
+
+    @classmethod
+    def from_csv(cls, path: Optional[str] = None) -> "ICDTrie":
+        with open(path or DEFAULT_CSV, "r", encoding="utf-8", errors="ignore", newline="") as f:
+            return cls.from_rows(
+                (row[0].strip(), row[1].strip() if len(row) > 1 else "")
+                for row in csv.reader(f) if row and row[0].strip()
+            )
+
+    # ---------- point queries ----------
+    def _find(self, key: str) -> Optional[_Node]:
+        node = self.root
+        for ch in key:
+            node = node.children.get(ch)
+            if node is None:
+                return None
+        return node
+
+    def contains(self, code: str) -> bool:
+        node = self._find(normalize(code))
+        return node is not None and node.description is not None
+
+    __contains__ = contains
+
+    def description(self, code: str) -> Optional[str]:
+        node = self._find(normalize(code))
+        return node.description if node is not None else None
+
+    def is_billable(self, code: str) -> bool:
+        """In the catalog and nothing more specific below it."""
+        node = self._find(normalize(code))
+        return node is not None and node.description is not None and not node.children
+
+    def invalid_codes(self, codes: Iterable[str]) -> List[str]:
+        """Codes not present in the catalog, in input order."""
+        return [c for c in codes if not self.contains(c)]
+
+    # ---------- hierarchy ----------
+    def ancestors(self, code: str) -> List[str]:
+        """Catalog codes that are proper prefixes of code, category first."""
+        key = normalize(code)
+        out, node = [], self.root
+        for i, ch in enumerate(key[:-1]):
+            node = node.children.get(ch)
+            if node is None:
+                break
+            if node.description is not None:
+                out.append(format_code(key[:i + 1]))
+        return out
+
+    def parent(self, code: str) -> Optional[str]:
+        """Nearest catalog ancestor ('E11.621' -> 'E11.62', or 'E11.6' if E11.62 is not listed)."""
+        anc = self.ancestors(code)
+        return anc[-1] if anc else None
+
+    def _walk(self, node: _Node, key: str) -> Iterator[Tuple[str, _Node]]:
+        # preorder, lexical; yields (key, node) for catalog codes only
+        stack = [(key, node)]
+        while stack:
+            k, n = stack.pop()
+            if n.description is not None and k != key:
+                yield k, n
+            for ch in sorted(n.children, reverse=True):
+                stack.append((k + ch, n.children[ch]))
+
+    def children(self, code: str) -> List[str]:
+        """Nearest catalog codes below code (skipping levels absent from the catalog)."""
+        key = normalize(code)
+        node = self._find(key)
+        if node is None:
+            return []
+        out: List[str] = []
+        stack = [(key + ch, node.children[ch]) for ch in sorted(node.children, reverse=True)]
+        while stack:
+            k, n = stack.pop()
+            if n.description is not None:
+                out.append(format_code(k))
+                continue
+            stack.extend((k + ch, n.children[ch]) for ch in sorted(n.children, reverse=True))
+        return out
+
+    def descendants(self, code: str) -> List[str]:
+        key = normalize(code)
+        node = self._find(key)
+        return [format_code(k) for k, _ in self._walk(node, key)] if node is not None else []
+
+    def autocomplete(self, prefix: str, limit: int = 20) -> List[Tuple[str, str]]:
+        """Catalog codes starting with prefix (the prefix itself included), lexical order."""
+        key = normalize(prefix)
+        node = self._find(key)
+        if node is None:
+            return []
+        out: List[Tuple[str, str]] = []
+        if node.description is not None and key:
+            out.append((format_code(key), node.description))
+        for k, n in self._walk(node, key):
+            if len(out) >= limit:
+                break
+            out.append((format_code(k), n.description))
+        return out[:limit]
+
+    def __len__(self) -> int:
+        return self.size
+
+
+_loaded: Dict[str, Tuple[int, ICDTrie]] = {}
+
+
+def load_trie(path: Optional[str] = None) -> ICDTrie:
+    """Build the trie once per process (from the mmap catalog if built); rebuilt if the CSV changes."""
+    p = str(Path(path or DEFAULT_CSV).resolve())
+    mtime = os.stat(p).st_mtime_ns
+    hit = _loaded.get(p)
+    if hit and hit[0] == mtime:
+        return hit[1]
+    catalog = open_catalog(p)
+    trie = ICDTrie.from_rows(catalog.rows()) if catalog is not None else ICDTrie.from_csv(p)
+    _loaded[p] = (mtime, trie)
+    return trie
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Query the ICD-10 code hierarchy")
+    ap.add_argument("command", choices=["children", "descendants", "parent", "ancestors", "complete", "validate"])
+    ap.add_argument("codes", nargs="+")
+    ap.add_argument("--csv", default=None, help=f"catalog CSV (default: {DEFAULT_CSV})")
+    ap.add_argument("--limit", type=int, default=20)
+    ns = ap.parse_args(argv)
+
+    trie = load_trie(ns.csv)
+    if ns.command == "validate":
+        bad = trie.invalid_codes(ns.codes)
+        for c in ns.codes:
+            print(f"{c:<10} {'INVALID' if c in bad else trie.description(c)}")
+        return 1 if bad else 0
+    for code in ns.codes:
+        if ns.command == "complete":
+            for c, d in trie.autocomplete(code, ns.limit):
+                print(f"{c:<10} {d}")
+        elif ns.command in ("parent",):
+            print(trie.parent(code) or "-")
+        else:
+            for c in getattr(trie, ns.command)(code):
+                print(f"{c:<10} {trie.description(c)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
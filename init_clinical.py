@@ -27,6 +27,9 @@ CREATE TABLE IF NOT EXISTS titan.labs(
   test_name TEXT NOT NULL,
   value TEXT NOT NULL,
   unit TEXT,
+  value_num NUMERIC,
+  unit_canon TEXT,
+  test_canon TEXT,
   ref_range TEXT,
   result_date DATE NOT NULL,
   source_note UUID,
@@ -57,11 +60,11 @@ CREATE TABLE IF NOT EXISTS titan.cardio_tests(
 );
 
 CREATE OR REPLACE VIEW titan.v_latest_lab AS
-SELECT DISTINCT ON (user_id, test_code)
-  user_id, test_code, test_name, value, unit, result_date
+SELECT DISTINCT ON (user_id, test_canon)
+  user_id, test_code, test_name, value, unit, result_date, value_num, unit_canon, test_canon
 FROM titan.labs
 WHERE result_date IS NOT NULL
-ORDER BY user_id, test_code, result_date DESC, recorded_at DESC;
+ORDER BY user_id, test_canon, result_date DESC, recorded_at DESC;
 
 CREATE OR REPLACE VIEW titan.v_latest_procedure AS
 SELECT DISTINCT ON (user_id, proc_type)
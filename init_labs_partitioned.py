@@ -0,0 +1,80 @@
+import os, psycopg2
+# Optional schema variant: titan.labs range-partitioned by result_date (one partition per year).
+# Safe to re-run. An existing heap titan.labs is renamed to titan.labs_heap and copied over;
+# drop titan.labs_heap by hand once the copy has been checked. Re-run lab_units.py afterwards
+# so the normalization trigger is attached to the partitioned table.
+DDL = r"""
+DO $$
+BEGIN
+  IF to_regclass('titan.labs') IS NOT NULL
+     AND NOT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'titan.labs'::regclass) THEN
+    ALTER TABLE titan.labs RENAME TO labs_heap;
+    ALTER INDEX IF EXISTS titan.labs_pkey RENAME TO labs_heap_pkey;
+    ALTER INDEX IF EXISTS titan.labs_user_test_date_idx RENAME TO labs_heap_user_test_date_idx;
+    ALTER INDEX IF EXISTS titan.labs_user_test_canon_date_idx RENAME TO labs_heap_user_test_canon_date_idx;
+  END IF;
+END $$;
+
+CREATE TABLE IF NOT EXISTS titan.labs(
+  lab_id UUID NOT NULL DEFAULT gen_random_uuid(),
+  user_id UUID NOT NULL REFERENCES titan.users(user_id) ON DELETE CASCADE,
+  test_code TEXT,
+  test_name TEXT NOT NULL,
+  value TEXT NOT NULL,
+  unit TEXT,
+  value_num NUMERIC,
+  unit_canon TEXT,
+  test_canon TEXT,
+  ref_range TEXT,
+  result_date DATE NOT NULL,
+  source_note UUID,
+  recorded_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (lab_id, result_date)   -- partition key must be part of the PK
+) PARTITION BY RANGE (result_date);
+
+CREATE TABLE IF NOT EXISTS titan.labs_default PARTITION OF titan.labs DEFAULT;
+
+-- Yearly partitions covering existing data (if any) through next year
+DO $$
+DECLARE y INT; y0 INT; y1 INT;
+BEGIN
+  y1 := extract(year FROM current_date)::int + 1;
+  y0 := y1 - 1;
+  IF to_regclass('titan.labs_heap') IS NOT NULL THEN
+    EXECUTE 'SELECT COALESCE(min(extract(year FROM result_date))::int, $1) FROM titan.labs_heap'
+      INTO y0 USING y0;
+  END IF;
+  FOR y IN y0..y1 LOOP
+    EXECUTE format(
+      'CREATE TABLE IF NOT EXISTS titan.labs_y%s PARTITION OF titan.labs FOR VALUES FROM (%L) TO (%L)',
+      y, make_date(y, 1, 1), make_date(y + 1, 1, 1));
+  END LOOP;
+END $$;
+
+ALTER TABLE titan.labs ADD COLUMN IF NOT EXISTS test_canon TEXT;  -- partitioned by an earlier run
+DROP INDEX IF EXISTS titan.labs_user_test_date_idx;                -- keyed on the raw test_code
+CREATE INDEX IF NOT EXISTS labs_user_test_canon_date_idx
+  ON titan.labs (user_id, test_canon, result_date DESC, recorded_at DESC);
+
+DO $$
+BEGIN
+  IF to_regclass('titan.labs_heap') IS NOT NULL THEN
+    INSERT INTO titan.labs (lab_id, user_id, test_code, test_name, value, unit, ref_range, result_date, source_note, recorded_at)
+    SELECT h.lab_id, h.user_id, h.test_code, h.test_name, h.value, h.unit, h.ref_range, h.result_date, h.source_note, h.recorded_at
+      FROM titan.labs_heap h
+     WHERE NOT EXISTS (SELECT 1 FROM titan.labs l WHERE l.lab_id = h.lab_id AND l.result_date = h.result_date);
+  END IF;
+END $$;
+
+-- Rebind the helper view to the partitioned table
+CREATE OR REPLACE VIEW titan.v_latest_lab AS
+SELECT DISTINCT ON (user_id, test_canon)
+  user_id, test_code, test_name, value, unit, result_date, value_num, unit_canon, test_canon
+FROM titan.labs
+WHERE result_date IS NOT NULL
+ORDER BY user_id, test_canon, result_date DESC, recorded_at DESC;
+"""
+dsn=os.environ["DATABASE_URL"]
+with psycopg2.connect(dsn) as c, c.cursor() as cur:
+    cur.execute(DDL); c.commit()
+print("OK: titan.labs partitioned by result_date")
@@ -0,0 +1,284 @@
+"""
+Lab and vital values from note text -> titan.labs rows.
+
+extract_labs() makes one pass (a single bounded regex, linear time) over the
+Objective section, or the whole note if it has none, and returns rows keyed
+like lab_ingest's staging table: A1c, UACR, eGFR, LDL, glucose, creatinine,
+BMI and BP (as SBP + DBP rows), with the unit and date written next to the
+value. Values outside a plausible range for the test (after unit conversion,
+lab_units) are dropped, so "A1c 2023" is not a result.
+
+LabBuffer collects rows from many notes and bulk-loads them with
+lab_ingest.load_rows (COPY + dedup merge), filling user_id/handle,
+source_note and the encounter date for rows without their own date. With
+commit=False the rows are written inside the caller's transaction; the
+caller commits them together with its own writes and then calls
+lab_ingest.notify_written(buf.totals["user_ids"]).
+
+USAGE:
+  rows = extract_labs(note_md, default_date=dos)
+  with LabBuffer(conn) as buf:            # flushes every max_rows and on exit
+      buf.add(rows, user_id=uid, source_note=note_id)
+
+  python lab_extract.py note.md --date 2025-03-14
+  python lab_extract.py note.md --date 2025-03-14 --handle demo_builder --load
+
+ENV:
+  TITAN_LAB_BUFFER_ROWS=500    rows buffered before LabBuffer flushes
+"""
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+import argparse
+import datetime
+import json
+import os
+import re
+import sys
+import threading
+
+from lab_units import canon_test_code, normalize
+from metrics import counter
+
+LABS_EXTRACTED = counter("titan_labs_extracted_total", "Lab/vital values extracted from note text", ["test"])
+LABS_LOADED = counter("titan_labs_loaded_total", "Extracted lab rows flushed to titan.labs", ["outcome"])
+
+BUFFER_ROWS = int(os.environ.get("TITAN_LAB_BUFFER_ROWS", "500"))
+
+TEST_NAMES = {
+    "A1C": "Hemoglobin A1c",
+    "UACR": "Urine albumin/creatinine ratio",
+    "EGFR": "eGFR",
+    "LDL": "LDL cholesterol",
+    "GLU": "Glucose",
+    "CREAT": "Creatinine",
+    "BMI": "BMI",
+    "SBP": "Systolic blood pressure",
+    "DBP": "Diastolic blood pressure",
+}
+
+# plausible range per test, in the canonical unit (lab_units.UNIT_CONVERSIONS)
+PLAUSIBLE: Dict[str, Tuple[float, float]] = {
+    "A1C": (3.0, 20.0),
+    "UACR": (0.0, 10000.0),
+    "EGFR": (1.0, 200.0),
+    "LDL": (5.0, 600.0),
+    "GLU": (10.0, 2000.0),
+    "CREAT": (0.1, 25.0),
+    "BMI": (10.0, 100.0),
+    "SBP": (50.0, 300.0),
+    "DBP": (20.0, 200.0),
+}
+
+# Section headers on their own line ("Objective", "## O:", "Assessment & Plan -")
+# or leading a line ("O: BP 142/82 ...").
+_HEADER = re.compile(
+    r"(?im)^[ \t]{0,8}#{0,2}[ \t]{0,4}"
+    r"(?:(?P<word>subjective|objective|assessment(?:[ \t]{0,2}&[ \t]{0,2}plan)?|plan|follow-?up)[ \t]*(?:[:\-]|$)"
+    r"|(?P<letter>[soap])[ \t]{0,2}:)"
+)
+
+# Every quantifier is bounded, so a failed attempt costs a constant amount.
+_LAB = re.compile(
+    r"(?i)\b(?P<test>hb[ \t]?a1c|hgb[ \t]?a1c|a1c|u?acr|e?gfr|ldl(?:-c)?|glucose|creatinine|bmi|bp|blood pressure)\b"
+    r"[ \t]{0,3}(?:(?:was|is|of|=|:)[ \t]{0,3}){0,2}"
+    r"(?:(?P<sbp>\d{2,3})[ \t]{0,2}/[ \t]{0,2}(?P<dbp>\d{2,3})\b"
+    r"|(?P<value>[<>≤≥]?=?[ \t]?\d{1,5}(?:\.\d{1,3})?))"
+    r"(?:[ \t]{0,2}(?P<unit>%|mg/g|mg/mmol|mcg/mg|ug/mg|mg/dl|mmol/mol|mmol/l|[uµ]mol/l"
+    r"|ml/min(?:/1\.73[ \t]?m(?:\^?2|²))?|kg/m(?:\^?2|²)|mm[ \t]?hg))?"
+    r"(?:[ \t]{0,3}(?:on|from|dated|\(|,|@)?[ \t]{0,3}(?P<date>\d{4}-\d{1,2}-\d{1,2}|\d{1,2}/\d{1,2}/(?:\d{4}|\d{2}))\b)?"
+)
+
+DateLike = Union[str, datetime.date, None]
+
+
+def objective_text(md: str) -> str:
+    """Text of the Objective section(s); the whole note if there is no Objective header."""
+    parts, start = [], None
+    for m in _HEADER.finditer(md):
+        key = (m.group("word") or m.group("letter")).lower()
+        if start is not None:
+            parts.append(md[start:m.start()])
+            start = None
+        if key in ("objective", "o"):
+            start = m.end()
+    if start is not None:
+        parts.append(md[start:])
+    return "\n".join(parts) if parts else md
+
+
+def parse_date(text: DateLike) -> Optional[str]:
+    """'2025-03-14', '3/14/2025', '3/14/25' or a date -> ISO string (None if invalid)."""
+    if text is None or isinstance(text, datetime.date):
+        return text.isoformat() if text is not None else None
+    try:
+        if "-" in text:
+            y, mo, d = (int(x) for x in text.split("-"))
+        else:
+            mo, d, y = (int(x) for x in text.split("/"))
+            if y < 100:
+                y += 2000
+        return datetime.date(y, mo, d).isoformat()
+    except ValueError:
+        return None
+
+
+def _plausible(code: str, value: str, unit: Optional[str]) -> bool:
+    num, canon = normalize(code, value, unit)
+    if num is None:
+        return False
+    if canon is None and unit:
+        return False  # unit that does not belong to this test
+    lo, hi = PLAUSIBLE[code]
+    return lo <= num <= hi
+
+
+def _row(code: str, value: str, unit: Optional[str], date: Optional[str]) -> Dict[str, Any]:
+    return {
+        "handle": None,
+        "user_id": None,
+        "test_code": code,
+        "test_name": TEST_NAMES[code],
+        "value": value,
+        "unit": unit,
+        "ref_range": None,
+        "result_date": date,
+        "source_note": None,
+    }
+
+
+def extract_labs(md: str, default_date: DateLike = None, section_only: bool = True) -> List[Dict[str, Any]]:
+    """Lab/vital rows found in the note (one per test/value/date, in text order)."""
+    if not md:
+        return []
+    text = objective_text(md) if section_only else md
+    fallback = parse_date(default_date)
+    rows: List[Dict[str, Any]] = []
+    seen = set()
+    for m in _LAB.finditer(text):
+        test = m.group("test").lower()
+        unit = m.group("unit")
+        if unit:
+            unit = unit.replace("²", "2").replace("µ", "u").replace(" ", "").replace("\t", "")
+        date = parse_date(m.group("date")) if m.group("date") else fallback
+        if test in ("bp", "blood pressure"):
+            if m.group("sbp") is None:
+                continue
+            found = [("SBP", m.group("sbp")), ("DBP", m.group("dbp"))]
+            unit = "mmHg"
+        else:
+            code = canon_test_code(test)
+            if code is None or m.group("value") is None:
+                continue
+            found = [(code, re.sub(r"[ \t]", "", m.group("value")))]
+        for code, value in found:
+            if not _plausible(code, value, unit):
+                continue
+            key = (code, value, date)
+            if key in seen:
+                continue
+            seen.add(key)
+            rows.append(_row(code, value, unit, date))
+            LABS_EXTRACTED.inc(test=code)
+    return rows
+
+
+class LabBuffer:
+    """Buffers extracted rows and bulk-loads them into titan.labs (lab_ingest.load_rows)."""
+
+    def __init__(self, conn, max_rows: int = BUFFER_ROWS, commit: bool = True):
+        self.conn = conn
+        self.max_rows = max_rows
+        self.commit = commit
+        self._rows: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self.totals: Dict[str, Any] = {"staged": 0, "inserted": 0, "undated": 0, "unresolved_handles": [],
+                                       "user_ids": []}
+
+    def add(self, rows: Iterable[Dict[str, Any]], user_id: Optional[str] = None, handle: Optional[str] = None,
+            source_note: Optional[str] = None, default_date: DateLike = None) -> int:
+        """Queue rows for one patient/note; rows without any date are skipped. Returns rows queued."""
+        fallback = parse_date(default_date)
+        queued = []
+        for r in rows:
+            r = dict(r)
+            r["user_id"] = r.get("user_id") or user_id
+            r["handle"] = r.get("handle") or handle
+            r["source_note"] = r.get("source_note") or source_note
+            r["result_date"] = r.get("result_date") or fallback
+            if r["result_date"] is None:
+                self.totals["undated"] += 1
+                continue
+            queued.append(r)
+        with self._lock:
+            self._rows.extend(queued)
+            full = len(self._rows) >= self.max_rows
+        if full:
+            self.flush()
+        return len(queued)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def flush(self) -> Dict[str, Any]:
+        from lab_ingest import load_rows
+
+        with self._lock:
+            rows, self._rows = self._rows, []
+            if not rows:
+                return {"staged": 0, "inserted": 0, "unresolved_handles": [], "user_ids": []}
+            try:
+                stats = load_rows(self.conn, rows, commit=self.commit)
+            except Exception:
+                if self.commit:  # otherwise the transaction is the caller's to roll back
+                    self.conn.rollback()
+                LABS_LOADED.inc(len(rows), outcome="error")
+                raise
+        LABS_LOADED.inc(stats["inserted"], outcome="inserted")
+        LABS_LOADED.inc(stats["staged"] - stats["inserted"], outcome="skipped")
+        self.totals["staged"] += stats["staged"]
+        self.totals["inserted"] += stats["inserted"]
+        self.totals["unresolved_handles"] = sorted(set(self.totals["unresolved_handles"]) | set(stats["unresolved_handles"]))
+        self.totals["user_ids"] = sorted(set(self.totals["user_ids"]) | set(stats["user_ids"]))
+        return stats
+
+    def __enter__(self) -> "LabBuffer":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.flush()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Extract lab/vital values from a note")
+    ap.add_argument("path", help="note file (Markdown/TXT); '-' for stdin")
+    ap.add_argument("--date", help="date for values without one (e.g. the encounter date)")
+    ap.add_argument("--whole-note", action="store_true", help="scan the whole note, not just Objective")
+    ap.add_argument("--load", action="store_true", help="bulk-load into titan.labs (DATABASE_URL)")
+    ap.add_argument("--handle", help="patient handle (with --load)")
+    ap.add_argument("--user-id", help="patient user_id (with --load)")
+    ap.add_argument("--source-note", help="titan.notes note_id (with --load)")
+    ns = ap.parse_args(argv)
+
+    text = sys.stdin.read() if ns.path == "-" else open(ns.path, "r", encoding="utf-8", errors="replace").read()
+    rows = extract_labs(text, default_date=ns.date, section_only=not ns.whole_note)
+    if not ns.load:
+        print(json.dumps(rows, indent=2))
+        return 0
+    if not (ns.handle or ns.user_id):
+        ap.error("--load needs --handle or --user-id")
+
+    import psycopg2
+    with psycopg2.connect(os.environ["DATABASE_URL"]) as conn:
+        buf = LabBuffer(conn)
+        buf.add(rows, user_id=ns.user_id, handle=ns.handle, source_note=ns.source_note)
+        stats = buf.flush()
+    print(f"OK: extracted={len(rows)} staged={stats['staged']} inserted={stats['inserted']} undated={buf.totals['undated']}")
+    if stats["unresolved_handles"]:
+        print("  unresolved handles: " + ", ".join(stats["unresolved_handles"]))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""
+Bulk lab ingestion for titan.labs.
+
+Streams CSV lab extracts into a temp staging table with COPY, resolves
+user_id with one join against titan.users, and inserts only rows that are not
+already present in titan.labs.
+
+Expected CSV header (extra columns are not allowed, order must match):
+  handle,test_code,test_name,value,unit,ref_range,result_date
+
+After each commit the user_ids that got new rows are passed to the write
+listeners (add_write_listener), so in-process caches such as lab_summary's
+drop those patients instead of serving stale summaries.
+
+USAGE:
+  python lab_ingest.py labs_2025_q1.csv labs_2025_q2.csv
+  python lab_ingest.py --delimiter ";" extract.csv
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+import argparse
+import os
+import sys
+
+import psycopg2
+
+CSV_COLUMNS = ["handle", "test_code", "test_name", "value", "unit", "ref_range", "result_date"]
+
+STAGE_DDL = r"""
+CREATE TEMP TABLE IF NOT EXISTS labs_stage(
+  handle TEXT,
+  user_id UUID,
+  test_code TEXT,
+  test_name TEXT,
+  value TEXT,
+  unit TEXT,
+  ref_range TEXT,
+  result_date DATE,
+  source_note UUID
+) ON COMMIT DELETE ROWS;
+"""
+
+# Resolve user_id for handle-keyed rows in one set-based pass.
+RESOLVE_SQL = r"""
+UPDATE labs_stage s
+   SET user_id = u.user_id
+  FROM titan.users u
+ WHERE s.user_id IS NULL
+   AND u.handle = s.handle;
+"""
+
+# Dedup within the batch (DISTINCT ON) and against rows already in titan.labs.
+# result_date is part of the probe so partitioned tables only touch the
+# partitions the batch actually covers.
+MERGE_SQL = r"""
+INSERT INTO titan.labs (user_id, test_code, test_name, value, unit, ref_range, result_date, source_note)
+SELECT DISTINCT ON (s.user_id, s.test_code, s.result_date, s.value)
+       s.user_id, s.test_code, s.test_name, s.value, s.unit, s.ref_range, s.result_date, s.source_note
+  FROM labs_stage s
+ WHERE s.user_id IS NOT NULL
+   AND s.result_date IS NOT NULL
+   AND NOT EXISTS (
+         SELECT 1 FROM titan.labs l
+          WHERE l.user_id = s.user_id
+            AND l.result_date = s.result_date
+            AND l.test_code IS NOT DISTINCT FROM s.test_code
+            AND l.value = s.value
+       )
+ ORDER BY s.user_id, s.test_code, s.result_date, s.value
+RETURNING user_id;
+"""
+
+UNRESOLVED_SQL = r"""
+SELECT DISTINCT handle FROM labs_stage WHERE user_id IS NULL ORDER BY handle;
+"""
+
+# Only relevant when titan.labs was created by init_labs_partitioned.py:
+# make sure a yearly partition exists for every year present in the batch,
+# so nothing lands in the default partition.
+ENSURE_PARTITIONS_SQL = r"""
+DO $$
+DECLARE y INT;
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'titan.labs'::regclass) THEN
+    RETURN;
+  END IF;
+  FOR y IN SELECT DISTINCT extract(year FROM result_date)::int FROM labs_stage WHERE result_date IS NOT NULL LOOP
+    EXECUTE format(
+      'CREATE TABLE IF NOT EXISTS titan.labs_y%s PARTITION OF titan.labs FOR VALUES FROM (%L) TO (%L)',
+      y, make_date(y, 1, 1), make_date(y + 1, 1, 1));
+  END LOOP;
+END $$;
+"""
+
+
+# fn(user_ids) after new rows for those patients are committed
+_listeners: List[Callable[[List[str]], None]] = []
+
+
+def add_write_listener(fn: Callable[[List[str]], None]) -> None:
+    if fn not in _listeners:
+        _listeners.append(fn)
+
+
+def notify_written(user_ids: Iterable[object]) -> None:
+    """Tell listeners these patients have new labs; call after the rows are committed."""
+    ids = sorted({str(u) for u in user_ids})
+    if not ids:
+        return
+    for fn in _listeners:
+        try:
+            fn(ids)
+        except Exception:  # a listener must never break the writer
+            pass
+
+
+def _merge_stage(cur) -> Dict[str, object]:
+    cur.execute(RESOLVE_SQL)
+    cur.execute(UNRESOLVED_SQL)
+    unresolved = [r[0] for r in cur.fetchall()]
+    cur.execute(ENSURE_PARTITIONS_SQL)
+    cur.execute(MERGE_SQL)
+    inserted = cur.rowcount
+    user_ids = sorted({str(r[0]) for r in cur.fetchall()})
+    return {"inserted": inserted, "unresolved_handles": unresolved, "user_ids": user_ids}
+
+
+def load_csv(conn, path: Path, delimiter: str = ",") -> Dict[str, object]:
+    """COPY one CSV extract into titan.labs inside a single transaction."""
+    copy_sql = (
+        f"COPY labs_stage ({', '.join(CSV_COLUMNS)}) FROM STDIN "
+        f"WITH (FORMAT csv, HEADER true, DELIMITER {_quote_literal(delimiter)})"
+    )
+    with conn.cursor() as cur:
+        cur.execute(STAGE_DDL)
+        with path.open("r", encoding="utf-8", newline="") as f:
+            cur.copy_expert(copy_sql, f)
+        cur.execute("SELECT count(*) FROM labs_stage")
+        staged = cur.fetchone()[0]
+        stats = _merge_stage(cur)
+    conn.commit()
+    notify_written(stats["user_ids"])
+    stats["staged"] = staged
+    return stats
+
+
+def load_rows(conn, rows: Iterable[Dict[str, object]], commit: bool = True) -> Dict[str, object]:
+    """COPY already-parsed rows (dicts keyed like the staging table) into titan.labs.
+
+    Rows may carry either `handle` or `user_id`; `source_note` is optional.
+    With commit=False the rows join the caller's open transaction and the
+    caller commits (or rolls back) them with its own writes, then calls
+    notify_written(stats["user_ids"]).
+    """
+    import csv
+    import io
+
+    cols = ["handle", "user_id", "test_code", "test_name", "value", "unit", "ref_range", "result_date", "source_note"]
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    staged = 0
+    for r in rows:
+        w.writerow(["" if r.get(c) is None else r.get(c) for c in cols])
+        staged += 1
+    if not staged:
+        return {"staged": 0, "inserted": 0, "unresolved_handles": [], "user_ids": []}
+    buf.seek(0)
+    with conn.cursor() as cur:
+        cur.execute(STAGE_DDL)
+        cur.copy_expert(f"COPY labs_stage ({', '.join(cols)}) FROM STDIN WITH (FORMAT csv)", buf)
+        stats = _merge_stage(cur)
+        if not commit:
+            # ON COMMIT DELETE ROWS only empties the stage at commit; the next call may share the transaction
+            cur.execute("TRUNCATE labs_stage")
+    if commit:
+        conn.commit()
+        notify_written(stats["user_ids"])
+    stats["staged"] = staged
+    return stats
+
+
+def _quote_literal(s: str) -> str:
+    return "'" + s.replace("'", "''") + "'"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Bulk-load lab CSV extracts into titan.labs via COPY")
+    ap.add_argument("paths", nargs="+", help="CSV files with header: " + ",".join(CSV_COLUMNS))
+    ap.add_argument("--delimiter", default=",")
+    ns = ap.parse_args(argv)
+
+    dsn = os.environ["DATABASE_URL"]
+    rc = 0
+    with psycopg2.connect(dsn) as conn:
+        for p in ns.paths:
+            path = Path(p)
+            try:
+                stats = load_csv(conn, path, ns.delimiter)
+            except psycopg2.Error as e:
+                conn.rollback()
+                print(f"ERROR: {path.name}: {e.pgerror or e}")
+                rc = 4
+                continue
+            print(f"OK: {path.name} staged={stats['staged']} inserted={stats['inserted']}")
+            if stats["unresolved_handles"]:
+                print(f"  unresolved handles ({len(stats['unresolved_handles'])}): "
+                      + ", ".join(stats["unresolved_handles"][:20]))
+    return rc
+
+
+if __name__ == "__main__":
+    sys.exit(main())
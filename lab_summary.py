@@ -5,22 +5,119 @@ if _root not in sys.path:
 from db.neon_wrapper import run_query
 from utils.validator import validate_payload
 from utils.retry import retry_with_backoff
+from db_profile import profiled
+from lab_ingest import add_write_listener
+from ttl_cache import TTLCache
+from collections.abc import Mapping
 import logging
+import uuid
+
+run_query = profiled(run_query)
 
 logger = logging.getLogger("LabSummary")
 
+# Constant statement text + bound parameters, so the server sees one statement
+# shape instead of a new literal query per patient. Reads titan.labs, the table
+# lab_ingest and run_chart write (patient_id is titan.users.user_id), so their
+# write listener below invalidates exactly what is cached here.
+LAB_SUMMARY_SQL = """
+    SELECT test_name, value AS result, unit AS units, result_date AS timestamp
+    FROM titan.labs
+    WHERE user_id = %s::uuid
+    ORDER BY result_date DESC, recorded_at DESC
+    LIMIT 20
+"""
+
+# Same 20-most-recent cut for N patients in one round-trip.
+LAB_SUMMARY_BATCH_SQL = """
+    SELECT patient_id, test_name, result, units, timestamp
+    FROM (
+        SELECT user_id::text AS patient_id, test_name, value AS result, unit AS units,
+               result_date AS timestamp, recorded_at,
+               row_number() OVER (PARTITION BY user_id ORDER BY result_date DESC, recorded_at DESC) AS rn
+        FROM titan.labs
+        WHERE user_id = ANY(%s::uuid[])
+    ) ranked
+    WHERE rn <= 20
+    ORDER BY patient_id, timestamp DESC, recorded_at DESC
+"""
+
+_cache = TTLCache(ttl=float(os.environ.get("TITAN_LAB_CACHE_TTL", "60")),
+                  maxsize=int(os.environ.get("TITAN_LAB_CACHE_MAX", "10000")))
+
 def fetch_lab_summary(payload):
     if not validate_payload(payload, "lab_summary"):
         logger.warning("âš ï¸ Invalid lab summary payload")
         return None
 
-    query = f"""
-        SELECT test_name, result, units, timestamp
-        FROM labs
-        WHERE patient_id = '{payload['patient_id']}'
-        ORDER BY timestamp DESC
-        LIMIT 20
-    """
+    patient_id = _user_id(payload["patient_id"])
+    if patient_id is None:
+        return []  # not a titan.users id, so no rows in titan.labs
+    # concurrent requests for the same patient share one query
+    return _cache.get_or_load(
+        patient_id, lambda: retry_with_backoff(lambda: run_query(LAB_SUMMARY_SQL, (patient_id,))))
+
+def fetch_lab_summaries(patient_ids):
+    """Lab summaries for many patients: {patient_id: rows}. Cache misses share one query."""
+    out, missing = {}, {}  # missing: canonical user_id -> the caller's ids for it
+    for pid in dict.fromkeys(patient_ids):
+        if not validate_payload({"patient_id": pid}, "lab_summary"):
+            logger.warning("âš ï¸ Invalid lab summary payload")
+            out[pid] = None
+            continue
+        key = _user_id(pid)
+        if key is None:
+            out[pid] = []
+            continue
+        cached = _cache.get(key)
+        if cached is not None:
+            out[pid] = cached
+        else:
+            missing.setdefault(key, []).append(pid)
+    if not missing:
+        return out
+
+    keys = list(missing)
+    rows = retry_with_backoff(lambda: run_query(LAB_SUMMARY_BATCH_SQL, (keys,)))
+    if rows is None:
+        out.update((pid, None) for pids in missing.values() for pid in pids)
+        return out
+
+    grouped = {key: [] for key in keys}
+    for row in rows:
+        key, rest = _split_patient(row)
+        grouped.setdefault(str(key), []).append(rest)
+    for key, pids in missing.items():
+        _cache.set(key, grouped[key])
+        out.update((pid, grouped[key]) for pid in pids)
+    return out
+
+def invalidate_lab_summary(*patient_ids):
+    """Drop cached summaries after new labs are written (all patients if none given)."""
+    if not patient_ids:
+        _cache.clear()
+    for pid in patient_ids:
+        key = _user_id(pid)
+        if key is not None:
+            _cache.invalidate(key)
 
-    return retry_with_backoff(lambda: run_query(query))
+# lab writers (lab_ingest.load_rows/load_csv, run_chart's LabBuffer) report patients with new rows
+add_write_listener(lambda user_ids: invalidate_lab_summary(*user_ids))
+
+def cache_stats():
+    return _cache.stats()
+
+def _user_id(patient_id):
+    """Canonical text form of a titan.users.user_id (the cache key), None if not a UUID."""
+    try:
+        return str(uuid.UUID(str(patient_id)))
+    except ValueError:
+        return None
+
+def _split_patient(row):
+    # batch rows carry patient_id first; strip it so rows match fetch_lab_summary's shape
+    if isinstance(row, Mapping):
+        rest = dict(row)
+        return rest.pop("patient_id"), rest
+    return row[0], type(row)(row[1:])
 
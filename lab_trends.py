@@ -0,0 +1,240 @@
+"""
+Per-patient lab trends over titan.labs.
+
+One set-based query computes, for every (patient, test), over the last N
+results: the latest value and date, the values themselves, the mean, a
+rolling mean of the most recent K, the least-squares slope per year
+(regr_slope), the rate of change between the last two results, and days
+since the last result. Only typed rows in the test's canonical unit are used
+(value_num/unit_canon, see lab_units.py), so mg/dL and mmol/L never mix; tests
+are matched on test_canon, so aliases come from titan.lab_test_map and the
+labs_user_test_canon_date_idx order is usable, as in dm2_panel_job.
+
+Results are cached per patient and stamped with (count, max(recorded_at)) of
+their titan.labs rows; a lookup re-checks the stamps in one cheap grouped
+query and recomputes only patients whose labs changed.
+
+USAGE:
+  trends = get_trends(conn, [user_id], tests=["A1C", "EGFR"])
+  trends[user_id]["EGFR"]["slope_per_year"]        # e.g. -6.2 (mL/min/1.73m2 per year)
+
+  python lab_trends.py                               # whole panel, A1C/EGFR/UACR/LDL -> Output/lab_trends.csv
+  python lab_trends.py --tests A1C EGFR --last 6 --rolling 3 --csv Output/a1c_egfr_trends.csv
+  python lab_trends.py --handle demo_builder --json
+
+ENV:
+  TITAN_TREND_CACHE_TTL=86400   seconds a cached patient is trusted without re-checking its stamp
+  TITAN_TREND_CACHE_MAX=100000  patients kept
+"""
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from db_profile import profiled_cursor
+from lab_units import UNIT_CONVERSIONS
+from ttl_cache import TTLCache
+
+DEFAULT_TESTS = ["A1C", "EGFR", "UACR", "LDL"]
+LAST_N = 5
+ROLLING_K = 3
+
+# eGFR falling faster than this (per year, over >= 3 results) is flagged (KDIGO rapid progression)
+RAPID_EGFR_DECLINE = -5.0
+# A1c rising faster than this (percentage points per year, over >= 3 results) is flagged
+A1C_RISE = 0.5
+
+TRENDS_SQL = """
+WITH keys(test, unit_canon) AS (
+    SELECT * FROM unnest(%(tests)s::text[], %(units)s::text[])
+), ranked AS (
+    SELECT l.user_id, k.test, l.result_date, l.value_num::float8 AS v,
+           row_number() OVER (PARTITION BY l.user_id, k.test
+                              ORDER BY l.result_date DESC, l.recorded_at DESC) AS rn
+      FROM titan.labs l
+      JOIN keys k ON k.test = l.test_canon AND k.unit_canon = l.unit_canon
+     WHERE l.value_num IS NOT NULL
+       AND (%(all)s OR l.user_id = ANY(%(users)s::uuid[]))
+)
+SELECT user_id, test,
+       count(*)                                                  AS n,
+       (array_agg(v ORDER BY rn))[1]                             AS last_value,
+       max(result_date)                                          AS last_date,
+       (array_agg(v ORDER BY rn))[2]                             AS prev_value,
+       (array_agg(result_date ORDER BY rn))[2]                   AS prev_date,
+       avg(v)                                                    AS mean,
+       avg(v) FILTER (WHERE rn <= %(k)s)                         AS rolling_mean,
+       regr_slope(v, (result_date - DATE '2000-01-01') / 365.25) AS slope_per_year,
+       current_date - max(result_date)                           AS days_since_last,
+       array_agg(v ORDER BY rn)                                  AS last_values,
+       array_agg(result_date ORDER BY rn)                        AS last_dates
+  FROM ranked
+ WHERE rn <= %(n)s
+ GROUP BY user_id, test
+"""
+
+STAMPS_SQL = """
+SELECT user_id, count(*) AS n, max(recorded_at) AS last_recorded
+  FROM titan.labs
+ WHERE (%(all)s OR user_id = ANY(%(users)s::uuid[]))
+ GROUP BY user_id
+"""
+
+_cache = TTLCache(ttl=float(os.environ.get("TITAN_TREND_CACHE_TTL", "86400")),
+                  maxsize=int(os.environ.get("TITAN_TREND_CACHE_MAX", "100000")))
+
+
+def _keys(tests: Sequence[str]) -> Tuple[List[str], List[str]]:
+    names = [t for t in dict.fromkeys(tests) if t in UNIT_CONVERSIONS]
+    return names, [UNIT_CONVERSIONS[t][0] for t in names]
+
+
+def _finish(row: Dict[str, Any]) -> Dict[str, Any]:
+    t = dict(row)
+    t.pop("user_id", None)
+    test = t.pop("test")
+    if t["prev_date"] is not None and t["prev_date"] != t["last_date"]:
+        years = (t["last_date"] - t["prev_date"]).days / 365.25
+        t["rate_per_year"] = (t["last_value"] - t["prev_value"]) / years
+    else:
+        t["rate_per_year"] = None
+    flags = []
+    slope = t["slope_per_year"]
+    if slope is not None and t["n"] >= 3:
+        if test == "EGFR" and slope <= RAPID_EGFR_DECLINE:
+            flags.append("rapid_egfr_decline")
+        if test == "A1C" and slope >= A1C_RISE:
+            flags.append("a1c_rising")
+    t["flags"] = flags
+    return t
+
+
+def compute_trends(conn, user_ids: Optional[Iterable[str]] = None, tests: Sequence[str] = DEFAULT_TESTS,
+                   last_n: int = LAST_N, rolling_k: int = ROLLING_K) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """user_id -> test -> trend stats, straight from the database (None user_ids = whole panel)."""
+    names, units = _keys(tests)
+    users = None if user_ids is None else [str(u) for u in user_ids]
+    out: Dict[str, Dict[str, Dict[str, Any]]] = {u: {} for u in users or ()}
+    with conn.cursor(cursor_factory=profiled_cursor(RealDictCursor)) as cur:
+        cur.execute(TRENDS_SQL, {"tests": names, "units": units, "all": users is None,
+                                 "users": users or [], "n": last_n, "k": rolling_k})
+        for r in cur.fetchall():
+            out.setdefault(str(r["user_id"]), {})[r["test"]] = _finish(r)
+    return out
+
+
+def _stamps(conn, users: Optional[List[str]]) -> Dict[str, Tuple[int, Any]]:
+    with conn.cursor(cursor_factory=profiled_cursor(RealDictCursor)) as cur:
+        cur.execute(STAMPS_SQL, {"all": users is None, "users": users or []})
+        return {str(r["user_id"]): (r["n"], r["last_recorded"]) for r in cur.fetchall()}
+
+
+def get_trends(conn, user_ids: Optional[Iterable[str]] = None, tests: Sequence[str] = DEFAULT_TESTS,
+               last_n: int = LAST_N, rolling_k: int = ROLLING_K) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """compute_trends with a per-patient cache, recomputed only for patients with new or removed labs."""
+    users = None if user_ids is None else list(dict.fromkeys(str(u) for u in user_ids))
+    params = (tuple(sorted(tests)), last_n, rolling_k)
+    stamps = _stamps(conn, users)
+    out: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    stale: List[str] = []
+    for uid in (users if users is not None else stamps):
+        stamp = stamps.get(uid)
+        if stamp is None:
+            out[uid] = {}  # no labs on file
+            continue
+        hit = _cache.get(uid)
+        if hit is not None and hit[0] == params and hit[1] == stamp:
+            out[uid] = hit[2]
+        else:
+            stale.append(uid)
+    if stale:
+        # whole-panel refreshes scan once instead of shipping a huge id list
+        fresh = compute_trends(conn, None if users is None and len(stale) == len(stamps) else stale,
+                               tests, last_n, rolling_k)
+        for uid in stale:
+            trends = fresh.get(uid, {})
+            _cache.set(uid, (params, stamps[uid], trends))
+            out[uid] = trends
+    return out
+
+
+def invalidate_trends(*user_ids: str) -> None:
+    """Drop cached trends (all patients if none given); stamps catch new labs anyway."""
+    if not user_ids:
+        _cache.clear()
+    for uid in user_ids:
+        _cache.invalidate(str(uid))
+
+
+def cache_stats() -> Dict[str, Any]:
+    return _cache.stats()
+
+
+CSV_FIELDS = ["user_id", "test", "n", "last_value", "last_date", "days_since_last", "mean", "rolling_mean",
+              "slope_per_year", "rate_per_year", "flags", "last_values"]
+
+
+def _fmt(v: Any) -> Any:
+    if isinstance(v, float):
+        return round(v, 3)
+    if isinstance(v, list):
+        return ";".join(str(_fmt(x)) for x in v)
+    return v
+
+
+def write_csv(path: str, trends: Dict[str, Dict[str, Dict[str, Any]]]) -> int:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    n = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(CSV_FIELDS)
+        for uid in sorted(trends):
+            for test in sorted(trends[uid]):
+                t = dict(trends[uid][test], user_id=uid, test=test)
+                w.writerow([_fmt(t.get(c)) for c in CSV_FIELDS])
+                n += 1
+    return n
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Per-patient lab trends (slope, rolling mean, rate of change)")
+    ap.add_argument("--tests", nargs="+", default=DEFAULT_TESTS, choices=sorted(UNIT_CONVERSIONS))
+    ap.add_argument("--last", type=int, default=LAST_N, help="results per patient/test the stats cover")
+    ap.add_argument("--rolling", type=int, default=ROLLING_K, help="results in the rolling mean")
+    ap.add_argument("--handle", action="append", help="limit to these patients (repeatable); default whole panel")
+    ap.add_argument("--csv", default=os.path.join("Output", "lab_trends.csv"))
+    ap.add_argument("--json", action="store_true", help="print JSON instead of writing the CSV")
+    ap.add_argument("--flagged", action="store_true", help="only rows with a flag")
+    ns = ap.parse_args(argv)
+
+    t0 = time.perf_counter()
+    with psycopg2.connect(os.environ["DATABASE_URL"]) as conn:
+        users = None
+        if ns.handle:
+            with conn.cursor() as cur:
+                cur.execute("SELECT user_id FROM titan.users WHERE handle = ANY(%s)", (ns.handle,))
+                users = [str(r[0]) for r in cur.fetchall()]
+        trends = compute_trends(conn, users, ns.tests, ns.last, ns.rolling)
+    if ns.flagged:
+        trends = {u: {t: s for t, s in by.items() if s["flags"]} for u, by in trends.items()}
+        trends = {u: by for u, by in trends.items() if by}
+    elapsed = time.perf_counter() - t0
+
+    if ns.json:
+        print(json.dumps(trends, indent=2, default=str))
+        return 0
+    n = write_csv(ns.csv, trends)
+    flagged = sum(1 for by in trends.values() for s in by.values() if s["flags"])
+    print(f"OK: {n} trend rows for {len(trends)} patients ({flagged} flagged) in {elapsed:.2f}s -> {ns.csv}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
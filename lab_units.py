@@ -0,0 +1,209 @@
+"""
+Lab value parsing and unit normalization for titan.labs.
+
+Python side: parse_value() / normalize() for in-process consumers.
+SQL side:    `python lab_units.py` adds titan.labs.value_num / unit_canon /
+             test_canon, seeds titan.lab_unit_map and titan.lab_test_map from
+             UNIT_CONVERSIONS and TEST_ALIASES below, and installs a trigger so
+             every insert path (COPY merge, single-row inserts) gets typed values
+             on ingest. Existing rows are backfilled.
+
+test_canon is the canonical test code (HbA1c, HGBA1C and A1C are all 'A1C';
+unknown codes keep their normalized spelling), so threshold checks can run as
+indexed SQL, e.g.
+  SELECT user_id FROM titan.v_latest_lab WHERE test_canon = 'A1C' AND value_num >= 7;
+"""
+from __future__ import annotations
+from typing import Dict, Iterator, Optional, Tuple
+import re
+
+# canonical test_code -> (canonical unit, {unit key: (factor, offset)})
+# value_canon = value * factor + offset. A unit key is lower-case with spaces removed;
+# '' (no unit recorded) is taken to mean the canonical unit.
+UNIT_CONVERSIONS: Dict[str, Tuple[str, Dict[str, Tuple[float, float]]]] = {
+    "A1C": ("%", {
+        "": (1.0, 0.0), "%": (1.0, 0.0),
+        "mmol/mol": (0.09148, 2.152),           # IFCC -> NGSP
+    }),
+    "UACR": ("mg/g", {
+        "": (1.0, 0.0), "mg/g": (1.0, 0.0), "ug/mg": (1.0, 0.0), "mcg/mg": (1.0, 0.0),
+        "mg/mmol": (8.84, 0.0),
+    }),
+    "EGFR": ("mL/min/1.73m2", {
+        "": (1.0, 0.0), "ml/min/1.73m2": (1.0, 0.0), "ml/min/1.73m^2": (1.0, 0.0), "ml/min": (1.0, 0.0),
+    }),
+    "LDL": ("mg/dL", {
+        "": (1.0, 0.0), "mg/dl": (1.0, 0.0),
+        "mmol/l": (38.67, 0.0),
+    }),
+    "GLU": ("mg/dL", {
+        "": (1.0, 0.0), "mg/dl": (1.0, 0.0),
+        "mmol/l": (18.016, 0.0),
+    }),
+    "CREAT": ("mg/dL", {
+        "": (1.0, 0.0), "mg/dl": (1.0, 0.0),
+        "umol/l": (1 / 88.42, 0.0), "µmol/l": (1 / 88.42, 0.0),
+    }),
+    "BMI": ("kg/m2", {
+        "": (1.0, 0.0), "kg/m2": (1.0, 0.0), "kg/m^2": (1.0, 0.0),
+    }),
+    "SBP": ("mmHg", {"": (1.0, 0.0), "mmhg": (1.0, 0.0)}),
+    "DBP": ("mmHg", {"": (1.0, 0.0), "mmhg": (1.0, 0.0)}),
+}
+
+# alternate spellings of test_code (after upper-casing and stripping non-alphanumerics)
+TEST_ALIASES = {
+    "HBA1C": "A1C", "HGBA1C": "A1C", "A1C": "A1C",
+    "UACR": "UACR", "ACR": "UACR", "MALBCR": "UACR",
+    "EGFR": "EGFR", "GFR": "EGFR",
+    "LDL": "LDL", "LDLC": "LDL",
+    "GLU": "GLU", "GLUCOSE": "GLU",
+    "CREAT": "CREAT", "CREATININE": "CREAT", "CR": "CREAT",
+    "BMI": "BMI",
+    "SBP": "SBP", "DBP": "DBP",
+}
+
+_NUM_RE = re.compile(r"^\s*[<>≤≥]?=?\s*(-?[0-9]+(?:\.[0-9]+)?)")
+
+
+def canon_test_code(code: Optional[str]) -> Optional[str]:
+    if not code:
+        return None
+    key = re.sub(r"[^A-Za-z0-9]", "", code).upper()
+    return TEST_ALIASES.get(key)
+
+
+def _unit_key(unit: Optional[str]) -> str:
+    return re.sub(r"\s+", "", unit or "").lower()
+
+
+def parse_value(text: Optional[str]) -> Optional[float]:
+    """Leading numeric value of a lab result ('8.1', '<5', '>= 90 ') or None."""
+    if text is None:
+        return None
+    m = _NUM_RE.match(str(text))
+    return float(m.group(1)) if m else None
+
+
+def normalize(test_code: Optional[str], value: Optional[str], unit: Optional[str]
+              ) -> Tuple[Optional[float], Optional[str]]:
+    """(numeric value in canonical unit, canonical unit). Unknown test/unit -> (parsed value, None)."""
+    num = parse_value(value)
+    code = canon_test_code(test_code)
+    if num is None or code is None:
+        return num, None
+    canon_unit, conv = UNIT_CONVERSIONS[code]
+    factor_offset = conv.get(_unit_key(unit))
+    if factor_offset is None:
+        return num, None
+    factor, offset = factor_offset
+    return round(num * factor + offset, 4), canon_unit
+
+
+def test_map_rows() -> Iterator[Tuple[str, str]]:
+    """(raw test key, canonical test code) for titan.lab_test_map."""
+    return iter(TEST_ALIASES.items())
+
+
+def unit_map_rows() -> Iterator[Tuple[str, str, str, float, float]]:
+    """(raw test key, unit key, canonical unit, factor, offset) for titan.lab_unit_map."""
+    for alias, code in TEST_ALIASES.items():
+        canon_unit, conv = UNIT_CONVERSIONS[code]
+        for unit_key, (factor, offset) in conv.items():
+            yield alias, unit_key, canon_unit, factor, offset
+
+
+DDL = r"""
+ALTER TABLE titan.labs ADD COLUMN IF NOT EXISTS value_num NUMERIC;
+ALTER TABLE titan.labs ADD COLUMN IF NOT EXISTS unit_canon TEXT;
+ALTER TABLE titan.labs ADD COLUMN IF NOT EXISTS test_canon TEXT;
+
+CREATE TABLE IF NOT EXISTS titan.lab_test_map(
+  test_key TEXT PRIMARY KEY,  -- upper-case, non-alphanumerics stripped (HBA1C, HGBA1C, ...)
+  test_canon TEXT NOT NULL    -- canonical test code (A1C)
+);
+
+CREATE TABLE IF NOT EXISTS titan.lab_unit_map(
+  test_key TEXT NOT NULL,     -- upper-case, non-alphanumerics stripped (HBA1C, A1C, ...)
+  unit_key TEXT NOT NULL,     -- lower-case, whitespace stripped ('' = no unit recorded)
+  unit_canon TEXT NOT NULL,
+  factor NUMERIC NOT NULL,
+  "offset" NUMERIC NOT NULL DEFAULT 0,
+  PRIMARY KEY (test_key, unit_key)
+);
+
+CREATE OR REPLACE FUNCTION titan.lab_parse_numeric(v TEXT) RETURNS NUMERIC
+LANGUAGE sql IMMUTABLE AS $$
+  SELECT substring(v FROM '^\s*[<>≤≥]?=?\s*(-?[0-9]+(?:\.[0-9]+)?)')::numeric
+$$;
+
+CREATE OR REPLACE FUNCTION titan.labs_normalize() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE m titan.lab_unit_map%ROWTYPE; n NUMERIC; k TEXT;
+BEGIN
+  k := upper(regexp_replace(COALESCE(NEW.test_code, ''), '[^A-Za-z0-9]', '', 'g'));
+  NEW.test_canon := COALESCE((SELECT t.test_canon FROM titan.lab_test_map t WHERE t.test_key = k), NULLIF(k, ''));
+  n := titan.lab_parse_numeric(NEW.value);
+  -- units of an alias known only to lab_test_map come from its canonical test
+  SELECT * INTO m FROM titan.lab_unit_map
+   WHERE test_key IN (k, NEW.test_canon)
+     AND unit_key = lower(regexp_replace(COALESCE(NEW.unit, ''), '\s', '', 'g'))
+   ORDER BY test_key = k DESC
+   LIMIT 1;
+  IF n IS NOT NULL AND FOUND THEN
+    NEW.value_num := round(n * m.factor + m."offset", 4);
+    NEW.unit_canon := m.unit_canon;
+  ELSE
+    NEW.value_num := n;
+    NEW.unit_canon := NULL;
+  END IF;
+  RETURN NEW;
+END $$;
+
+DROP TRIGGER IF EXISTS labs_normalize_trg ON titan.labs;
+CREATE TRIGGER labs_normalize_trg
+  BEFORE INSERT OR UPDATE OF value, unit, test_code ON titan.labs
+  FOR EACH ROW EXECUTE FUNCTION titan.labs_normalize();
+
+DROP INDEX IF EXISTS titan.labs_test_value_num_idx;  -- keyed on the raw test_code
+CREATE INDEX IF NOT EXISTS labs_test_canon_value_num_idx
+  ON titan.labs (test_canon, value_num) WHERE value_num IS NOT NULL;
+CREATE INDEX IF NOT EXISTS labs_user_test_canon_date_idx
+  ON titan.labs (user_id, test_canon, result_date DESC, recorded_at DESC);
+
+CREATE OR REPLACE VIEW titan.v_latest_lab AS
+SELECT DISTINCT ON (user_id, test_canon)
+  user_id, test_code, test_name, value, unit, result_date, value_num, unit_canon, test_canon
+FROM titan.labs
+WHERE result_date IS NOT NULL
+ORDER BY user_id, test_canon, result_date DESC, recorded_at DESC;
+"""
+
+SEED_TEST_SQL = r"""
+INSERT INTO titan.lab_test_map (test_key, test_canon) VALUES (%s, %s)
+ON CONFLICT (test_key) DO UPDATE SET test_canon = EXCLUDED.test_canon;
+"""
+
+SEED_SQL = r"""
+INSERT INTO titan.lab_unit_map (test_key, unit_key, unit_canon, factor, "offset")
+VALUES (%s, %s, %s, %s, %s)
+ON CONFLICT (test_key, unit_key) DO UPDATE
+  SET unit_canon = EXCLUDED.unit_canon, factor = EXCLUDED.factor, "offset" = EXCLUDED."offset";
+"""
+
+# fires the trigger for rows ingested before the columns existed
+BACKFILL_SQL = ("UPDATE titan.labs SET value = value "
+                "WHERE value_num IS NULL OR (test_canon IS NULL AND test_code IS NOT NULL);")
+
+
+if __name__ == "__main__":
+    import os, psycopg2
+    dsn = os.environ["DATABASE_URL"]
+    with psycopg2.connect(dsn) as c, c.cursor() as cur:
+        cur.execute(DDL)
+        cur.executemany(SEED_TEST_SQL, list(test_map_rows()))
+        cur.executemany(SEED_SQL, list(unit_map_rows()))
+        cur.execute(BACKFILL_SQL)
+        backfilled = cur.rowcount
+        c.commit()
+    print(f"OK: lab value/unit normalization installed ({backfilled} rows backfilled)")
@@ -2,9 +2,32 @@ from __future__ import annotations
 from pathlib import Path
 from typing import Dict, Any, List, Optional
 import json
+import logging
+import os
 import re
 
+from icd_catalog import candidate_tokens, catalog_path, open_catalog
+from lab_extract import extract_labs
+from logger import current_request_id, get_logger, request_context, timed
+from metrics import counter, gauge, histogram
 from polish_notes import polish_note
+from stage_graph import StageGraph
+
+STAGE_SECONDS = histogram('titan_pipeline_stage_seconds', 'process_note stage latency', ['stage'])
+STAGE_ERRORS = counter('titan_pipeline_errors_total', 'process_note stage failures', ['stage'])
+NOTES_TOTAL = counter('titan_notes_processed_total', 'Notes through process_note', ['valid'])
+NOTES_INFLIGHT = gauge('titan_notes_inflight', 'Notes currently inside process_note')
+
+ICD_CSV = Path(__file__).parent / 'icd' / 'icd10_full.csv'
+
+log = get_logger('Pipeline')
+
+# whitespace before punctuation and header lines, anchored at the start of a run
+# so a failed attempt cannot restart inside it (linear on long whitespace, see text_scan.py)
+_PUNCT_SPACE = re.compile(r"(?<!\s)\s+([,.;:!?])")
+_SECTION_HEADING = re.compile(r"(?im)^(#{0,2}\s*(subjective|objective|assessment|plan|follow-?up))\s*(?:[:\-]\s*)?$")
+_ENRICH_SECTIONS = tuple((h, re.compile(fr"(?im)^\s*{re.escape(h)}\s*(?:[:\-]\s*)?$"))
+                         for h in ('subjective', 'objective', 'assessment', 'plan', 'soap'))
 
 
 def clean(md: str) -> str:
@@ -34,7 +57,7 @@ def minimal_language_polish(md: str) -> str:
     for k, v in fixes.items():
         s = s.replace(k, v)
     # punctuation spacing
-    s = re.sub(r"\s+([,.;:!?])", r"\1", s)
+    s = _PUNCT_SPACE.sub(r"\1", s)
     s = re.sub(r"([,.;:!?])(\S)", r"\1 \2", s)
     return s
 
@@ -47,7 +70,7 @@ def arrange_flow_sections(md: str) -> str:
         return md
     text = md
     # Split by headings
-    pattern = re.compile(r"(?im)^(#{0,2}\s*(subjective|objective|assessment|plan|follow-?up))\s*[:\-]?\s*$")
+    pattern = _SECTION_HEADING
     parts: List[Dict[str, Any]] = []
     last = 0
     current = None
@@ -114,8 +137,8 @@ def enrich(md: str) -> Dict[str, Any]:
     words = re.findall(r"\b\w+\b", text)
     lines = [l for l in text.splitlines() if l.strip()]
     sections = []
-    for h in ('subjective', 'objective', 'assessment', 'plan', 'soap'):
-        if re.search(fr"(?im)^\s*{re.escape(h)}\s*[:\-]?\s*$", text):
+    for h, pat in _ENRICH_SECTIONS:
+        if pat.search(text):
             sections.append(h)
     return {
         'chars': len(text),
@@ -125,15 +148,21 @@ def enrich(md: str) -> Dict[str, Any]:
     }
 
 
-def assign_codes(md: str, icd_csv: Optional[Path] = None, top_n: int = 5) -> List[Dict[str, Any]]:
+def assign_codes(md: str, icd_csv: Optional[Path] = None, top_n: int = 5,
+                 use_catalog: bool = True) -> List[Dict[str, Any]]:
     # naive ICD matcher: match frequent tokens (>=5 chars) in description
     if not icd_csv:
-        icd_csv = Path(__file__).parent / 'icd' / 'icd10_full.csv'
-    text = (md or '').lower()
+        icd_csv = ICD_CSV
     # pick candidate tokens
-    tokens = [t.lower() for t in re.findall(r"[A-Za-z][A-Za-z\-]{4,}", text)]
-    uniq = sorted(set(tokens), key=lambda t: (-tokens.count(t), t))[:20]
+    uniq = candidate_tokens(md)
     matches: List[Dict[str, Any]] = []
+    # precompiled catalog (icd_catalog.py build), same results without parsing the CSV
+    catalog = open_catalog(str(icd_csv)) if use_catalog else None
+    if catalog is not None:
+        try:
+            return catalog.search(uniq, top_n)
+        except Exception:
+            return []
     if not icd_csv.exists():
         return matches
     try:
@@ -157,22 +186,60 @@ def assign_codes(md: str, icd_csv: Optional[Path] = None, top_n: int = 5) -> Lis
         return []
 
 
+def icd_signature() -> tuple:
+    """(size, mtime_ns) of the ICD CSV and its catalog; changes when either is rebuilt."""
+    out = []
+    for path in (str(ICD_CSV), catalog_path(str(ICD_CSV))):
+        try:
+            st = os.stat(path)
+            out.append((st.st_size, st.st_mtime_ns))
+        except OSError:
+            out.append(None)
+    return tuple(out)
+
+
+def _observe_stage(name: str, seconds: float, error: Optional[BaseException]) -> None:
+    STAGE_SECONDS.observe(seconds, stage=name)
+    if error is not None:
+        STAGE_ERRORS.inc(stage=name)
+
+
+# clean -> polish -> language; arrange/validate/enrich/codes only need
+# 'polished' and run side by side
+PIPELINE = StageGraph(hook=_observe_stage)
+PIPELINE.register('clean', clean, ['md'], ['cleaned'])
+PIPELINE.register('polish', polish_note, ['cleaned'], ['polished_raw'])
+PIPELINE.register('language', minimal_language_polish, ['polished_raw'], ['polished'])
+PIPELINE.register('arrange', arrange_flow_sections, ['polished'], ['final'])
+PIPELINE.register('validate', validate_minimal, ['polished'], ['validation'])
+PIPELINE.register('enrich', enrich, ['polished'], ['enrichment'])
+# memoized per note text and ICD data version, so a rebuilt CSV/catalog is picked up at once
+PIPELINE.register('codes', assign_codes, ['polished'], ['codes'], memoize=True, memo_version=icd_signature)
+PIPELINE.register('labs', extract_labs, ['polished'], ['labs'])
+
+RESULT_KEYS = ['cleaned', 'polished', 'final', 'validation', 'enrichment', 'codes', 'labs']
+_INTERNAL = {'md', 'polished_raw'}
+
+
+def register_stage(name: str, fn, inputs: List[str], outputs: List[str], memoize: bool = False,
+                   replace: bool = False, memo_version=None) -> None:
+    """Add a stage to process_note; its outputs are added to the result dict.
+
+    e.g. register_stage('guideline_gaps',
+                        lambda note, codes: crosscheck_guidelines(note, [c['code'] for c in codes]),
+                        ['polished', 'codes'], ['guideline_gaps'])
+    """
+    PIPELINE.register(name, fn, inputs, outputs, memoize=memoize, replace=replace, memo_version=memo_version)
+
+
 def process_note(md: str) -> Dict[str, Any]:
-    cleaned = clean(md)
-    polished = polish_note(cleaned)
-    polished = minimal_language_polish(polished)
-    final_note = arrange_flow_sections(polished)
-    v = validate_minimal(polished)
-    meta = enrich(polished)
-    codes = assign_codes(polished)
-    return {
-        'cleaned': cleaned,
-        'polished': polished,
-        'final': final_note,
-        'validation': v,
-        'enrichment': meta,
-        'codes': codes,
-    }
+    with request_context(current_request_id()), timed(log, 'process_note', level=logging.DEBUG), \
+            NOTES_INFLIGHT.track_inprogress():
+        values = PIPELINE.run({'md': md})
+    NOTES_TOTAL.inc(valid='true' if values['validation']['valid'] else 'false')
+    result = {k: values[k] for k in RESULT_KEYS}
+    result.update((k, v) for k, v in values.items() if k not in result and k not in _INTERNAL)
+    return result
 
 
 def _append_csv(path: Path, header: List[str], rows: List[List[Any]]):
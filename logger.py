@@ -1,20 +1,191 @@
+"""
+Non-blocking logging backend.
+
+Call sites only enqueue records (QueueHandler); one background thread
+(QueueListener) formats and writes them, so a slow disk or a log rotation
+never stalls an agent. The file log is JSON lines with the request id
+(request_context()) and duration_ms (timed()); the console keeps the old
+text format. DEBUG records are rate-limited per logger. dispatcher.auto_route(_batch),
+soap_enrich.enrich_soap_note and lite_pipeline.process_note open a request
+context (reusing the caller's, or payload["request_id"]) and time themselves;
+soap_enrich.submit carries the context onto its pool threads.
+
+ENV:
+  TITAN_LOG_LEVEL=INFO          root level
+  TITAN_LOG_DEBUG_RATE=50       DEBUG records/second allowed per logger (excess dropped and counted)
+  TITAN_LOG_QUEUE_MAX=10000     records buffered before new ones are dropped (never blocks the caller)
+
+USAGE:
+  from logger import get_logger, request_context, timed
+  log = get_logger("SOAPEnrich")
+  with request_context() as rid:            # every record inside carries request_id=rid
+      with timed(log, "enrich"):            # logs "enrich done" with duration_ms
+          ...
+"""
+import atexit
+import contextlib
+import contextvars
+import json
 import logging
-from logging.handlers import RotatingFileHandler
 import os
+import queue
+import threading
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 LOG_DIR = os.path.join(os.getcwd(), "logs")
 os.makedirs(LOG_DIR, exist_ok=True)
 
 LOG_FILE = os.path.join(LOG_DIR, "titanhq.log")
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        RotatingFileHandler(LOG_FILE, maxBytes=1_000_000, backupCount=3),
-        logging.StreamHandler()
-    ]
-)
+LEVEL = os.environ.get("TITAN_LOG_LEVEL", "INFO").upper()
+DEBUG_RATE = float(os.environ.get("TITAN_LOG_DEBUG_RATE", "50"))
+QUEUE_MAX = int(os.environ.get("TITAN_LOG_QUEUE_MAX", "10000"))
+
+_request_id = contextvars.ContextVar("titan_request_id", default=None)
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+@contextlib.contextmanager
+def request_context(request_id=None):
+    """Tag every record logged inside the block (this thread/task) with a request id."""
+    rid = request_id or uuid.uuid4().hex[:12]
+    token = _request_id.set(rid)
+    try:
+        yield rid
+    finally:
+        _request_id.reset(token)
+
+
+@contextlib.contextmanager
+def timed(logger, label, level=logging.INFO, **fields):
+    """Log '<label> done' (or 'failed') with duration_ms once the block finishes."""
+    t0 = time.perf_counter()
+    status = "done"
+    try:
+        yield
+    except Exception:
+        status = "failed"
+        raise
+    finally:
+        ms = round((time.perf_counter() - t0) * 1000.0, 3)
+        logger.log(level, f"{label} {status}", extra={"duration_ms": ms, "fields": fields or None})
+
+
+class ContextFilter(logging.Filter):
+    """Runs on the calling thread, so it can read the caller's request id."""
+
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = _request_id.get()
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """Token bucket per logger for DEBUG records; INFO and above always pass."""
+
+    def __init__(self, rate=DEBUG_RATE):
+        super().__init__()
+        self.rate = rate
+        self._buckets = {}  # logger name -> [tokens, last refill, dropped]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            b = self._buckets.get(record.name)
+            if b is None:
+                b = self._buckets[record.name] = [self.rate, now, 0]
+            b[0] = min(self.rate, b[0] + (now - b[1]) * self.rate)
+            b[1] = now
+            if b[0] < 1.0:
+                b[2] += 1
+                return False
+            b[0] -= 1.0
+            if b[2]:
+                record.sampled_out = b[2]
+                b[2] = 0
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        out = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key in ("request_id", "duration_ms", "sampled_out"):
+            value = getattr(record, key, None)
+            if value is not None:
+                out[key] = value
+        fields = getattr(record, "fields", None)
+        if fields:
+            out.update(fields)
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """Never blocks: when the queue is full the record is dropped and counted."""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # merge args and render the traceback now (they may not survive the
+        # thread hop), but keep the exception separate from the message
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DroppingQueueHandler.dropped += 1
+
+
+_file_handler = RotatingFileHandler(LOG_FILE, maxBytes=1_000_000, backupCount=3, encoding="utf-8")
+_file_handler.setFormatter(JsonFormatter())
+_console_handler = logging.StreamHandler()
+_console_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+
+_queue = queue.Queue(maxsize=QUEUE_MAX)
+_queue_handler = _DroppingQueueHandler(_queue)
+_queue_handler.addFilter(ContextFilter())
+_queue_handler.addFilter(DebugSampler())
+
+_listener = QueueListener(_queue, _file_handler, _console_handler, respect_handler_level=True)
+_listener.start()
+
+logging.basicConfig(level=LEVEL, handlers=[_queue_handler])
+
+
+def shutdown():
+    """Drain the queue and stop the writer thread (also runs at exit)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown)
+
 
 def get_logger(name="TitanHQ"):
     return logging.getLogger(name)
@@ -0,0 +1,407 @@
+"""
+Process-wide metrics: counters, gauges and histograms with labels.
+
+Exposed two ways:
+  - Prometheus text format over HTTP (GET /metrics) for long-running services
+  - a JSON snapshot written periodically (and at exit) for batch jobs
+
+ENV (read by start_from_env()):
+  TITAN_METRICS_PORT=9108                serve /metrics on 127.0.0.1:<port>
+  TITAN_METRICS_HOST=0.0.0.0             bind address (default 127.0.0.1)
+  TITAN_METRICS_JSON=Output/metrics.json periodic JSON dump
+  TITAN_METRICS_JSON_INTERVAL=30         seconds between dumps
+With an exporter configured, start_from_env() also turns on the DB statement
+metrics (instrument_db); otherwise profiled cursors stay plain cursors.
+
+USAGE:
+  from metrics import counter, histogram
+  NOTES = counter("titan_notes_processed_total", "Notes processed", ["valid"])
+  STAGE = histogram("titan_pipeline_stage_seconds", "Pipeline stage latency", ["stage"])
+  NOTES.inc(valid="true")
+  with STAGE.time(stage="polish"):
+      ...
+
+  python metrics.py --port 9108      # serve the (empty) registry, for a quick scrape test
+"""
+from __future__ import annotations
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+import argparse
+import atexit
+import bisect
+import contextlib
+import json
+import math
+import os
+import re
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_NAME = re.compile(r"^[a-zA-Z_:][a-zA-Z0-9_:]*$")
+LabelKey = Tuple[str, ...]
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        if not _NAME.match(name):
+            raise ValueError(f"invalid metric name: {name!r}")
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelKey:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _fmt_labels(self, key: LabelKey, extra: Sequence[Tuple[str, str]] = ()) -> str:
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    @abstractmethod
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        """(sample name, rendered labels, value) for the exposition format."""
+
+    @abstractmethod
+    def to_json(self) -> Any:
+        """JSON-serialisable snapshot of the current values."""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        if amount < 0:
+            raise ValueError("counters only go up")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, v in items:
+            yield self.name, self._fmt_labels(key), v
+
+    def to_json(self):
+        with self._lock:
+            return [{"labels": dict(zip(self.labelnames, k)), "value": v} for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelKey, float] = {}
+        self._functions: Dict[LabelKey, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn: Callable[[], float], **labels: Any) -> None:
+        """Value read from fn() at scrape/dump time (e.g. a cache size)."""
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = fn
+
+    @contextlib.contextmanager
+    def track_inprogress(self, **labels: Any):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def _current(self) -> Dict[LabelKey, float]:
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.items())
+        for key, fn in functions:
+            try:
+                values[key] = float(fn())
+            except Exception:
+                values[key] = math.nan
+        return values
+
+    def samples(self):
+        for key, v in self._current().items():
+            yield self.name, self._fmt_labels(key), v
+
+    def to_json(self):
+        return [{"labels": dict(zip(self.labelnames, k)), "value": v} for k, v in self._current().items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        # label key -> [per-bucket counts..., +Inf count], sum
+        self._counts: Dict[LabelKey, List[int]] = {}
+        self._sums: Dict[LabelKey, float] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[i] += 1
+            self._sums[key] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels: Any):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def _copy(self):
+        with self._lock:
+            return [(k, list(c), self._sums[k]) for k, c in self._counts.items()]
+
+    def samples(self):
+        for key, counts, total in self._copy():
+            running = 0
+            for le, n in zip(self.buckets, counts):
+                running += n
+                yield self.name + "_bucket", self._fmt_labels(key, [("le", _fmt_float(le))]), running
+            running += counts[-1]
+            yield self.name + "_bucket", self._fmt_labels(key, [("le", "+Inf")]), running
+            yield self.name + "_sum", self._fmt_labels(key), total
+            yield self.name + "_count", self._fmt_labels(key), running
+
+    def to_json(self):
+        out = []
+        for key, counts, total in self._copy():
+            n = sum(counts)
+            out.append({
+                "labels": dict(zip(self.labelnames, key)),
+                "count": n,
+                "sum": total,
+                "mean": total / n if n else 0.0,
+                "buckets": {_fmt_float(le): c for le, c in zip(self.buckets + (math.inf,), _cumsum(counts))},
+            })
+        return out
+
+
+def _cumsum(xs: Sequence[int]) -> List[int]:
+    out, run = [], 0
+    for x in xs:
+        run += x
+        out.append(run)
+    return out
+
+
+def _fmt_float(v: float) -> str:
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    if math.isnan(v):
+        return "NaN"
+    return repr(float(v)) if v != int(v) else f"{int(v)}.0"
+
+
+# ----------------------------
+# Registry
+# ----------------------------
+
+_registry: Dict[str, _Metric] = {}
+_registry_lock = threading.Lock()
+
+
+def _get_or_create(cls, name: str, help: str, labels: Sequence[str], **kw) -> Any:
+    with _registry_lock:
+        m = _registry.get(name)
+        if m is None:
+            m = _registry[name] = cls(name, help, labels, **kw)
+        elif not isinstance(m, cls) or m.labelnames != tuple(labels):
+            raise ValueError(f"metric {name} already registered as {m.kind} with labels {m.labelnames}")
+        return m
+
+
+def counter(name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+    return _get_or_create(Counter, name, help, labels)
+
+
+def gauge(name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+    return _get_or_create(Gauge, name, help, labels)
+
+
+def histogram(name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return _get_or_create(Histogram, name, help, labels, buckets=buckets)
+
+
+def render_prometheus() -> str:
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+    out: List[str] = []
+    for m in metrics:
+        out.append(f"# HELP {m.name} {m.help}")
+        out.append(f"# TYPE {m.name} {m.kind}")
+        for name, labels, value in m.samples():
+            out.append(f"{name}{labels} {_fmt_float(value)}")
+    return "\n".join(out) + "\n"
+
+
+def snapshot() -> Dict[str, Any]:
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+    return {
+        "timestamp": time.time(),
+        "pid": os.getpid(),
+        "metrics": {m.name: {"type": m.kind, "help": m.help, "samples": m.to_json()} for m in metrics},
+    }
+
+
+def write_json(path: str) -> str:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(snapshot(), f, indent=2, default=str)
+    os.replace(tmp, path)
+    return path
+
+
+# ----------------------------
+# Exposition
+# ----------------------------
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # keep scrapes out of stderr
+        pass
+
+
+def serve(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve /metrics from a daemon thread; returns the server (call .shutdown() to stop)."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+_dumpers: Dict[str, threading.Event] = {}
+
+
+def start_json_dump(path: str, interval: float = 30.0) -> None:
+    """Write a JSON snapshot every `interval` seconds and once more at exit."""
+    if path in _dumpers:
+        return
+    stop = _dumpers[path] = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            try:
+                write_json(path)
+            except OSError:
+                pass
+
+    threading.Thread(target=loop, name="metrics-json", daemon=True).start()
+    atexit.register(write_json, path)
+
+
+_started = False
+
+
+def start_from_env() -> None:
+    """Start the HTTP endpoint and/or JSON dump configured by TITAN_METRICS_* (idempotent)."""
+    global _started
+    if _started:
+        return
+    _started = True
+    port = os.environ.get("TITAN_METRICS_PORT")
+    path = os.environ.get("TITAN_METRICS_JSON")
+    if port or path:
+        instrument_db()
+    if port:
+        serve(int(port), os.environ.get("TITAN_METRICS_HOST", "127.0.0.1"))
+    if path:
+        start_json_dump(path, float(os.environ.get("TITAN_METRICS_JSON_INTERVAL", "30")))
+
+
+# ----------------------------
+# DB call metrics (fed by db_profile's observer hook)
+# ----------------------------
+
+DB_SECONDS = histogram("titan_db_query_seconds", "DB statement latency", ["statement"])
+DB_ROWS = counter("titan_db_rows_total", "Rows returned or affected by DB statements", ["statement"])
+DB_ERRORS = counter("titan_db_errors_total", "DB statements that raised", ["statement"])
+
+
+def _db_observer(sql: str, elapsed_ms: float, rows: int, error: bool) -> None:
+    verb = (sql.split(None, 1)[0].lower() if sql else "") or "other"
+    if verb not in ("select", "with", "insert", "update", "delete", "copy", "merge", "create", "alter", "do"):
+        verb = "other"
+    DB_SECONDS.observe(elapsed_ms / 1000.0, statement=verb)
+    if error:
+        DB_ERRORS.inc(statement=verb)
+    elif rows > 0:
+        DB_ROWS.inc(rows, statement=verb)
+
+
+def instrument_db() -> None:
+    """Route every profiled cursor / run_query call into the DB metrics above.
+
+    Not done at import: an observer makes every profiled cursor a timing
+    cursor, so it is only registered when something exports the metrics.
+    """
+    import db_profile
+    db_profile.add_observer(_db_observer)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Serve the metrics registry")
+    ap.add_argument("--port", type=int, default=int(os.environ.get("TITAN_METRICS_PORT") or 9108))
+    ap.add_argument("--host", default=os.environ.get("TITAN_METRICS_HOST", "127.0.0.1"))
+    args = ap.parse_args()
+    server = serve(args.port, args.host)
+    print(f"serving http://{args.host}:{args.port}/metrics (Ctrl-C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
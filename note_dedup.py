@@ -0,0 +1,298 @@
+"""
+Near-duplicate (copy-forward) note detection: MinHash signatures + LSH.
+
+Each note is reduced to word 3-shingles, hashed to 32 bits and summarised by
+a 128-value MinHash signature (numpy, one vectorised pass). The signature is
+cut into 16 bands of 8 rows; two notes land in the same bucket of some band
+with high probability iff their Jaccard similarity is above ~0.7, so a query
+only looks at the notes sharing a bucket instead of the whole history.
+A note with no words has no shingles: it is stored but never bucketed, and
+querying with it finds nothing (empty notes are not copies of each other).
+
+The index lives in SQLite (signatures + band buckets) and grows one note at a
+time; `index` pulls only notes created since the last run from titan.notes.
+
+USAGE:
+  idx = NoteIndex("Output/note_index.db")
+  idx.similar(text, k=5)                       # [(note_id, similarity, meta), ...]
+  idx.add(note_id, text, meta={"enc_id": ...})
+
+  python note_dedup.py index                   # incremental, from titan.notes (DATABASE_URL)
+  python note_dedup.py index --report Output/copy_forward.csv
+  python note_dedup.py query --file note.md -k 5
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+
+import numpy as np
+
+DEFAULT_INDEX = os.environ.get("TITAN_NOTE_INDEX") or str(Path(os.getcwd()) / "Output" / "note_index.db")
+
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE = 3
+THRESHOLD = 0.7
+
+_PRIME = np.uint64(4294967291)  # largest prime < 2**32; a*x + b stays below 2**64
+_rng = np.random.RandomState(0x7174)  # fixed: signatures must be comparable across runs
+_A = _rng.randint(1, int(_PRIME), size=NUM_PERM, dtype=np.uint64)
+_B = _rng.randint(0, int(_PRIME), size=NUM_PERM, dtype=np.uint64)
+_EMPTY = np.full(NUM_PERM, 0xFFFFFFFF, dtype=np.uint32)  # no shingles; real minima are < _PRIME
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def shingles(text: str, k: int = SHINGLE) -> np.ndarray:
+    """Distinct 32-bit hashes of word k-shingles of the lower-cased note."""
+    words = _WORD.findall((text or "").lower())
+    if len(words) < k:
+        grams = [" ".join(words)] if words else []
+    else:
+        grams = [" ".join(words[i:i + k]) for i in range(len(words) - k + 1)]
+    return np.unique(np.fromiter((zlib.crc32(g.encode()) for g in grams), dtype=np.uint64, count=len(grams)))
+
+
+def signature(text: str) -> np.ndarray:
+    """MinHash signature (NUM_PERM uint32) of a note."""
+    x = shingles(text)
+    if x.size == 0:
+        return _EMPTY.copy()
+    # (NUM_PERM, n) permuted hashes, min over shingles
+    h = (np.outer(_A, x) + _B[:, None]) % _PRIME
+    return h.min(axis=1).astype(np.uint32)
+
+
+def is_empty(sig: np.ndarray) -> bool:
+    """True for the signature of a note without shingles (see signature())."""
+    return sig.size > 0 and int(sig[0]) == 0xFFFFFFFF
+
+
+def similarity(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the two notes' shingle sets."""
+    return float(np.count_nonzero(sig_a == sig_b)) / len(sig_a)
+
+
+def band_keys(sig: np.ndarray) -> List[int]:
+    """One signed 64-bit bucket key per band (band index mixed in, so one column indexes all bands)."""
+    raw = sig.astype("<u4").tobytes()
+    width = ROWS * 4
+    return [
+        int.from_bytes(hashlib.blake2b(bytes([b]) + raw[b * width:(b + 1) * width], digest_size=8).digest(),
+                       "little", signed=True)
+        for b in range(BANDS)
+    ]
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes(
+  note_id TEXT PRIMARY KEY,
+  sig BLOB NOT NULL,
+  meta TEXT,
+  added_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS buckets(
+  bucket INTEGER NOT NULL,
+  note_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS buckets_bucket_idx ON buckets(bucket);
+CREATE INDEX IF NOT EXISTS buckets_note_idx ON buckets(note_id);
+CREATE TABLE IF NOT EXISTS state(
+  key TEXT PRIMARY KEY,
+  value TEXT
+);
+"""
+
+
+class NoteIndex:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or DEFAULT_INDEX
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        c = getattr(self._local, "conn", None)
+        if c is None:
+            c = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = c
+        return c
+
+    # ---------- writes ----------
+    def add(self, note_id: str, text: Optional[str] = None, meta: Optional[Dict[str, Any]] = None,
+            sig: Optional[np.ndarray] = None) -> np.ndarray:
+        """Index a note (replacing any previous version under the same id)."""
+        sig = signature(text or "") if sig is None else sig
+        self.add_many([(note_id, sig, meta)])
+        return sig
+
+    def add_many(self, items: Iterable[Tuple[str, np.ndarray, Optional[Dict[str, Any]]]]) -> int:
+        now = time.time()
+        notes, buckets, ids = [], [], []
+        for note_id, sig, meta in items:
+            note_id = str(note_id)
+            ids.append((note_id,))
+            notes.append((note_id, sig.astype("<u4").tobytes(), json.dumps(meta, default=str) if meta else None, now))
+            if not is_empty(sig):
+                buckets += [(key, note_id) for key in band_keys(sig)]
+        if not notes:
+            return 0
+        c = self._conn()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.executemany("DELETE FROM buckets WHERE note_id = ?", ids)
+            c.executemany("INSERT OR REPLACE INTO notes(note_id, sig, meta, added_at) VALUES (?, ?, ?, ?)", notes)
+            c.executemany("INSERT INTO buckets(bucket, note_id) VALUES (?, ?)", buckets)
+            c.execute("COMMIT")
+        except BaseException:
+            c.execute("ROLLBACK")
+            raise
+        return len(notes)
+
+    def remove(self, note_id: str) -> None:
+        c = self._conn()
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("DELETE FROM buckets WHERE note_id = ?", (str(note_id),))
+        c.execute("DELETE FROM notes WHERE note_id = ?", (str(note_id),))
+        c.execute("COMMIT")
+
+    # ---------- reads ----------
+    def candidates(self, sig: np.ndarray) -> List[str]:
+        keys = band_keys(sig)
+        marks = ",".join("?" * len(keys))
+        rows = self._conn().execute(f"SELECT DISTINCT note_id FROM buckets WHERE bucket IN ({marks})", keys)
+        return [r[0] for r in rows]
+
+    def similar(self, text: Optional[str] = None, k: int = 5, threshold: float = THRESHOLD,
+                sig: Optional[np.ndarray] = None, exclude: Sequence[str] = ()) -> List[Tuple[str, float, Optional[dict]]]:
+        """Up to k indexed notes with estimated similarity >= threshold, most similar first."""
+        sig = signature(text or "") if sig is None else sig
+        if is_empty(sig):
+            return []
+        skip = set(exclude)
+        ids = [i for i in self.candidates(sig) if i not in skip]
+        if not ids:
+            return []
+        out = []
+        c = self._conn()
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            for note_id, blob, meta in c.execute(
+                    f"SELECT note_id, sig, meta FROM notes WHERE note_id IN ({marks})", chunk):
+                sim = similarity(sig, np.frombuffer(blob, dtype="<u4"))
+                if sim >= threshold:
+                    out.append((note_id, sim, json.loads(meta) if meta else None))
+        out.sort(key=lambda r: (-r[1], r[0]))
+        return out[:k]
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT count(*) FROM notes").fetchone()[0]
+
+    def get_state(self, key: str) -> Optional[str]:
+        r = self._conn().execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return r[0] if r else None
+
+    def set_state(self, key: str, value: str) -> None:
+        self._conn().execute("INSERT OR REPLACE INTO state(key, value) VALUES (?, ?)", (key, value))
+
+
+# ----------------------------
+# titan.notes indexing
+# ----------------------------
+
+NEW_NOTES_SQL = """
+SELECT n.note_id::text AS note_id, n.content_md, n.created_at, n.enc_id::text AS enc_id, u.handle
+FROM titan.notes n
+JOIN titan.encounters e ON e.enc_id = n.enc_id
+JOIN titan.users u ON u.user_id = e.user_id
+WHERE n.created_at >= %s
+ORDER BY n.created_at, n.note_id
+"""
+
+
+def index_titan_notes(index: NoteIndex, report: Optional[str] = None, threshold: float = THRESHOLD,
+                      page: int = 1000) -> Dict[str, int]:
+    """Add notes created since the last run, in creation order; each is first matched against earlier notes."""
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+    from db_profile import profiled_cursor
+
+    since = index.get_state("titan_notes_watermark") or "-infinity"
+    indexed = flagged = 0
+    writer = None
+    fh = None
+    if report:
+        os.makedirs(os.path.dirname(os.path.abspath(report)), exist_ok=True)
+        new = not os.path.exists(report)
+        fh = open(report, "a", encoding="utf-8", newline="")
+        writer = csv.writer(fh)
+        if new:
+            writer.writerow(["note_id", "handle", "prior_note_id", "prior_handle", "similarity"])
+    try:
+        with psycopg2.connect(os.environ["DATABASE_URL"]) as conn:
+            with conn.cursor(name="note_dedup", cursor_factory=profiled_cursor(RealDictCursor)) as cur:
+                cur.itersize = page
+                cur.execute(NEW_NOTES_SQL, (since,))
+                for row in cur:
+                    sig = signature(row["content_md"] or "")
+                    # >= watermark re-reads the last note; excluding itself keeps that harmless
+                    for prior_id, sim, meta in index.similar(sig=sig, k=3, threshold=threshold,
+                                                             exclude=[row["note_id"]]):
+                        flagged += 1
+                        if writer:
+                            writer.writerow([row["note_id"], row["handle"], prior_id,
+                                             (meta or {}).get("handle", ""), f"{sim:.3f}"])
+                    # add immediately so later notes in this run can match it
+                    index.add_many([(row["note_id"], sig, {"handle": row["handle"], "enc_id": row["enc_id"],
+                                                           "created_at": row["created_at"]})])
+                    indexed += 1
+                    since = row["created_at"].isoformat()
+                    if indexed % page == 0:
+                        index.set_state("titan_notes_watermark", since)
+        index.set_state("titan_notes_watermark", since)
+    finally:
+        if fh:
+            fh.close()
+    return {"indexed": indexed, "near_duplicates": flagged}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Near-duplicate note index (MinHash/LSH)")
+    ap.add_argument("command", choices=["index", "query"])
+    ap.add_argument("--db", default=None, help=f"index path (default: {DEFAULT_INDEX})")
+    ap.add_argument("--file", help="note to look up (query); stdin if omitted")
+    ap.add_argument("-k", type=int, default=5)
+    ap.add_argument("--threshold", type=float, default=THRESHOLD)
+    ap.add_argument("--report", help="index: append near-duplicate pairs to this CSV")
+    ns = ap.parse_args(argv)
+
+    index = NoteIndex(ns.db)
+    if ns.command == "index":
+        t0 = time.perf_counter()
+        res = index_titan_notes(index, ns.report, ns.threshold)
+        print(f"OK: indexed {res['indexed']} notes ({len(index)} total), "
+              f"{res['near_duplicates']} near-duplicate matches, {time.perf_counter() - t0:.1f}s")
+        return 0
+    text = Path(ns.file).read_text(encoding="utf-8", errors="replace") if ns.file else sys.stdin.read()
+    for note_id, sim, meta in index.similar(text, ns.k, ns.threshold):
+        print(f"{sim:.3f}  {note_id}  {json.dumps(meta) if meta else ''}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,8 @@
 import re
 
+from text_scan import (ROLE_HEADER, SPACE_BEFORE_PUNCT, TRAILING_WS, header_line,
+                       strip_fenced_blocks, strip_role_blocks)
+
 def polish_note(md: str) -> str:
     """
     Aggressive cleaner:
@@ -32,16 +35,17 @@ def polish_note(md: str) -> str:
         s = re.sub(pat, "", s, flags=re.M)
 
     # remove fenced code blocks and HTML-like prompt scaffolds
-    s = re.sub(r"(?s)```.*?```", "", s)            # fenced code
-    s = re.sub(r"(?s)<(?:system|user|assistant).*?>.*?</(?:system|user|assistant)>", "", s)
-    s = re.sub(r"(?i)^\s*#+\s*(prompt|system|assistant|user)\s*$", "", s, flags=re.M)
+    # (linear scanners / patterns from text_scan: no quadratic backtracking on bad pastes)
+    s = strip_fenced_blocks(s)                     # fenced code
+    s = strip_role_blocks(s)
+    s = ROLE_HEADER.sub("", s)
 
     # --- whitespace normalization ---
-    s = re.sub(r"[ \t]+\n", "\n", s)               # trailing spaces
+    s = TRAILING_WS.sub("\n", s)                  # trailing spaces
     s = re.sub(r"\n{3,}", "\n\n", s)               # >2 blank lines → 1
     s = re.sub(r"[ ]{2,}", " ", s)                 # multi-spaces
     s = s.replace("\t", "  ")
-    s = re.sub(r" +([,:;])", r"\1", s)             # trim space before punctuation
+    s = SPACE_BEFORE_PUNCT.sub(r"\1", s)           # trim space before punctuation
 
     # --- bullet normalization ---
     s = re.sub(r"^\s*[-•]\s*", "- ", s, flags=re.M)
@@ -71,7 +75,6 @@ def polish_note(md: str) -> str:
     def _hdr(text: str) -> str:
         return text[0].upper() + text[1:] if text and text[0].islower() else text
     for h in SECTION_HINTS:
-        pat = re.compile(fr"(?im)^(?:#{{0,2}}\s*){re.escape(h)}\s*[:\-]?\s*$")
-        s = pat.sub(lambda m: _hdr(m.group(0)), s)
+        s = header_line(h).sub(lambda m: _hdr(m.group(0)), s)
 
     return s.strip()
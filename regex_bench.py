@@ -0,0 +1,163 @@
+"""
+Worst-case timings for the note-parsing patterns.
+
+Each case builds an adversarial input of n characters (unclosed role tags,
+long whitespace runs, header words followed by spaces, repeated "Patient"),
+times it at n, 2n, 4n and 8n, and reports the cost per character. A linear
+matcher keeps that roughly flat; the run fails if it grows by more than
+--max-growth from the smallest to the largest size.
+
+--legacy times the patterns these replaced (text_scan.py docstring) on the
+same inputs, for comparison; use a small --size there (role_blocks alone takes
+seconds at 4000 chars).
+
+USAGE:
+  python regex_bench.py                       # all cases, exit 1 if any grows superlinearly
+  python regex_bench.py --case role_blocks --size 50000
+  python regex_bench.py --legacy --size 500
+"""
+from __future__ import annotations
+from typing import Callable, Dict, List, Optional, Tuple
+import argparse
+import re
+import sys
+import time
+
+import text_scan
+from lab_extract import extract_labs
+from lite_pipeline import arrange_flow_sections, enrich, minimal_language_polish
+from polish_notes import polish_note
+
+try:
+    from SOAP_loader import try_extract_patient_name
+except ImportError:  # pyperclip missing: SOAP_loader is a desktop tool
+    try_extract_patient_name = None
+
+
+def _repeat(unit: str, n: int) -> str:
+    return (unit * (n // len(unit) + 1))[:n]
+
+
+# name -> (input builder, current implementation, legacy implementation)
+Case = Tuple[Callable[[int], str], Optional[Callable[[str], object]], Optional[Callable[[str], object]]]
+
+_NAME_LEGACY = r"Patient\s+([A-Z][a-zA-Z'`-]+(?:\s+[A-Z][a-zA-Z'`-]+)+)\s*,\s*MRN\b"
+
+CASES: Dict[str, Case] = {
+    "fenced_blocks": (
+        lambda n: "```" + _repeat("`` x ", n),
+        text_scan.strip_fenced_blocks,
+        lambda s: re.sub(r"(?s)```.*?```", "", s),
+    ),
+    "role_blocks": (
+        lambda n: _repeat("<user>", n),
+        text_scan.strip_role_blocks,
+        lambda s: re.sub(r"(?s)<(?:system|user|assistant).*?>.*?</(?:system|user|assistant)>", "", s),
+    ),
+    "role_header": (
+        lambda n: "\n" * n + "x",
+        lambda s: text_scan.ROLE_HEADER.sub("", s),
+        lambda s: re.sub(r"(?i)^\s*#+\s*(prompt|system|assistant|user)\s*$", "", s, flags=re.M),
+    ),
+    "trailing_ws": (
+        lambda n: " " * n + "x",
+        lambda s: text_scan.TRAILING_WS.sub("\n", s),
+        lambda s: re.sub(r"[ \t]+\n", "\n", s),
+    ),
+    "space_before_punct": (
+        lambda n: " " * n + "x",
+        lambda s: text_scan.SPACE_BEFORE_PUNCT.sub(r"\1", s),
+        lambda s: re.sub(r" +([,:;])", r"\1", s),
+    ),
+    "header_line": (
+        lambda n: "plan" + " " * n + "x",
+        lambda s: text_scan.header_line("plan").sub("", s),
+        lambda s: re.sub(r"(?im)^(?:#{0,2}\s*)plan\s*[:\-]?\s*$", "", s),
+    ),
+    "polish_note": (
+        lambda n: "plan" + "\t" * (n // 2) + "x",
+        polish_note,
+        None,  # end to end: only the rules above changed
+    ),
+    "language_polish": (
+        lambda n: " " * n + "x",
+        minimal_language_polish,
+        lambda s: re.sub(r"\s+([,.;:!?])", r"\1", s),
+    ),
+    "arrange_sections": (
+        lambda n: "plan" + " " * n + "x",
+        arrange_flow_sections,
+        lambda s: list(re.finditer(r"(?im)^(#{0,2}\s*(subjective|objective|assessment|plan|follow-?up))\s*[:\-]?\s*$", s)),
+    ),
+    "enrich_sections": (
+        lambda n: "plan" + " " * n + "x",
+        enrich,
+        lambda s: re.search(r"(?im)^\s*plan\s*[:\-]?\s*$", s),
+    ),
+    "lab_extract": (
+        lambda n: _repeat("A1c is = 8/ BP 1 ", n),
+        extract_labs,
+        None,
+    ),
+    "patient_name": (
+        lambda n: _repeat("Patient ", n),
+        try_extract_patient_name,
+        lambda s: re.search(_NAME_LEGACY, s),
+    ),
+}
+
+
+def _time(fn: Callable[[str], object], text: str, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def run_case(name: str, size: int, steps: int = 4, repeats: int = 3, legacy: bool = False) -> Optional[List[Tuple[int, float]]]:
+    build, current, old = CASES[name]
+    fn = old if legacy else current
+    if fn is None:
+        return None
+    out = []
+    for k in range(steps):
+        n = size * (2 ** k)
+        text = build(n)
+        out.append((len(text), _time(fn, text, repeats)))
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Worst-case regex/scanner benchmarks for note parsing")
+    ap.add_argument("--case", action="append", choices=sorted(CASES), help="repeatable; default all")
+    ap.add_argument("--size", type=int, default=20000, help="smallest input size (chars); doubled 3 times")
+    ap.add_argument("--repeats", type=int, default=3)
+    ap.add_argument("--max-growth", type=float, default=3.0,
+                    help="fail if ns/char at the largest size exceeds this multiple of the smallest")
+    ap.add_argument("--legacy", action="store_true", help="time the replaced patterns instead (no pass/fail)")
+    ns = ap.parse_args(argv)
+
+    failed = []
+    print(f"{'case':<20} {'chars':>9} {'ms':>10} {'ns/char':>9}")
+    for name in ns.case or list(CASES):
+        rows = run_case(name, ns.size, repeats=ns.repeats, legacy=ns.legacy)
+        if rows is None:
+            print(f"{name:<20} skipped")
+            continue
+        for n, secs in rows:
+            print(f"{name:<20} {n:>9} {secs * 1e3:>10.2f} {secs * 1e9 / n:>9.1f}")
+        # floor the baseline so sub-microsecond timings don't make noise look like growth
+        first = max(rows[0][1] / rows[0][0], 2e-9)
+        growth = (rows[-1][1] / rows[-1][0]) / first
+        if not ns.legacy and growth > ns.max_growth:
+            failed.append(f"{name} (x{growth:.1f})")
+    if failed:
+        print("superlinear: " + ", ".join(failed))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+"""
+Declarative coding rules, compiled once into a fast evaluator.
+
+A rule file (see rules/dm2.json) is an ordered list of rules:
+  {"id": ..., "when": <predicate>, "code": "E11.65", "why": "A1c {a1c_percent:.1f}% ...",
+   "advisory": "...", "group": "base"}
+
+Predicates:
+  {"always": true}
+  {"present": "field"}                    field is not None
+  {"truthy": "field"}                     field is not None and truthy
+  {"field": f, "op": "<"|"<="|">"|">="|"=="|"!="|"in", "value": v, "casefold": bool}
+  {"all": [...]}, {"any": [...]}, {"not": <predicate>}
+Comparisons against a missing field are false.
+
+Within a group only the first matching rule fires (exclusivity). "why" and
+"advisory" are str.format templates over the facts.
+
+Evaluation builds one fact table per patient (None dropped, casefolded
+strings precomputed) and only looks at rules whose required fields are all
+present, so cost tracks the rules that can apply rather than the whole file.
+
+USAGE:
+  rs = load_rules("rules/dm2.json")
+  decision = rs.evaluate(DM2Input(...))      # or a plain dict of facts
+
+  python rule_engine.py rules/dm2.json --facts '{"on_insulin": false, "a1c_percent": 8.1}'
+  python rule_engine.py rules/dm2.json --verify 20000   # DM2 rules vs decide_dm2_codes
+"""
+from __future__ import annotations
+from dataclasses import dataclass, is_dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, FrozenSet, List, Mapping, Optional, Tuple
+import argparse
+import json
+import operator
+import os
+import sys
+
+from dm_2_coding_decision_flow_titan_lite import Decision
+
+Facts = Dict[str, Any]
+Predicate = Callable[[Facts], bool]
+
+_OPS: Dict[str, Callable[[Any, Any], bool]] = {
+    "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+    "==": operator.eq, "!=": operator.ne,
+}
+_CF = "\x00cf:"  # fact-table prefix for casefolded copies of string fields
+
+
+class RuleError(ValueError):
+    pass
+
+
+@dataclass
+class Rule:
+    id: str
+    order: int
+    test: Predicate
+    needs: FrozenSet[str]
+    code: Optional[str] = None
+    why: Optional[str] = None
+    advisory: Optional[str] = None
+    group: Optional[str] = None
+
+
+def _compile(p: Mapping[str, Any], casefold: set) -> Tuple[Predicate, FrozenSet[str]]:
+    """Predicate spec -> (callable, fields that must be present for it to be true)."""
+    if "always" in p:
+        val = bool(p["always"])
+        return (lambda f: val), frozenset()
+    if "present" in p:
+        name = p["present"]
+        return (lambda f: name in f), frozenset([name])
+    if "truthy" in p:
+        name = p["truthy"]
+        return (lambda f: bool(f.get(name))), frozenset([name])
+    if "all" in p:
+        parts = [_compile(c, casefold) for c in p["all"]]
+        needs = frozenset().union(*(n for _, n in parts)) if parts else frozenset()
+        return _chain([t for t, _ in parts], True), needs
+    if "any" in p:
+        parts = [_compile(c, casefold) for c in p["any"]]
+        needs = frozenset.intersection(*(n for _, n in parts)) if parts else frozenset()
+        return _chain([t for t, _ in parts], False), needs
+    if "not" in p:
+        inner, _ = _compile(p["not"], casefold)
+        return (lambda f: not inner(f)), frozenset()
+    if "field" in p:
+        name, op, value = p["field"], p.get("op", "=="), p.get("value")
+        key = name
+        if p.get("casefold"):
+            casefold.add(name)
+            key = _CF + name
+            value = [v.lower() for v in value] if isinstance(value, list) else str(value).lower()
+        if op == "in":
+            choices = frozenset(value)
+            return (lambda f: key in f and f[key] in choices), frozenset([name])
+        fn = _OPS.get(op)
+        if fn is None:
+            raise RuleError(f"unknown op {op!r}")
+        return (lambda f: key in f and fn(f[key], value)), frozenset([name])
+    raise RuleError(f"unrecognised predicate: {p!r}")
+
+
+def _chain(tests: List[Predicate], conj: bool) -> Predicate:
+    """Fold predicates into nested and/or closures (short-circuits, no generator per call)."""
+    if not tests:
+        return lambda f: conj
+    head = tests[0]
+    if len(tests) == 1:
+        return head
+    rest = _chain(tests[1:], conj)
+    if conj:
+        return lambda f: head(f) and rest(f)
+    return lambda f: head(f) or rest(f)
+
+
+class RuleSet:
+    def __init__(self, name: str, rules: List[Rule], casefold: set):
+        self.name = name
+        self.rules = rules
+        self._casefold = tuple(sorted(casefold))
+        # rules are indexed by the fields they require; the candidate list for a
+        # given set of present fields is built once and reused across patients
+        fields = sorted(set().union(*(r.needs for r in rules))) if rules else []
+        self._bit = {name: 1 << i for i, name in enumerate(fields)}
+        self._always = [r for r in rules if not r.needs]
+        self._by_field: Dict[str, List[Rule]] = {}
+        for r in rules:
+            if r.needs:
+                self._by_field.setdefault(min(r.needs), []).append(r)
+        self._plans: Dict[int, List[Rule]] = {}
+
+    def facts(self, x: Any) -> Facts:
+        raw = vars(x) if is_dataclass(x) else x  # shallow; asdict() deep-copies
+        f = {k: v for k, v in raw.items() if v is not None}
+        for name in self._casefold:
+            v = f.get(name)
+            if isinstance(v, str):
+                f[_CF + name] = v.lower()
+        return f
+
+    def candidates(self, f: Facts) -> List[Rule]:
+        """Rules whose required fields are all present in f, in file order."""
+        present = 0
+        bit = self._bit
+        for name in f:
+            present |= bit.get(name, 0)
+        plan = self._plans.get(present)
+        if plan is None:
+            keys = f.keys()
+            plan = list(self._always)
+            for name in keys & self._by_field.keys():
+                plan.extend(r for r in self._by_field[name] if r.needs <= keys)
+            plan.sort(key=lambda r: r.order)
+            self._plans[present] = plan
+        return plan
+
+    def evaluate(self, x: Any) -> Decision:
+        f = self.facts(x)
+        codes: List[str] = []
+        why: List[str] = []
+        adv: List[str] = []
+        fired: set = set()
+        seen: set = set()
+        for r in self.candidates(f):
+            if r.group is not None and r.group in fired:
+                continue
+            if not r.test(f):
+                continue
+            if r.group is not None:
+                fired.add(r.group)
+            if r.code and r.code not in seen:
+                seen.add(r.code)
+                codes.append(r.code)
+            if r.why:
+                why.append(r.why.format_map(f))
+            if r.advisory:
+                adv.append(r.advisory.format_map(f))
+        return Decision(icd_codes=codes, rationales=why, advisories=adv)
+
+
+def compile_rules(spec: Mapping[str, Any]) -> RuleSet:
+    casefold: set = set()
+    rules: List[Rule] = []
+    for i, raw in enumerate(spec.get("rules", [])):
+        if "when" not in raw:
+            raise RuleError(f"rule #{i} ({raw.get('id')}) has no 'when'")
+        test, needs = _compile(raw["when"], casefold)
+        rules.append(Rule(
+            id=raw.get("id") or f"rule_{i}", order=i, test=test, needs=needs,
+            code=raw.get("code"), why=raw.get("why"), advisory=raw.get("advisory"), group=raw.get("group"),
+        ))
+    return RuleSet(spec.get("name", ""), rules, casefold)
+
+
+_loaded: Dict[str, Tuple[int, RuleSet]] = {}
+
+
+def load_rules(path: os.PathLike | str) -> RuleSet:
+    """Compile a rule file once; recompiled only if the file changes."""
+    p = str(Path(path).resolve())
+    mtime = os.stat(p).st_mtime_ns
+    hit = _loaded.get(p)
+    if hit and hit[0] == mtime:
+        return hit[1]
+    with open(p, "r", encoding="utf-8") as fh:
+        rs = compile_rules(json.load(fh))
+    _loaded[p] = (mtime, rs)
+    return rs
+
+
+def _verify_dm2(rs: RuleSet, n: int, seed: int) -> int:
+    import random
+    from dm2_batch import random_dm2_input
+    from dm_2_coding_decision_flow_titan_lite import decide_dm2_codes
+    rng = random.Random(seed)
+    bad = 0
+    for _ in range(n):
+        x = random_dm2_input(rng)
+        want, got = decide_dm2_codes(x), rs.evaluate(x)
+        if want != got:
+            bad += 1
+            if bad <= 5:
+                print(f"MISMATCH {x}\n  scalar={want}\n  rules ={got}")
+    return bad
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Evaluate a declarative coding rule file")
+    ap.add_argument("rules", help="rule file (JSON)")
+    ap.add_argument("--facts", help="JSON object of facts")
+    ap.add_argument("--verify", type=int, metavar="N", help="compare rules/dm2.json against decide_dm2_codes")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    rs = load_rules(args.rules)
+    if args.verify:
+        mismatches = _verify_dm2(rs, args.verify, args.seed)
+        print(f"{args.verify - mismatches}/{args.verify} match")
+        sys.exit(1 if mismatches else 0)
+    if args.facts:
+        d = rs.evaluate(json.loads(args.facts))
+        print("ICD:", ", ".join(d.icd_codes))
+        for r in d.rationales:
+            print(" •", r)
+        for a in d.advisories:
+            print(" •", a)
@@ -1,8 +1,19 @@
 # C:\titanmind\titan_lite\run_chart.py
-import os, sys, re, datetime
+import os, sys, re, argparse, datetime, multiprocessing, socket, time
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+from db_profile import profiled_cursor
+from lab_extract import LabBuffer, extract_labs
+from lab_ingest import notify_written
+from metrics import counter, histogram, start_from_env
+from text_scan import (ROLE_HEADER, SPACE_BEFORE_PUNCT, TRAILING_WS, header_line,
+                       strip_fenced_blocks, strip_role_blocks)
+
+CHART_RUNS = counter("titan_chart_runs_total", "run_chart invocations by outcome", ["status"])
+CHART_SECONDS = histogram("titan_chart_seconds", "run_chart end-to-end latency")
+CHART_NOTES = counter("titan_chart_notes_total", "Notes charted, by whether polishing changed them", ["changed"])
+
 # --- Config ---
 DSN = os.environ.get("DATABASE_URL") or (
     "postgresql://neondb_owner:npg_HiR1G5bKxQrN@"
@@ -41,16 +52,16 @@ def polish(md: str) -> str:
         s = re.sub(pat, "", s, flags=re.M)
 
     # Remove fenced code blocks / xml-ish wrappers
-    s = re.sub(r"(?s)```.*?```", "", s)
-    s = re.sub(r"(?s)<(?:system|user|assistant).*?>.*?</(?:system|user|assistant)>", "", s)
-    s = re.sub(r"(?i)^\s*#+\s*(prompt|system|assistant|user)\s*$", "", s, flags=re.M)
+    s = strip_fenced_blocks(s)
+    s = strip_role_blocks(s)
+    s = ROLE_HEADER.sub("", s)
 
     # Whitespace normalization
-    s = re.sub(r"[ \t]+\n", "\n", s)
+    s = TRAILING_WS.sub("\n", s)
     s = re.sub(r"\n{3,}", "\n\n", s)
     s = re.sub(r"[ ]{2,}", " ", s)
     s = s.replace("\t", "  ")
-    s = re.sub(r" +([,:;])", r"\1", s)
+    s = SPACE_BEFORE_PUNCT.sub(r"\1", s)
 
     # Bullet normalization
     s = re.sub(r"^\s*[-•]\s*", "- ", s, flags=re.M)
@@ -80,7 +91,7 @@ def polish(md: str) -> str:
         t = m.group(0)
         return t[0].upper() + t[1:] if t and t[0].islower() else t
     for h in SECTION_HINTS:
-        s = re.sub(rf"(?im)^(#{0,2}\s*){h}\s*[:\-]?\s*$", lambda m: _hdr(m), s)
+        s = header_line(h).sub(lambda m: _hdr(m), s)
 
     return s.strip()
     
@@ -144,25 +155,241 @@ def postprocess_clinical(text: str) -> str:
 
 def fail(msg: str, code: int = 2):
     print(f"ERROR: {msg}")
+    CHART_RUNS.inc(status=f"exit_{code}")
     sys.exit(code)
 
+# --- Worker mode: notes are claimed in batches through titan.chart_leases ---
+# A claim is an UPDATE over rows picked with FOR UPDATE SKIP LOCKED, so any
+# number of workers on any number of hosts get disjoint batches. A lease that
+# is not finished before leased_until (crashed or stalled worker) becomes
+# claimable again; a worker only commits a note while it still holds the
+# lease, in the same transaction that marks it done.
+LEASE_DDL = r"""
+CREATE TABLE IF NOT EXISTS titan.chart_leases(
+  note_id UUID PRIMARY KEY REFERENCES titan.notes(note_id) ON DELETE CASCADE,
+  worker TEXT,
+  leased_until TIMESTAMPTZ,
+  attempts INT NOT NULL DEFAULT 0,
+  done_at TIMESTAMPTZ,
+  error TEXT,
+  enqueued_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS chart_leases_todo_idx
+  ON titan.chart_leases (enqueued_at) WHERE done_at IS NULL;
+"""
+
+# workers starting together would deadlock on the DDL/enqueue; one at a time
+SETUP_LOCK_SQL = "SELECT pg_advisory_xact_lock(hashtext('titan.chart_leases'))"
+
+ENQUEUE_SQL = """
+    INSERT INTO titan.chart_leases (note_id)
+    SELECT n.note_id FROM titan.notes n
+     WHERE n.created_at >= COALESCE(%s::timestamptz, '-infinity')
+    ON CONFLICT (note_id) DO NOTHING
+"""
+
+CLAIM_SQL = """
+    UPDATE titan.chart_leases c
+       SET worker = %(worker)s,
+           leased_until = now() + make_interval(secs => %(lease_s)s),
+           attempts = c.attempts + 1
+     WHERE c.note_id IN (
+           SELECT note_id FROM titan.chart_leases
+            WHERE done_at IS NULL
+              AND (leased_until IS NULL OR leased_until < now())
+              AND attempts < %(max_attempts)s
+            ORDER BY enqueued_at, note_id
+            LIMIT %(batch)s
+            FOR UPDATE SKIP LOCKED)
+    RETURNING c.note_id
+"""
+
+# Fencing: only the current lease holder can mark a note done (row lock held to commit).
+FINISH_SQL = """
+    UPDATE titan.chart_leases
+       SET done_at = now(), leased_until = NULL, error = NULL
+     WHERE note_id = %s AND worker = %s AND done_at IS NULL AND leased_until > now()
+"""
+
+RENEW_SQL = """
+    UPDATE titan.chart_leases
+       SET leased_until = now() + make_interval(secs => %s)
+     WHERE worker = %s AND done_at IS NULL AND leased_until > now()
+"""
+
+# release for retry right away (up to --max-attempts claims)
+RELEASE_SQL = """
+    UPDATE titan.chart_leases
+       SET error = %s, leased_until = now()
+     WHERE note_id = %s AND worker = %s AND done_at IS NULL
+"""
+
+NOTE_SQL = """
+    SELECT n.note_id, n.note_type, n.content_md, n.status, n.validator,
+           e.dos, u.handle, u.user_id
+    FROM titan.notes n
+    JOIN titan.encounters e ON e.enc_id = n.enc_id
+    JOIN titan.users u ON u.user_id = e.user_id
+"""
+
+CHART_LEASES = counter("titan_chart_leases_total", "run_chart worker lease outcomes", ["outcome"])
+
+
+def chart_note(conn, cur, row, load_labs: bool = True) -> str:
+    """Polish one note and write it (and its lab values) back; nothing is committed, the caller commits."""
+    content = row["content_md"] or ""
+    polished = postprocess_clinical(polish(content))
+
+    CHART_NOTES.inc(changed="true" if polished != content else "false")
+
+    # Non-destructive in-DB update if content changed
+    if polished != content:
+        cur.execute("""
+            UPDATE titan.notes
+               SET content_md = %s,
+                   validator  = COALESCE(NULLIF(validator,''),'TitanPolish v2') ||
+                                CASE
+                                  WHEN validator IS NULL OR validator='' THEN ''
+                                  ELSE ';TitanPolish v2'
+                                END
+             WHERE note_id = %s
+        """, (polished, row["note_id"]))
+
+    # Lab/vital values written in the note -> titan.labs (source_note = this note)
+    if load_labs:
+        with LabBuffer(conn, commit=False) as labs:
+            labs.add(extract_labs(polished, default_date=row["dos"]),
+                     user_id=str(row["user_id"]), source_note=str(row["note_id"]))
+    return polished
+
+
+def write_chart(out_dir: str, row, polished: str, suffix: str = "") -> str:
+    """Emit the chart-ready text file; returns its path."""
+    dos = row["dos"] or datetime.date.today()
+    safe_handle = re.sub(r"[^A-Za-z0-9_.-]", "_", row["handle"] or "unknown")  # handles are not path-safe
+    fname = f"chart_{safe_handle}_{dos.isoformat()}{suffix}.txt"
+    fpath = os.path.join(out_dir, fname)
+
+    header = [
+        f"Handle: {row['handle']}",
+        f"DOS: {dos.isoformat()}",
+        f"Type: {row['note_type']}",
+        f"Status: {row['status']}",
+        f"Validator: {row['validator'] or '—'}",
+        "-" * 64
+    ]
+    with open(fpath, "w", encoding="utf-8") as f:
+        f.write("\n".join(header) + "\n" + polished + "\n")
+    return fpath
+
+
+def work(ns) -> dict:
+    """Claim and chart batches until nothing is claimable (or forever with --follow)."""
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    stats = {"done": 0, "lost": 0, "failed": 0}
+    with psycopg2.connect(DSN) as conn:
+        with conn.cursor(cursor_factory=profiled_cursor(RealDictCursor)) as cur:
+            cur.execute(SETUP_LOCK_SQL)
+            cur.execute(LEASE_DDL)
+            cur.execute(ENQUEUE_SQL, (ns.since,))
+            conn.commit()
+            while True:
+                cur.execute(CLAIM_SQL, {"worker": worker, "lease_s": ns.lease_s,
+                                        "max_attempts": ns.max_attempts, "batch": ns.batch})
+                claimed = [r["note_id"] for r in cur.fetchall()]
+                conn.commit()
+                if not claimed:
+                    if not ns.follow:
+                        break
+                    time.sleep(ns.poll_s)
+                    cur.execute(SETUP_LOCK_SQL)
+                    cur.execute(ENQUEUE_SQL, (ns.since,))
+                    conn.commit()
+                    continue
+                CHART_LEASES.inc(len(claimed), outcome="claimed")
+
+                cur.execute(NOTE_SQL + " WHERE n.note_id = ANY(%s::uuid[])", ([str(n) for n in claimed],))
+                rows = {str(r["note_id"]): r for r in cur.fetchall()}
+                conn.commit()
+                for note_id in claimed:
+                    row = rows.get(str(note_id))
+                    try:
+                        cur.execute(FINISH_SQL, (note_id, worker))
+                        if cur.rowcount != 1:
+                            # lease expired and was taken over: leave the note to its new owner
+                            conn.rollback()
+                            stats["lost"] += 1
+                            CHART_LEASES.inc(outcome="lost")
+                            continue
+                        if row:
+                            polished = chart_note(conn, cur, row, load_labs=not ns.no_labs)
+                            # written before the commit: a failed write releases the lease instead of
+                            # leaving the note done without a chart (a rewrite on retry is harmless)
+                            write_chart(ns.out_dir, row, polished, suffix=f"_{str(note_id)[:8]}")
+                        conn.commit()
+                        if row and not ns.no_labs:
+                            notify_written([row["user_id"]])
+                    except Exception as e:
+                        conn.rollback()
+                        cur.execute(RELEASE_SQL, (str(getattr(e, "pgerror", None) or e)[:500], note_id, worker))
+                        conn.commit()
+                        stats["failed"] += 1
+                        CHART_LEASES.inc(outcome="failed")
+                        continue
+                    stats["done"] += 1
+                    CHART_LEASES.inc(outcome="done")
+                    cur.execute(RENEW_SQL, (ns.lease_s, worker))
+                    conn.commit()
+    print(f"OK: worker {worker} charted {stats['done']} notes (lost {stats['lost']}, failed {stats['failed']})")
+    return stats
+
+
 def main():
-    # Args: --handle <handle>
-    if "--handle" in sys.argv:
-        i = sys.argv.index("--handle")
-        if i + 1 < len(sys.argv):
-            handle = sys.argv[i + 1]
-        else:
-            fail("--handle requires a value", 2)
-    else:
-        fail("Specify --handle <user_handle> (e.g., demo_builder)", 2)
-
-    out_dir = os.environ.get("MEMORY", os.path.join(os.getcwd(), "Output"))
-    os.makedirs(out_dir, exist_ok=True)
+    start_from_env()
+    with CHART_SECONDS.time():
+        _run()
+
+def _parse_args():
+    ap = argparse.ArgumentParser(description="Polish notes and emit chart-ready text files")
+    ap.add_argument("--handle", help="chart the latest note for this user handle (e.g., demo_builder)")
+    ap.add_argument("--worker", action="store_true", help="claim notes from titan.chart_leases until none are left")
+    ap.add_argument("--procs", type=int, default=1, help="worker processes on this host (with --worker)")
+    ap.add_argument("--batch", type=int, default=int(os.environ.get("TITAN_CHART_BATCH", "20")),
+                    help="notes claimed per lease")
+    ap.add_argument("--lease-s", type=float, default=float(os.environ.get("TITAN_CHART_LEASE_S", "300")),
+                    help="lease length; expired leases are reclaimed by other workers")
+    ap.add_argument("--max-attempts", type=int, default=3, help="claims per note before it is left alone")
+    ap.add_argument("--since", help="only enqueue notes created at/after this timestamp")
+    ap.add_argument("--follow", action="store_true", help="keep polling for new notes instead of exiting")
+    ap.add_argument("--poll-s", type=float, default=5.0)
+    ap.add_argument("--no-labs", action="store_true", help="do not load extracted lab values into titan.labs")
+    return ap.parse_args()
+
+def _run():
+    ns = _parse_args()
+    if not ns.handle and not ns.worker:
+        fail("Specify --handle <user_handle> (e.g., demo_builder) or --worker", 2)
+
+    ns.out_dir = os.environ.get("MEMORY", os.path.join(os.getcwd(), "Output"))
+    os.makedirs(ns.out_dir, exist_ok=True)
 
+    if ns.worker:
+        try:
+            if ns.procs > 1:
+                with multiprocessing.Pool(ns.procs) as pool:
+                    results = pool.map(work, [ns] * ns.procs)
+                print(f"OK: {ns.procs} workers charted {sum(r['done'] for r in results)} notes")
+            else:
+                work(ns)
+            CHART_RUNS.inc(status="ok")
+        except psycopg2.Error as e:
+            fail(f"Database error: {e.pgerror or e}", 4)
+        return
+
+    handle = ns.handle
     try:
         with psycopg2.connect(DSN) as conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            with conn.cursor(cursor_factory=profiled_cursor(RealDictCursor)) as cur:
                 # Health check
                 cur.execute(
                     "SELECT to_regclass('titan.users') ok_u, "
@@ -173,55 +400,24 @@ def main():
                 if not all([r["ok_u"], r["ok_e"], r["ok_n"]]):
                     fail("titan schema missing; run init/reset.", 3)
 
-                # Pull latest note for handle
-                cur.execute("""
-                    SELECT n.note_id, n.note_type, n.content_md, n.status, n.validator,
-                           e.dos, u.handle
-                    FROM titan.notes n
-                    JOIN titan.encounters e ON e.enc_id = n.enc_id
-                    JOIN titan.users u ON u.user_id = e.user_id
+                # Pull latest note for handle (row-locked: concurrent runs for one handle serialize)
+                cur.execute(NOTE_SQL + """
                     WHERE u.handle = %s
                     ORDER BY n.created_at DESC
                     LIMIT 1
+                    FOR UPDATE OF n
                 """, (handle,))
                 row = cur.fetchone()
                 if not row:
                     fail(f"No notes found for handle={handle}", 4)
 
-                content = row["content_md"] or ""
-                polished = postprocess_clinical(polish(content))
-
-                # Non-destructive in-DB update if content changed
-                if polished != content:
-                    cur.execute("""
-                        UPDATE titan.notes
-                           SET content_md = %s,
-                               validator  = COALESCE(NULLIF(validator,''),'TitanPolish v2') ||
-                                            CASE
-                                              WHEN validator IS NULL OR validator='' THEN ''
-                                              ELSE ';TitanPolish v2'
-                                            END
-                         WHERE note_id = %s
-                    """, (polished, row["note_id"]))
-                    conn.commit()
-
-                # Emit chart-ready text file
-                dos = row["dos"] or datetime.date.today()
-                fname = f"chart_{handle}_{dos.isoformat()}.txt"
-                fpath = os.path.join(out_dir, fname)
-
-                header = [
-                    f"Handle: {row['handle']}",
-                    f"DOS: {dos.isoformat()}",
-                    f"Type: {row['note_type']}",
-                    f"Status: {row['status']}",
-                    f"Validator: {row['validator'] or '—'}",
-                    "-" * 64
-                ]
-                with open(fpath, "w", encoding="utf-8") as f:
-                    f.write("\n".join(header) + "\n" + polished + "\n")
-
+                polished = chart_note(conn, cur, row, load_labs=not ns.no_labs)
+                fpath = write_chart(ns.out_dir, row, polished)
+                conn.commit()
+                if not ns.no_labs:
+                    notify_written([row["user_id"]])
                 print(f"OK: wrote {fpath}")
+                CHART_RUNS.inc(status="ok")
 
     except psycopg2.Error as e:
         fail(f"Database error: {e.pgerror or e}", 4)
@@ -3,19 +3,78 @@ _root = os.path.dirname(os.path.dirname(__file__))
 if _root not in sys.path:
     sys.path.insert(0, _root)
 from agents.lab_summary import fetch_lab_summary
+from agents.icd_coder import query_icd_codes
 from agents.guideline_retriever import fetch_guidelines
+from concurrent.futures import ThreadPoolExecutor, wait
+from logger import current_request_id, request_context, timed
+import contextvars
 import logging
+import threading
 
 logger = logging.getLogger("SOAPEnrich")
 
-def enrich_soap_note(payload):
-    patient_id = payload.get("patient_id")
+# Lab, ICD and guideline lookups are independent I/O, so they run side by side
+# on one shared pool and the request waits for the slowest of them, up to a
+# deadline (payload["deadline_s"], else TITAN_ENRICH_DEADLINE_S). A source that
+# misses the deadline contributes nothing and is listed under "TimedOut".
+DEFAULT_DEADLINE_S = float(os.environ.get("TITAN_ENRICH_DEADLINE_S", "5"))
+MAX_WORKERS = int(os.environ.get("TITAN_ENRICH_WORKERS", "16"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _executor():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="soap-enrich")
+    return _pool
+
+def submit(fn, *args):
+    """Run fn(*args) on the shared enrichment pool, in the caller's context (request id)."""
+    return _executor().submit(contextvars.copy_context().run, fn, *args)
+
+def deadline_for(payload):
+    return float(payload.get("deadline_s") or DEFAULT_DEADLINE_S)
+
+def gather_sources(payload, deadline_s=None):
+    """Run the lookups concurrently: ({"labs", "icds", "guidelines"} -> result or None, timed-out names)."""
     complaint = payload.get("chief_complaint", "")
+    if deadline_s is None:
+        deadline_s = deadline_for(payload)
+
+    futures = {
+        "labs": submit(fetch_lab_summary, {"patient_id": payload.get("patient_id")}),
+        "icds": submit(query_icd_codes, {"query": complaint}),
+        "guidelines": submit(fetch_guidelines, {"query": complaint}),
+    }
+    return collect(futures, deadline_s)
 
-    labs = fetch_lab_summary({"patient_id": patient_id})
-    icds = query_icd_codes({"query": complaint})
-    # guidelines = fetch_guidelines({"query": payload["chief_complaint"]})
-    guidelines = []
+def collect(futures, deadline_s, cancel=True):
+    """Wait up to deadline_s for {name: future}: (name -> result or None, timed-out names).
+
+    cancel=False leaves late futures running, for lookups shared with other callers.
+    """
+    wait(futures.values(), timeout=max(deadline_s, 0.0))
+
+    results, timed_out = {}, []
+    for name, fut in futures.items():
+        if not fut.done():
+            if cancel:
+                fut.cancel()
+            timed_out.append(name)
+            results[name] = None
+            logger.warning(f"{name} lookup missed the {deadline_s:.1f}s deadline; returning partial note")
+            continue
+        try:
+            results[name] = fut.result()
+        except Exception as e:
+            logger.error(f"{name} lookup failed: {e}")
+            results[name] = None
+    return results, timed_out
+
+def build_enriched(payload, labs=None, icds=None, guidelines=None, timed_out=()):
     enriched = {
         "Subjective": payload.get("subjective", "N/A"),
         "Objective": labs or [],
@@ -23,7 +82,14 @@ def enrich_soap_note(payload):
         "Plan": payload.get("plan", "Follow-up in 1 week"),
         "Guidelines": guidelines or []
     }
+    if timed_out:
+        enriched["TimedOut"] = list(timed_out)
+    return enriched
+
+def enrich_soap_note(payload):
+    with request_context(current_request_id()), timed(logger, "enrich", level=logging.DEBUG):
+        results, timed_out = gather_sources(payload)
+        enriched = build_enriched(payload, timed_out=timed_out, **results)
 
     logger.info("ðŸ§  SOAP note enriched with labs, ICDs, and guidelines")
     return enriched
-
@@ -0,0 +1,239 @@
+"""
+Small stage-graph executor.
+
+A stage declares the values it reads (inputs) and the values it produces
+(outputs); the graph runs every stage as soon as its inputs exist, so stages
+that do not depend on each other run concurrently on a shared thread pool
+(each in a copy of the caller's context, so request ids carry over).
+Stages can be registered from anywhere (e.g. a site adding DM2 coding after
+"codes") without touching the code that calls run().
+
+A stage function is called with its inputs as positional arguments, in the
+declared order, and returns its single output, or a tuple for several.
+memoize=True caches a stage's result by a digest of its inputs; every call
+gets its own deep copy of the cached value, so a caller that mutates its result
+cannot change what later callers see. A stage that also depends
+on something outside its inputs (a reference file, a catalog) passes
+memo_version, a cheap callable whose return value is part of the cache key, so
+a new version of that data misses the cache instead of serving stale results.
+
+USAGE:
+  g = StageGraph()
+  g.register("clean", clean, ["md"], ["cleaned"])
+  g.register("codes", assign_codes, ["cleaned"], ["codes"], memoize=True)
+  values = g.run({"md": text})          # {"md": ..., "cleaned": ..., "codes": ...}
+"""
+from __future__ import annotations
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import contextvars
+import copy
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+from ttl_cache import TTLCache
+
+# fn(stage name, seconds, error or None) -- called after every stage
+StageHook = Callable[[str, float, Optional[BaseException]], None]
+
+MEMO_TTL = float(os.environ.get("TITAN_STAGE_CACHE_TTL", "3600"))
+MEMO_MAX = int(os.environ.get("TITAN_STAGE_CACHE_MAX", "1024"))
+MAX_WORKERS = int(os.environ.get("TITAN_STAGE_WORKERS", "8"))
+
+
+class StageGraphError(ValueError):
+    pass
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[..., Any]
+    inputs: Tuple[str, ...]
+    outputs: Tuple[str, ...]
+    memoize: bool = False
+    memo_version: Optional[Callable[[], Any]] = None
+
+
+def _digest(value: Any) -> Optional[bytes]:
+    if isinstance(value, str):
+        data = value.encode("utf-8", "surrogatepass")
+    elif isinstance(value, bytes):
+        data = value
+    else:
+        try:
+            data = pickle.dumps(value, protocol=4)
+        except Exception:
+            return None
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="stage")
+    return _pool
+
+
+class StageGraph:
+    def __init__(self, hook: Optional[StageHook] = None):
+        self._stages: Dict[str, Stage] = {}
+        self._producer: Dict[str, str] = {}
+        self._memo = TTLCache(ttl=MEMO_TTL, maxsize=MEMO_MAX)
+        self.hook = hook
+
+    # ---------- registration ----------
+    def register(self, name: str, fn: Callable[..., Any], inputs: Sequence[str], outputs: Sequence[str],
+                 memoize: bool = False, replace: bool = False,
+                 memo_version: Optional[Callable[[], Any]] = None) -> Stage:
+        outputs = tuple(outputs)
+        if not outputs:
+            raise StageGraphError(f"stage {name!r} produces nothing")
+        if name in self._stages and not replace:
+            raise StageGraphError(f"stage {name!r} already registered")
+        old = self._stages.pop(name, None)
+        if old:
+            for out in old.outputs:
+                self._producer.pop(out, None)
+        for out in outputs:
+            other = self._producer.get(out)
+            if other is not None:
+                if old:
+                    self._stages[name] = old
+                    self._producer.update((o, name) for o in old.outputs)
+                raise StageGraphError(f"{out!r} is already produced by stage {other!r}")
+        stage = Stage(name, fn, tuple(inputs), outputs, memoize, memo_version)
+        self._stages[name] = stage
+        self._producer.update((out, name) for out in outputs)
+        self._memo.clear()
+        return stage
+
+    def stage(self, inputs: Sequence[str], outputs: Sequence[str], name: Optional[str] = None, **kw):
+        """Decorator form of register()."""
+        def deco(fn):
+            self.register(name or fn.__name__, fn, inputs, outputs, **kw)
+            return fn
+        return deco
+
+    def unregister(self, name: str) -> None:
+        stage = self._stages.pop(name)
+        for out in stage.outputs:
+            self._producer.pop(out, None)
+
+    @property
+    def stages(self) -> List[Stage]:
+        return list(self._stages.values())
+
+    def outputs(self) -> List[str]:
+        return [out for s in self._stages.values() for out in s.outputs]
+
+    # ---------- planning ----------
+    def plan(self, available: Iterable[str], targets: Optional[Iterable[str]] = None) -> List[Stage]:
+        """Stages needed for targets (all stages if None), checked for missing inputs and cycles."""
+        have = set(available)
+        if targets is None:
+            wanted = list(self._stages.values())
+        else:
+            wanted, seen = [], set()
+            todo = [t for t in targets if t not in have]
+            while todo:
+                value = todo.pop()
+                name = self._producer.get(value)
+                if name is None:
+                    raise StageGraphError(f"nothing produces {value!r}")
+                if name in seen:
+                    continue
+                seen.add(name)
+                wanted.append(self._stages[name])
+                todo.extend(i for i in self._stages[name].inputs if i not in have)
+        # topological check: every stage must become runnable
+        produced, pending, order = set(have), list(wanted), []
+        while pending:
+            ready = [s for s in pending if all(i in produced for i in s.inputs)]
+            if not ready:
+                missing = {i for s in pending for i in s.inputs if i not in produced}
+                raise StageGraphError(f"unsatisfiable inputs {sorted(missing)} for stages {[s.name for s in pending]}")
+            for s in ready:
+                order.append(s)
+                produced.update(s.outputs)
+                pending.remove(s)
+        return order
+
+    # ---------- execution ----------
+    def _call(self, stage: Stage, args: Tuple[Any, ...]) -> Tuple[Any, ...]:
+        t0 = time.perf_counter()
+        err: Optional[BaseException] = None
+        try:
+            key = None
+            if stage.memoize:
+                digests = [_digest(a) for a in args]
+                if all(d is not None for d in digests):
+                    key = (stage.name,) + tuple(digests)
+                    if stage.memo_version is not None:
+                        key += (stage.memo_version(),)
+            if key is not None:
+                result = copy.deepcopy(self._memo.get_or_load(key, lambda: self._wrap(stage, stage.fn(*args))))
+            else:
+                result = self._wrap(stage, stage.fn(*args))
+            return result
+        except BaseException as e:
+            err = e
+            raise
+        finally:
+            if self.hook is not None:
+                self.hook(stage.name, time.perf_counter() - t0, err)
+
+    @staticmethod
+    def _wrap(stage: Stage, value: Any) -> Tuple[Any, ...]:
+        if len(stage.outputs) == 1:
+            return (value,)
+        if not isinstance(value, tuple) or len(value) != len(stage.outputs):
+            raise StageGraphError(f"stage {stage.name!r} must return {len(stage.outputs)} values")
+        return value
+
+    def run(self, initial: Dict[str, Any], targets: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Run the graph from the initial values; returns initial + every produced value."""
+        values = dict(initial)
+        pending = self.plan(values, targets)
+        running: Dict[Future, Stage] = {}
+        pool = None
+        try:
+            while pending or running:
+                ready = [s for s in pending if all(i in values for i in s.inputs)]
+                for s in ready:
+                    pending.remove(s)
+                if ready and not running and len(ready) == 1:
+                    # nothing to overlap with: run inline, no thread hop
+                    s = ready[0]
+                    values.update(zip(s.outputs, self._call(s, tuple(values[i] for i in s.inputs))))
+                    continue
+                if ready:
+                    pool = pool or _executor()
+                    for s in ready:
+                        running[pool.submit(contextvars.copy_context().run, self._call, s,
+                                            tuple(values[i] for i in s.inputs))] = s
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for fut in done:
+                    s = running.pop(fut)
+                    values.update(zip(s.outputs, fut.result()))
+        except BaseException:
+            for fut in running:
+                fut.cancel()
+            raise
+        return values
+
+    def clear_memo(self) -> None:
+        self._memo.clear()
+
+    def memo_stats(self) -> Dict[str, Any]:
+        return self._memo.stats()
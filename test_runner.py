@@ -1,35 +1,298 @@
-﻿import os, sys
-_root = os.path.dirname(os.path.dirname(__file__))
-if _root not in sys.path:
+﻿"""
+Agent health check and latency benchmark.
+
+Health mode (default) calls each agent once and logs the result, as before.
+Bench mode drives query_icd_codes, fetch_lab_summary, enrich_soap_note and
+validate_soap_payload from a thread pool and reports p50/p95/p99 latency and
+throughput per agent. With --backend fake (the default) run_query, search_icd
+and fetch_guidelines are replaced by in-memory stand-ins with a configurable
+latency; --backend live uses whatever DATABASE_URL / ICD search is configured
+(e.g. a local Postgres).
+
+A run can be saved as the baseline and later runs compared against it: a p95
+above baseline * (1 + tolerance) or a throughput below baseline * (1 - tolerance)
+fails the run (exit 1). p95 differences under --min-delta-ms are ignored so
+sub-millisecond agents do not flap.
+
+USAGE:
+  python test_runner.py                                   # health check
+  python test_runner.py --bench --concurrency 16 --requests 2000
+  python test_runner.py --bench --save-baseline           # record output/agent_bench_baseline.json
+  python test_runner.py --bench --tolerance 0.2           # compare against it
+"""
+import os, sys
+_root = os.path.dirname(os.path.dirname(__file__))
+if _root not in sys.path:
     sys.path.insert(0, _root)
-from agents.icd_coder import query_icd_codes
-from agents.lab_summary import fetch_lab_summary
-from agents.soap_enrich import enrich_soap_note
-from agents.soap_validator import validate_soap_payload
-import datetime, os
-
-timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-log_path = f"output/agent_health_{timestamp}.txt"
-
-def log(msg):
-    with open(log_path, "a", encoding="utf-8") as f:
-        f.write(msg + "\n")
-    print(msg)
-
-try:
-    log("âœ… ICD Lookup: " + str(query_icd_codes({"query": "diabetes"})))
-    log("âœ… Lab Summary: " + str(fetch_lab_summary({"patient_id": "12345"})))
-    log("âœ… SOAP Enrich: " + str(enrich_soap_note({
-        "patient_id": "12345",
-        "subjective": "Fatigue",
-        "chief_complaint": "Fatigue",
-        "plan": "Order CBC"
-    })))
-    log("âœ… SOAP Validation: " + str(validate_soap_payload({
-        "subjective": "Fatigue",
-        "chief_complaint": "Fatigue"
-    })))
-except Exception as e:
-    log("âŒ Error: " + str(e))
-
-print(f"ðŸ“„ Health check log saved to: {log_path}")
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import datetime
+import json
+import logging
+import random
+import threading
+import time
+
+BASELINE_PATH = os.path.join("output", "agent_bench_baseline.json")
+QUERIES = ["diabetes", "fatigue", "hypertension", "chronic kidney disease", "hyperlipidemia",
+           "obesity", "retinopathy", "neuropathy", "anemia", "hypothyroidism"]
+LAB_TESTS = [("A1C", "%"), ("LDL", "mg/dL"), ("EGFR", "mL/min/1.73m2"), ("UACR", "mg/g"), ("GLU", "mg/dL")]
+
+
+# ----------------------------
+# In-memory stand-ins
+# ----------------------------
+
+class FakeBackend:
+    """run_query / search_icd / fetch_guidelines replacements with simulated I/O latency."""
+
+    def __init__(self, latency_ms=2.0, jitter_ms=1.0, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = {"run_query": 0, "search_icd": 0, "fetch_guidelines": 0}
+
+    def _io(self, name):
+        with self._lock:
+            self.calls[name] += 1
+            delay = self.latency_ms + self._rng.uniform(0, self.jitter_ms)
+        time.sleep(delay / 1000.0)
+
+    def run_query(self, sql, params=None):
+        self._io("run_query")
+        pid = params[0] if params else "0"
+        if isinstance(pid, list):  # batched summaries
+            return [{"patient_id": p, **row} for p in pid for row in self._labs(p)]
+        return self._labs(pid)
+
+    @staticmethod
+    def _labs(pid):
+        seed = sum(map(ord, str(pid)))
+        day = datetime.datetime(2025, 1, 1)
+        return [{"test_name": t, "result": round(5 + (seed * (i + 3)) % 90 / 10.0, 1), "units": u,
+                 "timestamp": (day - datetime.timedelta(days=30 * i)).isoformat()}
+                for i, (t, u) in enumerate(LAB_TESTS)]
+
+    def search_icd(self, query):
+        self._io("search_icd")
+        return [{"code": f"R{abs(hash(query)) % 100:02d}.{i}", "description": f"{query} ({i})"} for i in range(3)]
+
+    def fetch_guidelines(self, payload):
+        self._io("fetch_guidelines")
+        q = payload.get("query", "")
+        return [{"title": f"{q.title()} guideline", "url": f"https://example.org/guidelines/{q.replace(' ', '-')}"}]
+
+
+def load_agents(backend):
+    from agents import icd_coder, lab_summary, soap_enrich, soap_validator
+    if backend is not None:
+        lab_summary.run_query = backend.run_query
+        icd_coder.search_icd = backend.search_icd
+        soap_enrich.fetch_guidelines = backend.fetch_guidelines
+    return icd_coder, lab_summary, soap_enrich, soap_validator
+
+
+# ----------------------------
+# Health check
+# ----------------------------
+
+def health(backend=None):
+    icd_coder, lab_summary, soap_enrich, soap_validator = load_agents(backend)
+    os.makedirs("output", exist_ok=True)
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    log_path = f"output/agent_health_{timestamp}.txt"
+
+    def log(msg):
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write(msg + "\n")
+        print(msg)
+
+    try:
+        log("âœ… ICD Lookup: " + str(icd_coder.query_icd_codes({"query": "diabetes"})))
+        log("âœ… Lab Summary: " + str(lab_summary.fetch_lab_summary({"patient_id": "12345"})))
+        log("âœ… SOAP Enrich: " + str(soap_enrich.enrich_soap_note({
+            "patient_id": "12345",
+            "subjective": "Fatigue",
+            "chief_complaint": "Fatigue",
+            "plan": "Order CBC"
+        })))
+        log("âœ… SOAP Validation: " + str(soap_validator.validate_soap_payload({
+            "subjective": "Fatigue",
+            "chief_complaint": "Fatigue"
+        })))
+    except Exception as e:
+        log("âŒ Error: " + str(e))
+
+    print(f"ðŸ“„ Health check log saved to: {log_path}")
+    return 0
+
+
+# ----------------------------
+# Benchmark
+# ----------------------------
+
+def percentile(sorted_ms, p):
+    if not sorted_ms:
+        return 0.0
+    k = max(0, min(len(sorted_ms) - 1, int(round(p / 100.0 * len(sorted_ms) + 0.5)) - 1))
+    return sorted_ms[k]
+
+
+def run_agent(fn, payloads, concurrency):
+    """Call fn(payload) for every payload from `concurrency` threads; latency stats in ms."""
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def one(payload):
+        nonlocal errors
+        t0 = time.perf_counter()
+        try:
+            fn(payload)
+            failed = False
+        except Exception:
+            failed = True
+        ms = (time.perf_counter() - t0) * 1000.0
+        with lock:
+            latencies.append(ms)
+            errors += failed
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, payloads))
+    wall = time.perf_counter() - t0
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "max_ms": round(latencies[-1], 3) if latencies else 0.0,
+        "throughput_rps": round(len(latencies) / wall, 1) if wall else 0.0,
+    }
+
+
+def workloads(n, keys, seed):
+    rng = random.Random(seed)
+    pids = [str(10000 + rng.randrange(keys)) for _ in range(n)]
+    queries = [rng.choice(QUERIES) for _ in range(n)]
+    soap = [{"patient_id": pid, "subjective": "Fatigue and polyuria", "chief_complaint": q, "plan": "Order CBC"}
+            for pid, q in zip(pids, queries)]
+    invalid = [{"subjective": "Fatigue", "chief_complaint": "Fatigue"}] * (n // 10)
+    return {
+        "query_icd_codes": [{"query": q} for q in queries],
+        "fetch_lab_summary": [{"patient_id": p} for p in pids],
+        "enrich_soap_note": soap,
+        "validate_soap_payload": soap[: n - len(invalid)] + invalid,
+    }
+
+
+def bench(ns, backend):
+    icd_coder, lab_summary, soap_enrich, soap_validator = load_agents(backend)
+    fns = {
+        "query_icd_codes": icd_coder.query_icd_codes,
+        "fetch_lab_summary": lab_summary.fetch_lab_summary,
+        "enrich_soap_note": soap_enrich.enrich_soap_note,
+        "validate_soap_payload": soap_validator.validate_soap_payload,
+    }
+    if ns.cold:  # measure the backend path, not the route caches
+        def uncached(fn):
+            def call(payload):
+                lab_summary.invalidate_lab_summary()
+                icd_coder.invalidate_icd_cache()
+                return fn(payload)
+            return call
+        fns = {name: uncached(fn) for name, fn in fns.items()}
+    selected = ns.agents or list(fns)
+    loads = workloads(ns.requests, ns.keys, ns.seed)
+    results = {}
+    for name in selected:
+        lab_summary.invalidate_lab_summary()
+        icd_coder.invalidate_icd_cache()
+        if ns.warmup:
+            run_agent(fns[name], loads[name][: ns.warmup], ns.concurrency)
+        results[name] = run_agent(fns[name], loads[name], ns.concurrency)
+
+    print(f"{'agent':<24}{'req':>7}{'err':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}")
+    for name, r in results.items():
+        print(f"{name:<24}{r['requests']:>7}{r['errors']:>6}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}"
+              f"{r['p99_ms']:>10.2f}{r['throughput_rps']:>10.1f}")
+
+    run = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "config": {"backend": ns.backend, "concurrency": ns.concurrency, "requests": ns.requests,
+                   "keys": ns.keys, "latency_ms": ns.latency_ms, "cold": ns.cold},
+        "agents": results,
+    }
+    os.makedirs("output", exist_ok=True)
+    out = f"output/agent_bench_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=2)
+    print(f"Results saved to: {out}")
+
+    if ns.save_baseline:
+        with open(ns.baseline, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+        print(f"Baseline saved to: {ns.baseline}")
+        return 0
+    if not os.path.exists(ns.baseline):
+        print(f"No baseline at {ns.baseline}; run with --save-baseline to record one")
+        return 0
+    with open(ns.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(baseline, run, ns.tolerance, ns.min_delta_ms)
+    for line in regressions:
+        print("REGRESSION " + line)
+    if not regressions:
+        print(f"Within {ns.tolerance:.0%} of baseline ({baseline.get('timestamp', '?')})")
+    return 1 if regressions else 0
+
+
+def compare(baseline, run, tolerance, min_delta_ms=0.5):
+    if baseline.get("config") != run["config"]:
+        print(f"note: baseline config {baseline.get('config')} differs from this run")
+    out = []
+    for name, r in run["agents"].items():
+        b = baseline.get("agents", {}).get(name)
+        if not b:
+            continue
+        if r["p95_ms"] > b["p95_ms"] * (1 + tolerance) and r["p95_ms"] - b["p95_ms"] >= min_delta_ms:
+            out.append(f"{name}: p95 {r['p95_ms']:.2f} ms vs baseline {b['p95_ms']:.2f} ms")
+        if r["throughput_rps"] < b["throughput_rps"] * (1 - tolerance):
+            out.append(f"{name}: {r['throughput_rps']:.1f} req/s vs baseline {b['throughput_rps']:.1f} req/s")
+        if r["errors"] > b["errors"]:
+            out.append(f"{name}: {r['errors']} errors vs baseline {b['errors']}")
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Agent health check / latency benchmark")
+    ap.add_argument("--bench", action="store_true", help="run the latency benchmark instead of the health check")
+    ap.add_argument("--backend", choices=["fake", "live"], default=None,
+                    help="fake: in-memory stand-ins (bench default); live: configured DB / ICD search (health default)")
+    ap.add_argument("--agents", nargs="*", choices=["query_icd_codes", "fetch_lab_summary",
+                                                    "enrich_soap_note", "validate_soap_payload"])
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--requests", type=int, default=1000, help="calls per agent")
+    ap.add_argument("--warmup", type=int, default=50)
+    ap.add_argument("--keys", type=int, default=5000, help="distinct patient ids drawn from (cache hit rate)")
+    ap.add_argument("--latency-ms", type=float, default=2.0, help="fake backend latency per call")
+    ap.add_argument("--cold", action="store_true", help="clear the lab/ICD result caches before every call")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    ap.add_argument("--min-delta-ms", type=float, default=0.5)
+    ns = ap.parse_args(argv)
+
+    ns.backend = ns.backend or ("fake" if ns.bench else "live")
+    backend = FakeBackend(ns.latency_ms, seed=ns.seed) if ns.backend == "fake" else None
+    if not ns.bench:
+        return health(backend)
+    logging.disable(logging.ERROR)  # per-call log lines (incl. expected validation failures) would dominate the timings
+    return bench(ns, backend)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,18 @@
+import random
+
+from dm2_batch import cohort_from_inputs, decide_dm2_codes_batch, random_dm2_input
+from dm_2_coding_decision_flow_titan_lite import decide_dm2_codes
+
+
+def test_batch_matches_scalar_on_seeded_sample():
+    rng = random.Random(20250301)
+    inputs = [random_dm2_input(rng) for _ in range(5000)]
+    got = decide_dm2_codes_batch(cohort_from_inputs(inputs))
+    assert len(got) == len(inputs)
+    mismatches = [(x, codes, decide_dm2_codes(x).icd_codes)
+                  for x, codes in zip(inputs, got) if codes != decide_dm2_codes(x).icd_codes]
+    assert not mismatches, f"{len(mismatches)} mismatches, first: {mismatches[0]}"
+
+
+def test_empty_cohort():
+    assert decide_dm2_codes_batch(cohort_from_inputs([])) == []
@@ -0,0 +1,64 @@
+import csv
+import os
+import random
+
+import pytest
+
+from icd_catalog import build, candidate_tokens, open_catalog
+from lite_pipeline import assign_codes
+
+TERMS = ["diabetes", "mellitus", "hyperglycemia", "hypertension", "chronic", "kidney", "disease", "stage",
+         "retinopathy", "without", "complications", "type-two", "end-stage", "ménière", "İnsulin", "Ünter",
+         "neuropathy", "long-term", "insulin", "obesity"]
+
+
+@pytest.fixture(scope="module")
+def icd_csv(tmp_path_factory):
+    rng = random.Random(20250305)
+    path = tmp_path_factory.mktemp("icd") / "icd10_full.csv"
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        for i in range(3000):
+            desc = " ".join(rng.choice(TERMS) for _ in range(rng.randint(0, 8)))
+            if i % 97 == 0:
+                desc = desc.upper() + ", (NOS)"
+            w.writerow([f"E{i:04d}" if i % 211 else "", desc])
+    build(str(path))
+    return path
+
+
+def _notes(seed, n):
+    rng = random.Random(seed)
+    words = TERMS + ["diabet", "hyper", "-type", "mellitus-x", "zzzzz", "Stage", "KIDNEY"]
+    for _ in range(n):
+        yield " ".join(rng.choice(words) for _ in range(rng.randint(0, 40)))
+
+
+def test_catalog_matches_csv_scan(icd_csv):
+    assert open_catalog(str(icd_csv)) is not None
+    mismatches = []
+    for note in _notes(1, 300):
+        want = assign_codes(note, icd_csv, use_catalog=False)
+        got = assign_codes(note, icd_csv)
+        if want != got:
+            mismatches.append((note, want, got))
+    assert not mismatches, f"{len(mismatches)} mismatches, first: {mismatches[0]}"
+
+
+def test_search_many_matches_search(icd_csv):
+    cat = open_catalog(str(icd_csv))
+    token_lists = [candidate_tokens(n) for n in _notes(2, 100)]
+    assert cat.search_many(token_lists, 7) == [cat.search(t, 7) for t in token_lists]
+
+
+def test_stale_catalog_is_not_used(tmp_path):
+    path = tmp_path / "icd.csv"
+    path.write_text("E11.9,type 2 diabetes mellitus\n", encoding="utf-8")
+    build(str(path))
+    assert open_catalog(str(path)) is not None
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("I10,essential hypertension\n")
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert open_catalog(str(path)) is None
+    assert [m["code"] for m in assign_codes("hypertension hypertension", path)] == ["I10"]
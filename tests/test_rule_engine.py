@@ -0,0 +1,26 @@
+import random
+from pathlib import Path
+
+from dm2_batch import random_dm2_input
+from dm_2_coding_decision_flow_titan_lite import decide_dm2_codes
+from rule_engine import load_rules
+
+DM2_RULES = Path(__file__).resolve().parent.parent / "rules" / "dm2.json"
+
+
+def test_dm2_rules_match_decide_dm2_codes_on_seeded_sample():
+    rs = load_rules(DM2_RULES)
+    rng = random.Random(20250302)
+    mismatches = []
+    for _ in range(5000):
+        x = random_dm2_input(rng)
+        want, got = decide_dm2_codes(x), rs.evaluate(x)
+        if want != got:
+            mismatches.append((x, want, got))
+    assert not mismatches, f"{len(mismatches)} mismatches, first: {mismatches[0]}"
+
+
+def test_rules_accept_plain_dict_facts():
+    rs = load_rules(DM2_RULES)
+    x = random_dm2_input(random.Random(7))
+    assert rs.evaluate(x.__dict__) == rs.evaluate(x)
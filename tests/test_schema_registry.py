@@ -0,0 +1,60 @@
+import random
+import zlib
+
+import jsonschema
+import pytest
+from jsonschema.exceptions import best_match
+
+from schema_registry import SCHEMAS, CompiledSchema, get_schema, validate_batch
+
+# one property of every type the specialized checker handles
+ALL_TYPES = {
+    "type": "object",
+    "properties": {"s": {"type": "string"}, "b": {"type": "boolean"}, "a": {"type": "array"},
+                   "o": {"type": "object"}, "n": {"type": "null"}},
+    "required": ["s", "b"],
+}
+VALUES = ["x", "", 0, 1, 2.5, True, False, None, [], [1], (), {}, {"k": 1}]
+GOOD = {"string": ["x", ""], "boolean": [True, False], "array": [[], [1]], "object": [{}, {"k": 1}], "null": [None]}
+
+
+def _payloads(schema, seed, n=3000):
+    # mostly well-typed values, so payloads get past the first check and exercise every property
+    rng = random.Random(seed)
+    props = dict(schema.get("properties", {}), extra={"type": "string"})
+    for _ in range(n):
+        if rng.random() < 0.05:
+            yield rng.choice([None, "payload", 1, [], ()])
+            continue
+        yield {k: rng.choice(GOOD[sub["type"]] if rng.random() < 0.8 else VALUES)
+               for k, sub in props.items() if rng.random() < 0.9}
+
+
+@pytest.mark.parametrize("name", sorted(SCHEMAS) + ["all_types"])
+def test_fast_path_matches_jsonschema(name):
+    schema = ALL_TYPES if name == "all_types" else SCHEMAS[name]
+    compiled = CompiledSchema(name, schema)
+    assert compiled._fast is not None, "schema should take the specialized path"
+    reference = jsonschema.validators.validator_for(schema)(schema)
+    mismatches = []
+    for p in _payloads(schema, zlib.crc32(name.encode())):
+        want_valid = reference.is_valid(p)
+        err = best_match(reference.iter_errors(p))
+        want_error = None if want_valid else (err.message if err is not None else "invalid payload")
+        if compiled.is_valid(p) != want_valid or compiled.first_error(p) != want_error:
+            mismatches.append(p)
+    assert not mismatches, f"{len(mismatches)} mismatches, first: {mismatches[0]!r}"
+
+
+def test_validate_batch_reports_failing_indexes():
+    payloads = list(_payloads(SCHEMAS["soap"], 7, 500))
+    reference = jsonschema.validators.validator_for(SCHEMAS["soap"])(SCHEMAS["soap"])
+    want = [(i, [e.message for e in reference.iter_errors(p)]) for i, p in enumerate(payloads)
+            if not reference.is_valid(p)]
+    assert want and validate_batch(payloads, "soap") == want
+
+
+def test_unknown_schema():
+    assert get_schema("nope") is None
+    with pytest.raises(KeyError):
+        validate_batch([{}], "nope")
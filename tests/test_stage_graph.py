@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+
+from logger import current_request_id, request_context
+from stage_graph import StageGraph, StageGraphError
+
+
+def test_parallel_stages_see_the_callers_request_id():
+    g = StageGraph()
+    barrier = threading.Barrier(2, timeout=5)
+
+    def rid(_):
+        barrier.wait()  # both stages are in flight at once, so both ran on the pool
+        return current_request_id()
+
+    g.register("a", rid, ["x"], ["a"])
+    g.register("b", rid, ["x"], ["b"])
+    with request_context("rid-123"):
+        values = g.run({"x": 1})
+    assert values["a"] == values["b"] == "rid-123"
+
+
+def test_memoized_result_is_not_shared_with_callers():
+    g = StageGraph()
+    calls = []
+
+    def codes(text):
+        calls.append(text)
+        return [{"code": "E11.9"}]
+
+    g.register("codes", codes, ["text"], ["codes"], memoize=True)
+    r1 = g.run({"text": "note"})
+    r1["codes"].append({"code": "X"})
+    r1["codes"][0]["code"] = "Y"
+    r2 = g.run({"text": "note"})
+    assert r2["codes"] == [{"code": "E11.9"}]
+    assert r2["codes"] is not r1["codes"]
+    assert calls == ["note"]
+
+
+def test_memo_version_is_part_of_the_key():
+    g = StageGraph()
+    version = [1]
+    g.register("v", lambda x: (x, version[0]), ["x"], ["v"], memoize=True, memo_version=lambda: version[0])
+    assert g.run({"x": "a"})["v"] == ("a", 1)
+    version[0] = 2
+    assert g.run({"x": "a"})["v"] == ("a", 2)
+
+
+def test_cycle_is_rejected():
+    g = StageGraph()
+    g.register("a", lambda b: b, ["b"], ["a"])
+    g.register("b", lambda a: a, ["a"], ["b"])
+    with pytest.raises(StageGraphError, match="unsatisfiable"):
+        g.run({})
+
+
+def test_missing_input_is_rejected():
+    g = StageGraph()
+    g.register("a", lambda x: x, ["x"], ["a"])
+    with pytest.raises(StageGraphError, match="unsatisfiable"):
+        g.run({"y": 1})
+    with pytest.raises(StageGraphError, match="nothing produces"):
+        g.run({"x": 1}, targets=["z"])
+
+
+def test_duplicate_output_is_rejected():
+    g = StageGraph()
+    g.register("a", lambda x: x, ["x"], ["out"])
+    with pytest.raises(StageGraphError, match="already produced"):
+        g.register("b", lambda x: x, ["x"], ["out"])
@@ -0,0 +1,97 @@
+"""The linear-time rewrites (text_scan.py and the patterns in lite_pipeline)
+must give the same output as the regexes they replaced. Each test swaps the
+old patterns back into the module and compares whole functions on a seeded
+sample of notes built from the fragments those patterns care about."""
+import random
+import re
+import zlib
+
+import pytest
+
+import lite_pipeline
+import polish_notes
+import run_chart
+import text_scan
+
+FRAGMENTS = [
+    "```", "``", "<user>", "<system role=x>", "<assistant", ">", "</user>", "</system>", "</assistant>",
+    " ", "  ", "   ", "\t", "\n", "\n\n", "\n\n\n", "\r\n", " ", "\f",
+    ",", ";", ":", ".", "!", "?", "-", "#", "## ", "•",
+    "plan", "Plan", "subjective", "objective", "assessment", "follow-up", "followup", "soap",
+    "s:", "p:", "assessment & plan", "prompt", "system", "user", "As an AI", "teh", "BP 142/82", "A1c 8.1%",
+]
+
+
+def _notes(seed, count=3000, max_len=40):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, max_len)))
+
+
+class _Sub:
+    """re.sub with the old pattern, in the shape of the compiled pattern it replaced."""
+
+    def __init__(self, pattern, flags=0):
+        self.pattern, self.flags = pattern, flags
+
+    def sub(self, repl, s):
+        return re.sub(self.pattern, repl, s, flags=self.flags)
+
+
+LEGACY_TEXT_SCAN = {
+    "strip_fenced_blocks": lambda s: re.sub(r"(?s)```.*?```", "", s),
+    "strip_role_blocks": lambda s: re.sub(r"(?s)<(?:system|user|assistant).*?>.*?</(?:system|user|assistant)>", "", s),
+    "ROLE_HEADER": _Sub(r"(?i)^\s*#+\s*(prompt|system|assistant|user)\s*$", re.M),
+    "TRAILING_WS": _Sub(r"[ \t]+\n"),
+    "SPACE_BEFORE_PUNCT": _Sub(r" +([,:;])"),
+    # polish_note's header pattern; run_chart's copy was an rf-string that never matched
+    # (fixed on purpose), so both are compared against the working one
+    "header_line": lambda h: re.compile(fr"(?im)^(?:#{{0,2}}\s*){re.escape(h)}\s*[:\-]?\s*$"),
+}
+
+
+def _apply(name, impl, s):
+    # patterns substitute "[match]" so any difference in match spans shows up
+    if name == "header_line":
+        return impl("plan").sub(lambda m: f"[{m.group(0)}]", s)
+    if name.isupper():
+        return impl.sub(r"[\g<0>]", s)
+    return impl(s)
+
+
+@pytest.mark.parametrize("name", sorted(LEGACY_TEXT_SCAN))
+def test_text_scan_matches_legacy_pattern(name):
+    new, old = getattr(text_scan, name), LEGACY_TEXT_SCAN[name]
+    mismatches = [s for s in _notes(zlib.crc32(name.encode()))
+                  if _apply(name, new, s) != _apply(name, old, s)]
+    assert not mismatches, f"{len(mismatches)} mismatches, first: {mismatches[0]!r}"
+
+
+@pytest.mark.parametrize("module, fn", [(polish_notes, "polish_note"), (run_chart, "polish")])
+def test_polish_matches_legacy_patterns(monkeypatch, module, fn):
+    notes = list(_notes(20250303))
+    new = [getattr(module, fn)(s) for s in notes]
+    for name, legacy in LEGACY_TEXT_SCAN.items():
+        monkeypatch.setattr(module, name, legacy)
+    old = [getattr(module, fn)(s) for s in notes]
+    mismatches = [(s, a, b) for s, a, b in zip(notes, new, old) if a != b]
+    assert not mismatches, f"{len(mismatches)} mismatches, first: {mismatches[0]!r}"
+
+
+LEGACY_LITE = {
+    "_PUNCT_SPACE": re.compile(r"\s+([,.;:!?])"),
+    "_SECTION_HEADING": re.compile(r"(?im)^(#{0,2}\s*(subjective|objective|assessment|plan|follow-?up))\s*[:\-]?\s*$"),
+    "_ENRICH_SECTIONS": tuple((h, re.compile(fr"(?im)^\s*{re.escape(h)}\s*[:\-]?\s*$"))
+                              for h in ("subjective", "objective", "assessment", "plan", "soap")),
+}
+
+
+def test_lite_pipeline_matches_legacy_patterns(monkeypatch):
+    fns = [lite_pipeline.minimal_language_polish, lite_pipeline.arrange_flow_sections, lite_pipeline.enrich]
+    notes = list(_notes(20250304))
+    new = [[f(s) for f in fns] for s in notes]
+    for name, legacy in LEGACY_LITE.items():
+        monkeypatch.setattr(lite_pipeline, name, legacy)
+    old = [[f(s) for f in fns] for s in notes]
+    mismatches = [(s, a, b) for s, a, b in zip(notes, new, old) if a != b]
+    assert not mismatches, f"{len(mismatches)} mismatches, first: {mismatches[0]!r}"
@@ -0,0 +1,88 @@
+import threading
+import time
+
+import pytest
+
+from ttl_cache import TTLCache
+
+
+def _slow(value, started, release):
+    def load():
+        started.set()
+        assert release.wait(5)
+        return value
+    return load
+
+
+def test_concurrent_loads_share_one_call():
+    cache = TTLCache(ttl=60)
+    calls, release = [], threading.Event()
+
+    def load():
+        calls.append(1)
+        assert release.wait(5)
+        return "v"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load("k", load))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    while cache.stats()["misses"] + cache.stats()["coalesced"] < 8:
+        time.sleep(0.001)
+    release.set()
+    for t in threads:
+        t.join()
+    assert results == ["v"] * 8
+    assert len(calls) == 1
+    assert cache.stats()["coalesced"] == 7
+
+
+def test_loader_error_reaches_caller_and_is_not_cached():
+    cache = TTLCache(ttl=60)
+
+    def boom():
+        raise RuntimeError("db down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_load("k", boom)
+    assert cache.get_or_load("k", lambda: "ok") == "ok"
+
+
+@pytest.mark.parametrize("reset", [lambda c: c.invalidate("k"), lambda c: c.clear(), lambda c: c.set("k", "NEW")])
+def test_reset_during_load_drops_the_loaded_value(reset):
+    cache = TTLCache(ttl=60)
+    started, release = threading.Event(), threading.Event()
+    got = []
+    t = threading.Thread(target=lambda: got.append(cache.get_or_load("k", _slow("OLD", started, release))))
+    t.start()
+    assert started.wait(5)
+    reset(cache)
+    # a caller arriving after the reset does not join the stale load
+    assert cache.get_or_load("k", lambda: "FRESH") in ("FRESH", "NEW")
+    release.set()
+    t.join()
+    assert got == ["OLD"]
+    assert cache.get("k") in ("FRESH", "NEW")
+
+
+def test_lru_eviction():
+    cache = TTLCache(ttl=60, maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # b is now least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_expiry():
+    cache = TTLCache(ttl=0.05)
+    cache.set("k", "v")
+    assert cache.get("k") == "v"
+    time.sleep(0.1)
+    assert cache.get("k") is None
+    assert cache.stats()["expirations"] == 1
+    cache.set("k", "v", ttl=60)
+    time.sleep(0.1)
+    assert cache.get("k") == "v"
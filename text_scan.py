@@ -0,0 +1,79 @@
+r"""
+Linear-time scanners for note text.
+
+Pasted transcripts are untrusted input. Lazy regexes such as
+(?s)<(?:system|user|assistant).*?>.*?</...> rescan to the end of the text from
+every opener when no closer follows, so a paste with many "<user" fragments and
+no closing tag costs O(n^2). The scanners here find each delimiter once with
+str.find / a literal-alternation search and stop as soon as no further match is
+possible; they remove exactly what the old patterns removed.
+
+The compiled patterns below are the whitespace/header rules from polish_note,
+rewritten so that a failed attempt cannot be retried from inside the same run:
+  (?<![ \t])[ \t]+\n     vs  [ \t]+\n        only starts at the beginning of a run
+  \s*(?:[:\-]\s*)?$       vs  \s*[:\-]?\s*$   no two adjacent \s* splitting one run
+  ^[ \t]*#+               vs  ^\s*#+          no rescanning blank-line runs from every line
+
+USAGE:
+  from text_scan import strip_fenced_blocks, strip_role_blocks
+  s = strip_role_blocks(strip_fenced_blocks(s))
+
+  python regex_bench.py          # worst-case timings, fails if cost per char grows
+"""
+from __future__ import annotations
+import re
+
+FENCE = "```"
+_ROLE_OPEN = re.compile(r"<(?:system|user|assistant)")
+_ROLE_CLOSE = re.compile(r"</(?:system|user|assistant)>")
+
+TRAILING_WS = re.compile(r"(?<![ \t])[ \t]+\n")
+SPACE_BEFORE_PUNCT = re.compile(r"(?<! ) +([,:;])")
+ROLE_HEADER = re.compile(r"(?im)^[ \t]*#+\s*(prompt|system|assistant|user)\s*$")
+
+
+def header_line(hint: str) -> "re.Pattern[str]":
+    """'plan' -> pattern for a line holding only that header (optional '#'/'##', ':' or '-')."""
+    return re.compile(fr"(?im)^(?:#{{0,2}}\s*){re.escape(hint)}\s*(?:[:\-]\s*)?$")
+
+
+def strip_fenced_blocks(s: str) -> str:
+    """Remove ```...``` blocks (same result as re.sub(r"(?s)```.*?```", "", s))."""
+    start = s.find(FENCE)
+    if start < 0:
+        return s
+    out, pos = [], 0
+    while start >= 0:
+        end = s.find(FENCE, start + 3)
+        if end < 0:
+            break  # unclosed fence: the rest of the text stays as is
+        out.append(s[pos:start])
+        pos = end + 3
+        start = s.find(FENCE, pos)
+    out.append(s[pos:])
+    return "".join(out)
+
+
+def strip_role_blocks(s: str) -> str:
+    """Remove <system ...>...</user>-style scaffolds, matching the old lazy regex.
+
+    A block runs from an opener through the first '>' after it, then to the
+    first closing tag after that '>'. If an opener has no '>' or no closer
+    after it, no later opener can have one either, so the scan stops there.
+    """
+    m = _ROLE_OPEN.search(s)
+    if m is None:
+        return s
+    out, pos = [], 0
+    while m is not None:
+        gt = s.find(">", m.end())
+        if gt < 0:
+            break
+        close = _ROLE_CLOSE.search(s, gt + 1)
+        if close is None:
+            break
+        out.append(s[pos:m.start()])
+        pos = close.end()
+        m = _ROLE_OPEN.search(s, pos)
+    out.append(s[pos:])
+    return "".join(out)
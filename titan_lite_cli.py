@@ -4,6 +4,8 @@ import argparse, json, sys
 from pathlib import Path
 
 from lite_pipeline import process_note, write_csv_outputs
+from metrics import start_from_env
+from note_dedup import NoteIndex, THRESHOLD, signature
 
 
 def main():
@@ -12,7 +14,9 @@ def main():
     ap.add_argument('--out', dest='out_path', help='Output JSON path (default: print to stdout)')
     ap.add_argument('--id', dest='visit_id', help='Visit/Note identifier (default: input filename stem or "stdin")')
     ap.add_argument('--no-json', action='store_true', help='Do not emit JSON (still writes CSV sheets)')
+    ap.add_argument('--dedup-index', help='Near-duplicate note index (SQLite); flags copy-forward and adds this note')
     ns = ap.parse_args()
+    start_from_env()
 
     if ns.in_path:
         text = Path(ns.in_path).read_text(encoding='utf-8', errors='replace')
@@ -29,6 +33,16 @@ def main():
     else:
         visit_id = 'stdin'
 
+    # Copy-forward check against earlier notes, then index this one
+    if ns.dedup_index:
+        index = NoteIndex(ns.dedup_index)
+        sig = signature(text)
+        result['near_duplicates'] = [
+            {'note_id': note_id, 'similarity': round(sim, 3)}
+            for note_id, sim, _ in index.similar(sig=sig, k=3, threshold=THRESHOLD, exclude=[visit_id])
+        ]
+        index.add(visit_id, sig=sig)
+
     # Always write structured CSV sheets in Output/
     write_csv_outputs(result, visit_id)
 
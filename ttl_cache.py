@@ -0,0 +1,168 @@
+"""
+Small thread-safe TTL + LRU cache for agent results.
+
+  cache = TTLCache(ttl=60, maxsize=10_000)
+  hit = cache.get(key)          # None on miss/expiry
+  cache.set(key, value)
+  cache.invalidate(key)         # or cache.clear()
+
+  # single-flight: concurrent callers for the same key share one loader call
+  rows = cache.get_or_load(key, lambda: run_query(...))
+  cache.stats()                 # hits, misses, coalesced, evictions, hit_rate, ...
+
+Entries leave the cache when they expire or, once maxsize is reached, least
+recently used first. get_or_load() does not cache None (a failed or empty
+lookup is retried on the next call); loader exceptions propagate to every
+caller waiting on that key. A load that is still running when its key is
+invalidated, set or cleared still answers the callers already waiting on it,
+but its result is not stored; the next caller starts a fresh load.
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+import threading
+import time
+
+
+class _Flight:
+    __slots__ = ("done", "value", "error", "stale")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+        self.stale = False  # key changed while loading: do not store the result
+
+
+class TTLCache:
+    def __init__(self, ttl: float, maxsize: int = 10_000):
+        self.ttl = float(ttl)
+        self.maxsize = int(maxsize)
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self._hits = self._misses = self._coalesced = 0
+        self._loads = self._evictions = self._expirations = 0
+
+    def _lookup(self, key: Hashable) -> Tuple[bool, Any]:
+        # caller holds the lock
+        item = self._data.get(key)
+        if item is None:
+            return False, None
+        expires, value = item
+        if expires < time.monotonic():
+            del self._data[key]
+            self._expirations += 1
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self._hits += 1
+                return value
+            self._misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if self.ttl <= 0 and ttl is None:
+            return
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._detach(key)
+            self._store(key, value, expires)
+
+    def _detach(self, key: Hashable) -> None:
+        # caller holds the lock; a load already running for key must not store its result
+        flight = self._flights.pop(key, None)
+        if flight is not None:
+            flight.stale = True
+
+    def _store(self, key: Hashable, value: Any, expires: float) -> None:
+        # caller holds the lock
+        self._data[key] = (expires, value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._evict()
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """Cached value for key, else loader() -- called once for all concurrent callers of key."""
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self._hits += 1
+                return value
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._coalesced += 1
+                leader = False
+            else:
+                self._misses += 1
+                flight = self._flights[key] = _Flight()
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._loads += 1
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                if (flight.error is None and flight.value is not None and not flight.stale
+                        and (self.ttl > 0 or ttl is not None)):
+                    self._store(key, flight.value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            flight.done.set()
+        return flight.value
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+            self._detach(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            for flight in self._flights.values():
+                flight.stale = True
+            self._flights.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses + self._coalesced
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "coalesced": self._coalesced,
+                "loads": self._loads,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                # coalesced callers did not hit the backend, so they count as hits here
+                "hit_rate": round((self._hits + self._coalesced) / lookups, 4) if lookups else 0.0,
+            }
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _evict(self) -> None:
+        # drop expired entries first, then the least recently used
+        now = time.monotonic()
+        for k in [k for k, (exp, _) in self._data.items() if exp < now]:
+            del self._data[k]
+            self._expirations += 1
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self._evictions += 1
@@ -1,33 +1,14 @@
-import jsonschema
 import logging
-
-SCHEMAS = {
-    "lab_summary": {
-        "type": "object",
-        "properties": {
-            "patient_id": {"type": "string"}
-        },
-        "required": ["patient_id"]
-    },
-    "icd_lookup": {
-        "type": "object",
-        "properties": {
-            "query": {"type": "string"}
-        },
-        "required": ["query"]
-    }
-}
+from schema_registry import get_schema
 
 def validate_payload(payload, schema_name):
-    schema = SCHEMAS.get(schema_name)
-    if not schema:
+    compiled = get_schema(schema_name)
+    if compiled is None:
         logging.warning(f"⚠️ No schema found for: {schema_name}")
         return False
-    try:
-        jsonschema.validate(instance=payload, schema=schema)
+    error = compiled.first_error(payload)
+    if error is None:
         logging.info("✅ Payload validated")
         return True
-    except jsonschema.exceptions.ValidationError as e:
-        logging.error(f"❌ Validation failed: {e.message}")
-        return False
-        
+    logging.error(f"❌ Validation failed: {error}")
+    return False
@@ -1,6 +1,7 @@
 ﻿import os, psycopg2
+from db_profile import profiled_cursor
 dsn = os.environ["DATABASE_URL"]
-with psycopg2.connect(dsn) as c, c.cursor() as cur:
+with psycopg2.connect(dsn) as c, c.cursor(cursor_factory=profiled_cursor()) as cur:
     for t in ("allergies","medications","labs","procedures","cardio_tests"):
         cur.execute(f"SELECT count(*) FROM titan.{t}")
         print(t, cur.fetchone()[0])